@@ -2,25 +2,64 @@
 
 import sys
 import os
-import traceback
+from contextlib import asynccontextmanager
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from fastapi import FastAPI, BackgroundTasks, Query, Request
-from fastapi.responses import PlainTextResponse, JSONResponse
-
-from lib.services.whatsapp import WhatsAppService
-from lib.schemas.whatsapp import WhatsAppWebhookPayload
-from lib.agent.core import process_message, send_response
-
-
-def log(message: str):
-    """Print log with prefix for easy identification"""
-    print(f"[WEBHOOK] {message}")
-
-
-app = FastAPI(title="Panacea WhatsApp Agent")
+from fastapi.responses import PlainTextResponse, JSONResponse, Response
+
+from lib.services.whatsapp import get_whatsapp_service, close_http_client
+from lib.db.connection import close_pool, pool_stats
+from lib.schemas.whatsapp import has_messages, parse_webhook_messages
+from lib.agent.core import handle_turn
+from lib.agent.cache import conversation_cache
+from lib.agent.streaming import stream_stats
+from lib.agent.coalescer import message_coalescer
+from lib.agent.locks import customer_locks
+from lib.agent.worker import enqueue_messages
+from lib.agent.dedup import message_deduplicator
+from lib.agent.intents import intent_router
+from lib.agent.summarizer import conversation_summarizer
+from lib.agent.history import history_stats
+from lib.services.claude import usage_stats
+from lib.services.model_tiers import model_router
+from lib.services.outbound import outbound_scheduler
+from lib.db.queries import JobQueries
+from lib.config import JOB_QUEUE, DEDUP_DB
+from lib.logger import get_logger
+from lib.metrics import CONTENT_TYPE, registry, span, export_stats, queue_depth, webhook_requests
+
+logger = get_logger("webhook")
+
+export_stats("agent_conversation_cache", conversation_cache.stats)
+export_stats("agent_claude_usage", usage_stats.stats)
+export_stats("agent_model_tiers", model_router.stats)
+export_stats("agent_streaming", stream_stats.stats)
+export_stats("agent_coalescing", message_coalescer.stats)
+export_stats("agent_customer_locks", customer_locks.stats)
+export_stats("agent_deduplication", message_deduplicator.stats)
+export_stats("agent_outbound", outbound_scheduler.stats)
+export_stats("agent_intent_router", intent_router.stats)
+export_stats("agent_summarization", conversation_summarizer.stats)
+export_stats("agent_history", history_stats.stats)
+export_stats("agent_db_pool", pool_stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Release process-wide connection pools on shutdown."""
+    yield
+    logger.info("Shutting down: closing HTTP client and DB pool")
+    await conversation_summarizer.drain()
+    await close_http_client()
+    await close_pool()
+
+
+app = FastAPI(title="Panacea WhatsApp Agent", lifespan=lifespan)
+
+OK_BODY = b'{"status":"ok"}'
 
 
 # ---------------------------------------------------------------------------
@@ -28,7 +67,38 @@ app = FastAPI(title="Panacea WhatsApp Agent")
 # ---------------------------------------------------------------------------
 @app.get("/api/health")
 async def health():
-    return {"status": "healthy", "service": "whatsapp-agent"}
+    return {
+        "status": "healthy",
+        "service": "whatsapp-agent",
+        "conversation_cache": conversation_cache.stats(),
+        "claude_usage": usage_stats.stats(),
+        "model_tiers": model_router.stats(),
+        "streaming": stream_stats.stats(),
+        "coalescing": message_coalescer.stats(),
+        "customer_locks": customer_locks.stats(),
+        "deduplication": message_deduplicator.stats(),
+        "outbound": outbound_scheduler.stats(),
+        "intent_router": intent_router.stats(),
+        "summarization": conversation_summarizer.stats(),
+        "history": history_stats.stats(),
+        "db_pool": pool_stats(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Prometheus metrics
+# ---------------------------------------------------------------------------
+@app.get("/api/metrics")
+async def metrics():
+    queue_depth.set(message_coalescer.stats()["pending"], queue="coalescer")
+    if JOB_QUEUE:
+        try:
+            counts = await JobQueries.counts()
+            queue_depth.set(counts.get("pending", 0), queue="jobs")
+            queue_depth.set(counts.get("dead", 0), queue="jobs_dead")
+        except Exception as e:
+            logger.warning("Could not read job queue depth: %s: %s", type(e).__name__, e)
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
 
 
 # ---------------------------------------------------------------------------
@@ -40,81 +110,128 @@ async def verify_webhook(
     hub_verify_token: str = Query(None, alias="hub.verify_token"),
     hub_challenge: str = Query(None, alias="hub.challenge"),
 ):
-    log("=== GET Request received ===")
-    log(f"Mode: {hub_mode}, Token: {hub_verify_token[:10] if hub_verify_token else 'None'}... Challenge: {hub_challenge}")
+    logger.info("Verification request: mode=%s", hub_mode)
 
-    whatsapp = WhatsAppService()
+    whatsapp = get_whatsapp_service()
     result = whatsapp.verify_webhook(hub_mode, hub_verify_token, hub_challenge)
 
     if result:
-        log("Verification SUCCESS")
+        logger.info("Verification SUCCESS")
         return PlainTextResponse(content=result)
 
-    log("Verification FAILED")
+    logger.warning("Verification FAILED")
     return PlainTextResponse(content="Forbidden", status_code=403)
 
 
 # ---------------------------------------------------------------------------
 # Incoming messages (POST)
 # ---------------------------------------------------------------------------
-async def handle_incoming_message(phone_number: str, message_text: str, message_id: str):
-    """Background task: process message and send response."""
+async def handle_incoming_message(phone_number: str, batch):
+    """Background task: wait for the customer's burst to end, then answer it in one turn."""
+    try:
+        await message_coalescer.run(phone_number, batch, run_agent_turn)
+    except Exception:
+        logger.exception("EXCEPTION in background task")
+
+
+async def run_agent_turn(phone_number: str, message_text: str, message_id: str, reply_id: str = None):
+    """Process a (possibly combined) message, or a list/button tap, and send the response."""
     try:
-        response_text = await process_message(
-            phone_number=phone_number,
-            message_text=message_text,
-            message_id=message_id,
-        )
-        log(f"Response generated: {response_text[:100]}...")
-
-        await send_response(phone_number, response_text)
-        log("Response sent successfully")
+        await handle_turn(phone_number, message_text, message_id, reply_id=reply_id)
+    except Exception:
+        logger.exception("EXCEPTION in background task")
+
+
+async def enqueue_incoming(messages) -> JSONResponse:
+    """Durable intake: one INSERT (which also claims the message IDs); api/worker.py answers them."""
+    jobs = [
+        {"phone_number": msg.from_number, "message_text": msg.text or "", "message_id": msg.message_id,
+         **({"reply_id": msg.reply_id} if msg.reply_id else {})}
+        for msg in messages
+    ]
+    try:
+        queued = await enqueue_messages(jobs)
     except Exception as e:
-        log(f"EXCEPTION in background task: {type(e).__name__}: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        # Not stored: let Meta redeliver the webhook
+        message_deduplicator.forget([msg.message_id for msg in messages])
+        logger.error("Enqueue FAILED: %s: %s", type(e).__name__, e)
+        webhook_requests.inc(result="enqueue_failed")
+        return JSONResponse(content={"status": "error", "message": "enqueue failed"}, status_code=503)
+    if DEDUP_DB:
+        message_deduplicator.record_db_suppressed(len(jobs) - queued)
+        await message_deduplicator.prune_if_due()
+    logger.info("Queued %d job(s)", queued)
+    return JSONResponse(content={"status": "ok"})
+
+
+async def drop_duplicates(messages):
+    """Keep only messages whose ID was not received before (in this process, then in the DB)."""
+    fresh_ids = message_deduplicator.filter_seen([msg.message_id for msg in messages])
+    if len(fresh_ids) < len(messages):
+        logger.info("Dropped %d duplicate message(s) seen recently", len(messages) - len(fresh_ids))
+    if not JOB_QUEUE:
+        # With the job queue the claim is part of the INSERT
+        fresh_ids = await message_deduplicator.claim(fresh_ids)
+    fresh = []
+    for msg in messages:
+        if msg.message_id in fresh_ids:
+            fresh.append(msg)
+            fresh_ids.remove(msg.message_id)
+    return fresh
 
 
 @app.post("/api/webhook")
 async def receive_webhook(request: Request, background_tasks: BackgroundTasks):
-    log("=== POST Request received ===")
+    # Raw bytes are read once: signed, pre-checked and parsed from the same buffer
+    body = await request.body()
+
+    whatsapp = get_whatsapp_service()
+    if whatsapp.app_secret and not whatsapp.verify_signature(body, request.headers.get("x-hub-signature-256", "")):
+        logger.warning("Signature verification FAILED")
+        webhook_requests.inc(result="forbidden")
+        return JSONResponse(content={"status": "forbidden"}, status_code=403)
 
+    if not has_messages(body):
+        webhook_requests.inc(result="status")
+        return Response(content=OK_BODY, media_type="application/json")
+
+    webhook_requests.inc(result="messages")
     try:
-        body = await request.body()
-        data = await request.json()
-        log(f"Body length: {len(body)}")
-        log(f"Parsed JSON keys: {list(data.keys())}")
-
-        value = data["entry"][0]["changes"][0]["value"]
-        if "messages" in value:
-            log("Incoming USER message detected")
-        if "statuses" in value:
-            log("Status update received")
-
-        payload = WhatsAppWebhookPayload(**data)
-        log("Payload parsed successfully")
-
-        messages = payload.get_messages()
-        log(f"Messages found: {len(messages)}")
-
-        for i, msg in enumerate(messages):
-            log(f"Message {i+1}: type={msg.type}, from={msg.from_number}, text={msg.text[:50] if msg.text else 'None'}...")
-
-            if msg.text and msg.type == "text":
-                log(f"Dispatching background task for {msg.from_number}")
-                background_tasks.add_task(
-                    handle_incoming_message,
-                    phone_number=msg.from_number,
-                    message_text=msg.text,
-                    message_id=msg.message_id,
-                )
+        with span("webhook_parse"):
+            messages = parse_webhook_messages(body)
+
+        incoming = []
+        for msg in messages:
+            logger.debug("Message: type=%s, from=%s, text=%.50s", msg.type, msg.from_number, msg.text)
+            if (msg.text and msg.type == "text") or (msg.reply_id and msg.type == "interactive"):
+                incoming.append(msg)
             else:
-                log(f"Skipping message: type={msg.type}, has_text={bool(msg.text)}")
-
-        return JSONResponse(content={"status": "ok"})
+                logger.info("Skipping message: type=%s, has_text=%s", msg.type, bool(msg.text))
+
+        incoming = await drop_duplicates(incoming) if incoming else []
+        if JOB_QUEUE:
+            return await enqueue_incoming(incoming)
+
+        for msg in incoming:
+            if msg.reply_id:
+                # A tapped list row / button is a complete request on its own: no burst to wait for
+                background_tasks.add_task(run_agent_turn, msg.from_number, msg.text or "", msg.message_id, msg.reply_id)
+                continue
+            batch = message_coalescer.add(msg.from_number, msg.text, msg.message_id)
+            if batch is None:
+                logger.debug("Merged into pending turn for %s", msg.from_number)
+                continue
+            background_tasks.add_task(
+                handle_incoming_message,
+                phone_number=msg.from_number,
+                batch=batch,
+            )
+
+        return Response(content=OK_BODY, media_type="application/json")
 
     except Exception as e:
-        log(f"EXCEPTION: {type(e).__name__}: {e}")
-        log(f"Traceback: {traceback.format_exc()}")
+        logger.exception("EXCEPTION while handling webhook")
+        webhook_requests.inc(result="error")
         # Still return 200 to prevent Meta from retrying
         return JSONResponse(content={"status": "error", "message": str(e)})
 
@@ -0,0 +1,52 @@
+"""Standalone worker for the durable job queue (JOB_QUEUE=true).
+
+Runs next to the webhook app, which only inserts jobs:
+
+    python api/worker.py            # process jobs until SIGTERM/SIGINT
+    python api/worker.py --once     # drain the queue and exit (cron)
+    python api/worker.py --requeue-dead
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.agent.worker import JobWorker, INCOMING_MESSAGE
+from lib.agent.summarizer import conversation_summarizer
+from lib.db.queries import JobQueries
+from lib.db.connection import close_pool
+from lib.services.whatsapp import close_http_client
+from lib.logger import get_logger
+
+logger = get_logger("worker")
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        if args.requeue_dead:
+            requeued = await JobQueries.requeue_dead(INCOMING_MESSAGE)
+            logger.info("Requeued %d dead-lettered job(s)", requeued)
+            return
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+
+        await JobWorker().run(stop, once=args.once)
+    finally:
+        await conversation_summarizer.drain()
+        await close_http_client()
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty")
+    parser.add_argument("--requeue-dead", action="store_true", help="retry dead-lettered jobs and exit")
+    asyncio.run(main(parser.parse_args()))
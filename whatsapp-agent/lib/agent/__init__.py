@@ -1,4 +1,17 @@
-from .core import process_message, send_response
-from .tools import TOOLS
+from importlib import import_module
 
-__all__ = ["process_message", "send_response", "TOOLS"]
+# Resolved on first attribute access (PEP 562) so importing a light submodule
+# such as lib.agent.cache doesn't pull in the whole agent stack.
+_EXPORTS = {
+    "process_message": ".core",
+    "send_response": ".core",
+    "TOOLS": ".tools",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name], __name__), name)
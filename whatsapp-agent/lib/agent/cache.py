@@ -0,0 +1,192 @@
+"""In-process LRU + TTL cache of active conversations"""
+
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+from uuid import UUID
+from lib.config import (
+    CONVERSATION_CACHE_MAX_ENTRIES,
+    CONVERSATION_CACHE_MAX_BYTES,
+    CONVERSATION_CACHE_TTL,
+)
+
+# Rough per-message overhead (dict + two str objects) used for the memory cap
+_MESSAGE_OVERHEAD_BYTES = 200
+_ENTRY_OVERHEAD_BYTES = 1024
+
+
+class _Entry:
+    """Cached conversation row plus its most recent `window` messages"""
+
+    __slots__ = ("conversation", "messages", "window", "expires_at", "size")
+
+    def __init__(self, conversation: Dict[str, Any], messages: List[Dict[str, str]], window: int, expires_at: float):
+        self.conversation = conversation
+        self.messages = messages
+        self.window = window
+        self.expires_at = expires_at
+        self.size = _estimate_size(conversation, messages)
+
+
+def _estimate_size(conversation: Dict[str, Any], messages: List[Dict[str, str]]) -> int:
+    """Approximate resident size of an entry in bytes"""
+    size = _ENTRY_OVERHEAD_BYTES + len(conversation.get("summary") or "")
+    for msg in messages:
+        size += _MESSAGE_OVERHEAD_BYTES + len(msg.get("content", ""))
+    return size
+
+
+class ConversationCache:
+    """
+    Bounded LRU cache of conversations keyed by customer UUID.
+
+    Entries expire after `ttl` seconds so other instances' writes become visible,
+    and are evicted least-recently-used first when either the entry count or the
+    estimated byte size exceeds its cap.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[UUID, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def _lookup(self, customer_id: UUID) -> Optional[_Entry]:
+        entry = self._entries.get(customer_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(customer_id)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(customer_id)
+        return entry
+
+    def get(self, customer_id: UUID, limit: int) -> Optional[Dict[str, Any]]:
+        """
+        Return {"conversation", "messages"} with the last `limit` messages, or None
+        on a miss (absent, expired, or cached window smaller than `limit`).
+        """
+        entry = self._lookup(customer_id)
+        if entry is None or limit > entry.window:
+            self.misses += 1
+            return None
+        self.hits += 1
+        messages = entry.messages[-limit:] if limit > 0 else []
+        return {"conversation": dict(entry.conversation), "messages": list(messages)}
+
+    def get_conversation(self, customer_id: UUID) -> Optional[Dict[str, Any]]:
+        """Return the cached conversation row, or None on a miss"""
+        entry = self._lookup(customer_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(entry.conversation)
+
+    def set(self, customer_id: UUID, conversation: Dict[str, Any], messages: List[Dict[str, str]], window: int) -> None:
+        """Store a conversation freshly loaded from the database"""
+        if not self.enabled:
+            return
+        self._remove(customer_id)
+        entry = _Entry(dict(conversation), list(messages[-window:]) if window > 0 else [], window, time.monotonic() + self.ttl)
+        self._entries[customer_id] = entry
+        self._bytes += entry.size
+        self._evict()
+
+    def append_messages(self, customer_id: UUID, messages: List[Dict[str, str]]) -> None:
+        """Write-through: apply messages that were just persisted to the database"""
+        entry = self._entries.get(customer_id)
+        if entry is None:
+            return
+        entry.messages.extend(messages)
+        if len(entry.messages) > entry.window:
+            del entry.messages[:len(entry.messages) - entry.window]
+        self._resize(entry)
+        entry.expires_at = time.monotonic() + self.ttl
+        self._entries.move_to_end(customer_id)
+        self._evict()
+
+    def update_conversation(self, customer_id: UUID, **fields: Any) -> None:
+        """Write-through: apply column updates that were just persisted"""
+        entry = self._entries.get(customer_id)
+        if entry is None:
+            return
+        entry.conversation.update(fields)
+        self._resize(entry)
+        self._evict()
+
+    def fold(self, customer_id: UUID, folded: int, **fields: Any) -> None:
+        """
+        Write-through for a stored summary that covers the oldest `folded`
+        unsummarized messages: they are dropped from the cached window, as the
+        database no longer returns them with the turn context.
+        """
+        entry = self._entries.get(customer_id)
+        if entry is None:
+            return
+        remaining = max(entry.conversation.get("unsummarized", 0) - folded, 0)
+        if len(entry.messages) > remaining:
+            del entry.messages[:len(entry.messages) - remaining]
+        entry.conversation.update(fields, unsummarized=remaining)
+        self._resize(entry)
+        self._evict()
+
+    def invalidate(self, customer_id: UUID) -> None:
+        """Drop a customer's entry (e.g. after a failed or out-of-band write)"""
+        if self._remove(customer_id):
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _resize(self, entry: _Entry) -> None:
+        self._bytes -= entry.size
+        entry.size = _estimate_size(entry.conversation, entry.messages)
+        self._bytes += entry.size
+
+    def _remove(self, customer_id: UUID) -> bool:
+        entry = self._entries.pop(customer_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry.size
+        return True
+
+    def _evict(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+conversation_cache = ConversationCache(
+    max_entries=CONVERSATION_CACHE_MAX_ENTRIES,
+    max_bytes=CONVERSATION_CACHE_MAX_BYTES,
+    ttl=CONVERSATION_CACHE_TTL,
+)
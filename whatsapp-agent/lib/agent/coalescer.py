@@ -0,0 +1,120 @@
+"""Per-customer debounce window that merges bursts of short messages into one turn"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from lib.config import COALESCE_WINDOW, COALESCE_MAX_WAIT, COALESCE_MAX_MESSAGES
+from lib.logger import get_logger
+
+
+logger = get_logger("coalesce")
+
+
+TurnHandler = Callable[[str, str, str], Awaitable[Any]]
+
+
+class _Batch:
+    """Messages from one customer waiting for the window to close"""
+
+    __slots__ = ("texts", "message_ids", "started_at", "deadline", "full")
+
+    def __init__(self, text: str, message_id: str, now: float, window: float):
+        self.texts: List[str] = [text]
+        self.message_ids: List[str] = [message_id]
+        self.started_at = now
+        self.deadline = now + window
+        self.full = asyncio.Event()
+
+
+class MessageCoalescer:
+    """
+    Collects messages per key (the sender's phone number) and runs a single
+    turn on their combined text once no new message arrived for `window`
+    seconds, `max_wait` seconds after the first one, or after `max_messages`.
+
+    Messages are added synchronously from the webhook handler; the first
+    message of a burst opens the batch and its background task (`run`) waits
+    out the window and runs the handler, so later messages only join it.
+    Bursts are merged within one process; a message routed to another instance
+    simply starts its own batch there.
+    """
+
+    def __init__(self, window: float, max_wait: float, max_messages: int):
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self.max_messages = max_messages
+        self._pending: Dict[str, _Batch] = {}
+        self.messages = 0
+        self.turns = 0
+        self.largest_batch = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_messages > 1
+
+    def add(self, key: str, text: str, message_id: str) -> Optional[_Batch]:
+        """
+        Add a message for `key` without waiting. Returns a new batch that the
+        caller must hand to `run`, or None if the message joined a batch that
+        is already pending (its owner will answer it).
+        """
+        self.messages += 1
+        now = time.monotonic()
+        batch = self._pending.get(key)
+        if batch is not None:
+            batch.texts.append(text)
+            batch.message_ids.append(message_id)
+            batch.deadline = now + self.window
+            if len(batch.texts) >= self.max_messages:
+                batch.full.set()
+            logger.info("Joined pending batch for %s (%d messages)", key, len(batch.texts))
+            return None
+
+        batch = _Batch(text, message_id, now, self.window)
+        if not self.enabled:
+            batch.full.set()
+            return batch
+        self._pending[key] = batch
+        return batch
+
+    async def run(self, key: str, batch: _Batch, handler: TurnHandler) -> None:
+        """Wait for the batch's window to close, then run handler(key, combined_text, last_message_id)"""
+        try:
+            await self._wait(batch)
+        finally:
+            if self._pending.get(key) is batch:
+                del self._pending[key]
+
+        self.turns += 1
+        self.largest_batch = max(self.largest_batch, len(batch.texts))
+        if len(batch.texts) > 1:
+            logger.info("Running one turn for %d messages from %s", len(batch.texts), key)
+        await handler(key, "\n".join(batch.texts), batch.message_ids[-1])
+
+    async def _wait(self, batch: _Batch) -> None:
+        """Sleep until the batch's window closes (each new message extends it)"""
+        while not batch.full.is_set():
+            delay = min(batch.deadline, batch.started_at + self.max_wait) - time.monotonic()
+            if delay <= 0:
+                return
+            try:
+                await asyncio.wait_for(batch.full.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_seconds": self.window,
+            "messages": self.messages,
+            "turns": self.turns,
+            "pending": len(self._pending),
+            "claude_calls_saved": self.messages - self.turns - sum(len(b.texts) for b in self._pending.values()),
+            "largest_batch": self.largest_batch,
+        }
+
+
+message_coalescer = MessageCoalescer(
+    window=COALESCE_WINDOW,
+    max_wait=COALESCE_MAX_WAIT,
+    max_messages=COALESCE_MAX_MESSAGES,
+)
@@ -1,24 +1,34 @@
 """Core agent logic"""
 
-from uuid import uuid5, NAMESPACE_URL
+import time
+from typing import Optional, Tuple
+from uuid import UUID, uuid5, NAMESPACE_URL
+from lib.config import CLAUDE_STREAMING, HISTORY_MAX_MESSAGES
 from lib.services.claude import ClaudeService
-from lib.services.whatsapp import WhatsAppService
+from lib.services.whatsapp import get_whatsapp_service
 from lib.agent.prompts import get_personalized_prompt
-from lib.agent.tools import TOOLS, ToolExecutor
+from lib.agent.tools import TOOLS, TOOL_TIMEOUTS, ToolExecutor
 from lib.agent.memory import ConversationMemory
+from lib.agent.streaming import TextSegmenter, SegmentSender, stream_stats
+from lib.agent.locks import customer_locks
+from lib.agent.intents import RoutedReply, intent_router
+from lib.agent.summarizer import conversation_summarizer
+from lib.agent.history import fit_history
+from lib.logger import get_logger
+from lib.metrics import span, turns_in_flight, turns_total
 
+logger = get_logger("core")
 
-def log(message: str):
-    """Print log with prefix"""
-    print(f"[CORE] {message}")
+# Stored after the part of a streamed reply that was sent when the stream failed
+INTERRUPTED_MARKER = "[respuesta interrumpida]"
 
 
-def _phone_to_uuid(phone_number: str):
+def phone_to_customer_id(phone_number: str) -> UUID:
     """Derive a deterministic UUID from a phone number."""
     return uuid5(NAMESPACE_URL, f"tel:{phone_number}")
 
 
-async def process_message(phone_number: str, message_text: str, message_id: str) -> str:
+async def process_message(phone_number: str, message_text: str, message_id: str, stream: bool = False) -> str:
     """
     Process incoming WhatsApp message and return response.
 
@@ -26,70 +36,216 @@ async def process_message(phone_number: str, message_text: str, message_id: str)
         phone_number: Customer's phone number
         message_text: The message content
         message_id: WhatsApp message ID
+        stream: Stream Claude's reply and send it to the customer segment by
+            segment as it is generated (the caller must not send it again)
 
     Returns:
-        Response text to send back
+        Response text to send back (or, when streaming, the text already sent)
+
+    When streaming, a failure after part of the reply reached the customer
+    is only logged: the part that was sent is stored (see `_stream_reply`), so
+    a retry can't send it again.
     """
-    log(f"=== Processing message from {phone_number} ===")
-    log(f"Message: {message_text[:100]}...")
+    started_at = time.perf_counter()
+    logger.info("Processing message", extra={"customer": phone_number, "message_id": message_id})
+    logger.debug("Message: %.100s", message_text)
 
-    # Initialize services
-    log("Initializing ClaudeService...")
-    claude_service = ClaudeService()
-    log("Initializing WhatsAppService...")
-    whatsapp_service = WhatsAppService()
+    whatsapp_service = get_whatsapp_service()
 
     # Mark message as read
     try:
-        log("Marking message as read...")
         await whatsapp_service.mark_as_read(message_id)
-        log("Message marked as read")
     except Exception as e:
-        log(f"Failed to mark as read (non-critical): {e}")
+        logger.warning("Failed to mark as read (non-critical): %s", e)
 
     # Derive a stable UUID from the phone number for conversation storage
-    customer_id = _phone_to_uuid(phone_number)
-    log(f"Derived customer UUID: {customer_id}")
+    customer_id = phone_to_customer_id(phone_number)
 
     # Initialize memory
-    log("Initializing conversation memory...")
     memory = ConversationMemory(customer_id)
 
-    # Add user message to history
-    log("Adding user message to history...")
-    await memory.add_user_message(message_text)
+    claude_service = ClaudeService()
 
-    # Get conversation history
-    log("Getting conversation history...")
-    messages = await memory.get_messages(limit=10)
-    log(f"History messages count: {len(messages)}")
+    # Load conversation history (plus this message) in one round trip
+    with span("db_load"):
+        messages = await memory.start_turn(message_text, limit=HISTORY_MAX_MESSAGES)
 
-    # Build prompt
-    log("Building system prompt...")
-    system_prompt = get_personalized_prompt()
+    # Keep the newest messages that fit the input token budget
+    history = await fit_history(messages, client=claude_service.client, model=claude_service.model)
+    messages = history.messages
+    logger.debug("History messages count: %d", len(messages))
+
+    # Build prompt (older context comes in as the rolling summary)
+    system_prompt = get_personalized_prompt(await memory.get_summary())
 
     # Initialize tool executor
-    log("Initializing tool executor...")
     tool_executor = ToolExecutor()
 
     # Get response from Claude
-    log("Calling Claude API...")
-    response = await claude_service.chat_with_tools(
-        messages=messages,
-        system_prompt=system_prompt,
-        tools=TOOLS,
-        tool_executor=lambda name, input: tool_executor.execute(name, input)
-    )
-    log(f"Claude response: {response[:100]}...")
-
-    # Save assistant response
-    log("Saving assistant response to memory...")
-    await memory.add_assistant_message(response)
-
-    log("=== Message processing complete ===")
+    delivered = False
+    if stream:
+        response, delivered = await _stream_reply(
+            claude_service, whatsapp_service, phone_number, messages, system_prompt, tool_executor, started_at
+        )
+    else:
+        response = await claude_service.chat_with_tools(
+            messages=messages,
+            system_prompt=system_prompt,
+            tools=TOOLS,
+            tool_executor=lambda name, input: tool_executor.execute(name, input),
+            tool_timeouts=TOOL_TIMEOUTS
+        )
+    logger.debug("Claude response: %.100s", response)
+
+    # Save user message and assistant response together
+    try:
+        with span("persist"):
+            await memory.finish_turn(response)
+    except Exception as e:
+        if not delivered:
+            raise
+        # The customer already has the reply: retrying the turn would send it again
+        logger.error("Streamed reply was delivered but not stored: %s: %s", type(e).__name__, e)
+
+    # Fold the messages that no longer fit the window (the reply is now part of it)
+    # into the summary in the background
+    conversation_summarizer.maybe_schedule(customer_id, await memory.get_conversation(), keep=history.kept + 1)
+
+    logger.info("Message processed", extra={
+        "customer": phone_number, "ms": round((time.perf_counter() - started_at) * 1000),
+        "tier": claude_service.last_tier,
+    })
     return response
 
 
+async def _stream_reply(
+    claude_service: ClaudeService,
+    whatsapp_service,
+    phone_number: str,
+    messages: list,
+    system_prompt: str,
+    tool_executor: ToolExecutor,
+    started_at: float,
+) -> Tuple[str, bool]:
+    """
+    Stream Claude's reply, sending each finished segment to the customer in
+    order. Returns the reply and whether any of it was delivered.
+
+    If Claude fails, or a segment can't be sent, after some segments were
+    delivered, the reply is what was delivered plus INTERRUPTED_MARKER, so the
+    turn is stored as what the customer actually got (later segments are not
+    sent around a gap); if nothing was delivered, the error is raised and the
+    turn can be retried.
+    """
+    segmenter = TextSegmenter()
+    sender = SegmentSender(lambda segment: whatsapp_service.send_message(phone_number, segment), started_at)
+
+    async def on_text(delta: str) -> None:
+        for segment in segmenter.feed(delta):
+            sender.push(segment)
+
+    failure: Optional[Exception] = None
+    try:
+        response = await claude_service.chat_with_tools(
+            messages=messages,
+            system_prompt=system_prompt,
+            tools=TOOLS,
+            tool_executor=lambda name, input: tool_executor.execute(name, input),
+            tool_timeouts=TOOL_TIMEOUTS,
+            on_text=on_text
+        )
+        for segment in segmenter.flush():
+            sender.push(segment)
+    except Exception as e:
+        failure = e
+    finally:
+        await sender.close()
+        stream_stats.record(sender)
+
+    failure = failure or sender.error
+    if failure is not None:
+        if not sender.sent:
+            raise failure
+        logger.error("Stream failed after %d segment(s) were sent: %s: %s",
+                     sender.sent, type(failure).__name__, failure)
+        response = "\n\n".join(sender.delivered + [INTERRUPTED_MARKER])
+
+    logger.info("Streamed %d segment(s), %d failed", sender.sent, sender.failed, extra={
+        "first_segment_ms": round(sender.first_segment_ms) if sender.first_segment_ms is not None else None
+    })
+    return response, sender.sent > 0
+
+
+async def answer_routed(phone_number: str, message_text: str, message_id: str, routed: RoutedReply) -> str:
+    """Store and deliver a reply picked by the intent router (no Claude call); returns its text"""
+    logger.info("Answered by intent router", extra={"customer": phone_number, "intent": routed.intent})
+    whatsapp_service = get_whatsapp_service()
+    try:
+        await whatsapp_service.mark_as_read(message_id)
+    except Exception as e:
+        logger.warning("Failed to mark as read (non-critical): %s", e)
+
+    customer_id = phone_to_customer_id(phone_number)
+    memory = ConversationMemory(customer_id)
+    with span("persist"):
+        await memory.record_turn(message_text, routed.reply)
+
+    if routed.menu is not None:
+        menu = routed.menu
+        try:
+            await whatsapp_service.send_interactive_list(phone_number, menu.body, menu.button, menu.sections)
+            return routed.reply
+        except Exception as e:
+            logger.warning("Interactive list failed, sending it as text: %s", e)
+    await send_response(phone_number, routed.reply)
+    return routed.reply
+
+
+async def handle_turn(
+    phone_number: str,
+    message_text: str,
+    message_id: str,
+    stream: bool = CLAUDE_STREAMING,
+    reply_id: str = None,
+) -> str:
+    """
+    Run one agent turn and deliver the reply, one turn per customer at a time.
+
+    Catalog lookups and taps on the catalog list (`reply_id`: the tapped
+    row/button ID, `message_text` its title) are answered without Claude; a
+    tap the router doesn't know is handled like a message with its title.
+
+    Raises if the turn fails before its reply is stored or any of it is
+    delivered, so callers can retry it. Once (part of) a streamed reply has
+    reached the customer, later failures are only logged, and so is a reply
+    that was stored but could not be delivered.
+    """
+    turns_in_flight.inc()
+    try:
+        async with customer_locks.hold(phone_to_customer_id(phone_number)):
+            routed = intent_router.select(reply_id) if reply_id else intent_router.route(message_text)
+            if routed is not None:
+                response_text = await answer_routed(phone_number, message_text, message_id, routed)
+            else:
+                response_text = await process_message(
+                    phone_number=phone_number,
+                    message_text=message_text,
+                    message_id=message_id,
+                    stream=stream,
+                )
+
+                # Streamed replies were already delivered segment by segment
+                if not stream:
+                    await send_response(phone_number, response_text)
+    except BaseException:
+        turns_total.inc(outcome="error")
+        raise
+    finally:
+        turns_in_flight.dec()
+    turns_total.inc(outcome="ok")
+    return response_text
+
+
 async def send_response(phone_number: str, response_text: str) -> bool:
     """
     Send response back via WhatsApp.
@@ -101,18 +257,17 @@ async def send_response(phone_number: str, response_text: str) -> bool:
     Returns:
         True if successful
     """
-    whatsapp_service = WhatsAppService()
+    whatsapp_service = get_whatsapp_service()
 
     try:
         # WhatsApp has a 4096 character limit
         if len(response_text) > 4000:
-            # Split into multiple messages
+            # Split into multiple messages, delivered in order
             chunks = [response_text[i:i+4000] for i in range(0, len(response_text), 4000)]
-            for chunk in chunks:
-                await whatsapp_service.send_message(phone_number, chunk)
+            await whatsapp_service.send_messages(phone_number, chunks)
         else:
             await whatsapp_service.send_message(phone_number, response_text)
         return True
     except Exception as e:
-        print(f"Error sending message: {e}")
+        logger.error("Error sending message: %s", e)
         return False
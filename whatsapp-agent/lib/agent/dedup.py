@@ -0,0 +1,116 @@
+"""Suppression of Meta webhook redeliveries by WhatsApp message ID"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+from lib.config import DEDUP_WINDOW, DEDUP_MAX_ENTRIES, DEDUP_DB, DEDUP_RETENTION
+from lib.db.queries import ProcessedMessageQueries
+from lib.logger import get_logger
+
+# Seconds between deletions of expired database claims
+PRUNE_INTERVAL = 3600
+
+
+logger = get_logger("dedup")
+
+
+class MessageDeduplicator:
+    """
+    Two-layer duplicate filter for incoming message IDs.
+
+    The first layer is an in-process set of IDs seen in the last `window`
+    seconds, capped at `max_entries` (oldest dropped first); it catches the
+    common case of Meta retrying against the same instance at no cost. The
+    second layer is a unique claim in `processed_messages`, which catches
+    redeliveries that land on another instance. If the database claim fails,
+    messages are let through: a rare duplicate beats a dropped message.
+    """
+
+    def __init__(self, window: float, max_entries: int, use_db: bool, retention: float):
+        self.window = window
+        self.max_entries = max_entries
+        self.use_db = use_db
+        self.retention = retention
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._last_prune = 0.0
+        self.checked = 0
+        self.suppressed_memory = 0
+        self.suppressed_db = 0
+        self.db_errors = 0
+
+    def filter_seen(self, message_ids: List[str]) -> List[str]:
+        """Return the IDs not seen within the window, and remember them"""
+        now = time.monotonic()
+        self._expire(now)
+        fresh = []
+        for message_id in message_ids:
+            self.checked += 1
+            if message_id in self._seen:
+                self.suppressed_memory += 1
+                continue
+            self._seen[message_id] = now + self.window
+            fresh.append(message_id)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return fresh
+
+    def forget(self, message_ids: List[str]) -> None:
+        """Un-see IDs whose processing could not be started, so a redelivery gets through"""
+        for message_id in message_ids:
+            self._seen.pop(message_id, None)
+
+    async def claim(self, message_ids: List[str]) -> List[str]:
+        """Return the IDs this instance is the first to claim in the database"""
+        if not self.use_db or not message_ids:
+            return message_ids
+        try:
+            claimed = await ProcessedMessageQueries.claim(message_ids)
+        except Exception as e:
+            self.db_errors += 1
+            logger.warning("DB claim failed, processing without it: %s: %s", type(e).__name__, e)
+            return message_ids
+        self.record_db_suppressed(len(set(message_ids)) - len(claimed))
+        await self.prune_if_due()
+        claimed_ids = set(claimed)
+        return [message_id for message_id in message_ids if message_id in claimed_ids]
+
+    def record_db_suppressed(self, count: int) -> None:
+        """Count duplicates rejected by a database claim made elsewhere (e.g. the job INSERT)"""
+        if count > 0:
+            self.suppressed_db += count
+            logger.info("Suppressed %d redelivered message(s) already claimed in the DB", count)
+
+    def _expire(self, now: float) -> None:
+        while self._seen:
+            message_id, expires_at = next(iter(self._seen.items()))
+            if expires_at > now:
+                return
+            del self._seen[message_id]
+
+    async def prune_if_due(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            await ProcessedMessageQueries.prune(self.retention)
+        except Exception as e:
+            logger.error("Prune failed: %s: %s", type(e).__name__, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self._seen),
+            "checked": self.checked,
+            "suppressed": self.suppressed_memory + self.suppressed_db,
+            "suppressed_memory": self.suppressed_memory,
+            "suppressed_db": self.suppressed_db,
+            "db_errors": self.db_errors,
+        }
+
+
+message_deduplicator = MessageDeduplicator(
+    window=DEDUP_WINDOW,
+    max_entries=DEDUP_MAX_ENTRIES,
+    use_db=DEDUP_DB,
+    retention=DEDUP_RETENTION,
+)
@@ -0,0 +1,162 @@
+"""Token-budgeted selection of the conversation history sent to Claude"""
+
+import math
+from typing import Any, Dict, List, NamedTuple, Optional
+from lib.config import HISTORY_TOKEN_BUDGET, HISTORY_EXACT_TOKENS
+from lib.logger import get_logger
+
+logger = get_logger("history")
+
+# Claude's tokenizer averages ~3.5 characters per token on Spanish chat text
+# (a little less with emojis and recipe lists); each message adds a few
+# tokens of role/turn framing on top of its content.
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else getattr(block, "text", "") or ""
+            for block in content
+        )
+    return str(content or "")
+
+
+def estimate_tokens(message: Dict[str, Any]) -> int:
+    """Local, dependency-free estimate of the input tokens of one message"""
+    return math.ceil(len(_content_text(message.get("content"))) / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+def normalize_roles(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Make the list valid for the Messages API: starts with a user message and
+    alternates roles. Leading assistant messages are dropped and consecutive
+    messages with the same role (e.g. after a turn whose reply failed) are merged.
+    """
+    normalized: List[Dict[str, Any]] = []
+    for message in messages:
+        if not normalized and message["role"] != "user":
+            continue
+        if normalized and normalized[-1]["role"] == message["role"]:
+            merged = _content_text(normalized[-1]["content"]) + "\n\n" + _content_text(message["content"])
+            normalized[-1] = {"role": message["role"], "content": merged}
+        else:
+            normalized.append(message)
+    return normalized
+
+
+class HistoryWindow(NamedTuple):
+    # Messages to send to Claude (normalized)
+    messages: List[Dict[str, Any]]
+    # How many of the given messages the window covers: the newest `kept`
+    kept: int
+
+
+def _window_start(messages: List[Dict[str, Any]], budget: int, count=estimate_tokens) -> int:
+    """Index of the oldest message in the window (see select_history)"""
+    if not messages:
+        return 0
+    used = count(messages[-1])
+    start = len(messages) - 1
+    for i in range(len(messages) - 2, -1, -1):
+        used += count(messages[i])
+        if used > budget:
+            break
+        if messages[i]["role"] == "user":
+            start = i
+    return start
+
+
+def select_history(messages: List[Dict[str, Any]], budget: int, count=estimate_tokens) -> List[Dict[str, Any]]:
+    """
+    Keep the newest messages that fit in `budget` tokens, walking backward
+    from the last one (the current user message, which is always kept), and
+    cut only at a user message so the window starts a turn.
+    """
+    return normalize_roles(messages[_window_start(messages, budget, count):])
+
+
+class HistoryStats:
+    """Process-wide counters for history selection"""
+
+    def __init__(self):
+        self.turns = 0
+        self.loaded_messages = 0
+        self.kept_messages = 0
+        self.estimated_tokens = 0
+        self.trimmed_turns = 0
+        self.exact_counts = 0
+        self.exact_count_errors = 0
+
+    def record(self, loaded: int, kept: List[Dict[str, Any]]) -> None:
+        self.turns += 1
+        self.loaded_messages += loaded
+        self.kept_messages += len(kept)
+        self.estimated_tokens += sum(estimate_tokens(m) for m in kept)
+        if len(kept) < loaded:
+            self.trimmed_turns += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "budget_tokens": HISTORY_TOKEN_BUDGET,
+            "turns": self.turns,
+            "avg_loaded_messages": round(self.loaded_messages / self.turns, 2) if self.turns else 0.0,
+            "avg_kept_messages": round(self.kept_messages / self.turns, 2) if self.turns else 0.0,
+            "avg_estimated_tokens": round(self.estimated_tokens / self.turns, 1) if self.turns else 0.0,
+            "trimmed_turns": self.trimmed_turns,
+            "exact_counts": self.exact_counts,
+            "exact_count_errors": self.exact_count_errors,
+        }
+
+
+history_stats = HistoryStats()
+
+
+async def count_tokens_exact(client: Any, model: str, messages: List[Dict[str, Any]]) -> Optional[int]:
+    """Input tokens of `messages` per the Anthropic token counting endpoint, or None if unavailable"""
+    counter = getattr(client.messages, "count_tokens", None)
+    if counter is None:
+        return None
+    try:
+        result = await counter(model=model, messages=messages)
+    except Exception as e:
+        history_stats.exact_count_errors += 1
+        logger.warning("Exact token count failed, keeping the estimate: %s: %s", type(e).__name__, e)
+        return None
+    history_stats.exact_counts += 1
+    return result.input_tokens
+
+
+async def fit_history(
+    messages: List[Dict[str, Any]],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    client: Any = None,
+    model: Optional[str] = None,
+    exact: bool = HISTORY_EXACT_TOKENS,
+) -> HistoryWindow:
+    """
+    select_history() with the local estimate; with `exact`, the selection is
+    then checked against the token counting endpoint (one extra request) and
+    the oldest turns are dropped while it is still over budget. `kept` tells
+    the caller which of `messages` fell out of the window (the summarizer
+    folds those).
+    """
+    loaded = len(messages)
+    start = _window_start(messages, budget)
+    selected = normalize_roles(messages[start:])
+    if exact and client is not None and model:
+        while True:
+            tokens = await count_tokens_exact(client, model, selected)
+            if tokens is None or tokens <= budget:
+                break
+            # Drop the oldest turn (its user message and what follows up to the next user message)
+            next_user = next((i for i in range(start + 1, loaded) if messages[i]["role"] == "user"), None)
+            if next_user is None:
+                break
+            start = next_user
+            selected = normalize_roles(messages[start:])
+    history_stats.record(loaded, selected)
+    return HistoryWindow(selected, loaded - start)
@@ -0,0 +1,189 @@
+"""Deterministic answers for unambiguous catalog requests, before calling Claude"""
+
+import math
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+from lib.config import INTENT_ROUTER, INTENT_ROUTER_INTENTS, INTERACTIVE_LISTS, INTERACTIVE_LIST_PAGE_SIZE
+from lib.data.recipes import RecipesData
+from lib.data.search import normalize
+from lib.metrics import registry
+
+LIST_RECIPES = "list_recipes"
+RECIPE_BY_ID = "recipe_by_id"
+RECIPE_BY_NAME = "recipe_by_name"
+INTENTS = (LIST_RECIPES, RECIPE_BY_ID, RECIPE_BY_NAME)
+# Taps on an interactive list row (see recipe_list_menu)
+RECIPE_SELECTION = "recipe_selection"
+LIST_PAGE = "list_page"
+SELECTIONS = (RECIPE_SELECTION, LIST_PAGE)
+
+# Row IDs: "recipe:<recipe id>" and "recipes_page:<page>" for the "Ver más" row
+RECIPE_ROW = "recipe:"
+LIST_PAGE_ROW = "recipes_page:"
+
+# WhatsApp list limits: 10 rows in total, 24-char row titles, 72-char descriptions
+MAX_LIST_ROWS = 10
+MAX_ROW_TITLE = 24
+MAX_ROW_DESCRIPTION = 72
+
+# Patterns run on normalize()d text: lowercase, no accents, punctuation collapsed to spaces
+_POLITE = r"(?:hola\s+)?(?:(?:me\s+(?:pasas|pasarias|mandas|das|mostras)|pasame|mandame|mostrame|dame|quiero(?:\s+ver)?|quisiera(?:\s+ver)?|ver)\s+)?"
+_PLEASE = r"(?:\s+(?:por\s+favor|porfa|gracias))?"
+
+_LIST = re.compile(
+    rf"^{_POLITE}(?:(?:la|el)\s+)?"
+    r"(?:(?:lista(?:do)?|catalogo)(?:\s+de)?(?:\s+las)?\s+recetas|recetas(?:\s+disponibles)?|catalogo|menu"
+    r"|que\s+recetas\s+(?:tienen|hay|tenes|ofrecen))"
+    rf"{_PLEASE}$"
+)
+_BY_ID = re.compile(
+    rf"^{_POLITE}(?:la\s+)?receta\s+(?:(?:n|nro|no|num|numero)\s+)?(\d{{1,4}}){_PLEASE}$"
+)
+_BY_NAME = re.compile(
+    rf"^{_POLITE}(?:la\s+)?receta\s+(?:de(?:l)?\s+)?(?:(?:la|el|los|las)\s+)?(.+?){_PLEASE}$"
+)
+
+router_decisions = registry.counter(
+    "agent_intent_router_total", "Messages checked by the intent router, by outcome", ("intent",))
+
+
+class ListMenu(NamedTuple):
+    """An interactive list message (WhatsAppService.send_interactive_list arguments)"""
+    body: str
+    button: str
+    sections: List[Dict[str, Any]]
+    # Plain-text version: stored in the conversation history, and sent as plain
+    # text if the list can't be delivered
+    text: str
+
+
+class RoutedReply(NamedTuple):
+    intent: str
+    reply: str
+    menu: Optional[ListMenu] = None
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def recipe_list_menu(page: int = 1, page_size: int = INTERACTIVE_LIST_PAGE_SIZE) -> Optional[ListMenu]:
+    """Page `page` (1-based) of the catalog as an interactive list; None past the last page"""
+    recipes = RecipesData().get_all_recipes()
+    page_size = max(1, min(page_size, MAX_LIST_ROWS - 1))
+    pages = max(1, math.ceil(len(recipes) / page_size))
+    if not recipes or not 1 <= page <= pages:
+        return None
+    listed = recipes[(page - 1) * page_size:page * page_size]
+    rows = []
+    for recipe in listed:
+        name = recipe.get("nombre", "Sin nombre")
+        title = _truncate(name, MAX_ROW_TITLE)
+        # The full name goes in the description when the title had to be cut
+        description = name if title != name else (f"Rinde: {recipe['rendimiento']}" if recipe.get("rendimiento") else "")
+        row = {"id": f"{RECIPE_ROW}{recipe['id']}", "title": title}
+        if description:
+            row["description"] = _truncate(description, MAX_ROW_DESCRIPTION)
+        rows.append(row)
+    if page < pages:
+        rows.append({"id": f"{LIST_PAGE_ROW}{page + 1}", "title": "Ver más recetas",
+                     "description": f"Página {page + 1} de {pages}"})
+    body = (f"📚 Tenemos {len(recipes)} recetas (página {page} de {pages}). "
+            "Elegí una para ver sus ingredientes.")
+    text = "".join(
+        [f"📚 RECETAS DISPONIBLES (página {page} de {pages}):\n\n"]
+        + [f"  {recipe.get('id', '?')}. {recipe.get('nombre', 'Sin nombre')}\n" for recipe in listed]
+        + ["\n💡 Para ver una receta, indica el nombre o número."]
+    )
+    return ListMenu(body=body, button="Ver recetas", text=text,
+                    sections=[{"title": _truncate(f"Recetas {page}/{pages}", MAX_ROW_TITLE), "rows": rows}])
+
+
+class IntentRouter:
+    """
+    Answers catalog lookups straight from RecipesData: "lista de recetas",
+    "receta 12" and a recipe's exact name (optionally "receta de <name>").
+    Only whole-message matches count, and an unknown ID or a name that isn't
+    an exact match falls through to Claude, so anything ambiguous keeps
+    getting the full agent. With `interactive_lists`, the listing is a
+    paginated interactive list and `select` answers the tapped rows.
+    """
+
+    def __init__(self, enabled: bool, intents=INTENTS, interactive_lists: bool = False):
+        self.enabled = enabled
+        self.intents = frozenset(intents)
+        self.interactive_lists = interactive_lists
+        self.checked = 0
+        self.hits: Dict[str, int] = {intent: 0 for intent in INTENTS + SELECTIONS}
+
+    def route(self, text: str) -> Optional[RoutedReply]:
+        """The reply for `text` if it is a high-confidence catalog request, else None"""
+        if not self.enabled:
+            return None
+        return self._record(self._match(normalize(text)))
+
+    def select(self, reply_id: str) -> Optional[RoutedReply]:
+        """The reply for a tapped list row or button (its ID), else None (e.g. a stale or foreign ID)"""
+        if not self.enabled:
+            return None
+        return self._record(self._select(reply_id or ""))
+
+    def _record(self, routed: Optional[RoutedReply]) -> Optional[RoutedReply]:
+        self.checked += 1
+        if routed is None:
+            router_decisions.inc(intent="fallthrough")
+            return None
+        self.hits[routed.intent] += 1
+        router_decisions.inc(intent=routed.intent)
+        return routed
+
+    def _match(self, text: str) -> Optional[RoutedReply]:
+        if not text:
+            return None
+        recipes = RecipesData()
+
+        if LIST_RECIPES in self.intents and _LIST.match(text):
+            menu = recipe_list_menu() if self.interactive_lists else None
+            if menu is not None:
+                return RoutedReply(LIST_RECIPES, menu.text, menu)
+            return RoutedReply(LIST_RECIPES, recipes.format_recipe_list())
+
+        if RECIPE_BY_ID in self.intents:
+            match = _BY_ID.match(text)
+            if match:
+                recipe = recipes.get_recipe_by_id(int(match.group(1)))
+                return RoutedReply(RECIPE_BY_ID, recipes.format_recipe(recipe)) if recipe else None
+
+        if RECIPE_BY_NAME in self.intents:
+            match = _BY_NAME.match(text)
+            recipe = recipes.get_recipe_by_exact_name(match.group(1) if match else text)
+            if recipe:
+                return RoutedReply(RECIPE_BY_NAME, recipes.format_recipe(recipe))
+        return None
+
+    @staticmethod
+    def _select(reply_id: str) -> Optional[RoutedReply]:
+        prefix, _, value = reply_id.partition(":")
+        if not value.isdigit():
+            return None
+        if f"{prefix}:" == RECIPE_ROW:
+            recipes = RecipesData()
+            recipe = recipes.get_recipe_by_id(int(value))
+            return RoutedReply(RECIPE_SELECTION, recipes.format_recipe(recipe)) if recipe else None
+        if f"{prefix}:" == LIST_PAGE_ROW:
+            menu = recipe_list_menu(int(value))
+            return RoutedReply(LIST_PAGE, menu.text, menu) if menu else None
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        routed = sum(self.hits.values())
+        return {
+            "enabled": self.enabled,
+            "checked": self.checked,
+            "routed": routed,
+            "hit_rate": round(routed / self.checked, 4) if self.checked else 0.0,
+            "by_intent": dict(self.hits),
+        }
+
+
+intent_router = IntentRouter(enabled=INTENT_ROUTER, intents=INTENT_ROUTER_INTENTS, interactive_lists=INTERACTIVE_LISTS)
@@ -0,0 +1,123 @@
+"""Per-customer serialization: in-process keyed locks plus Postgres advisory locks"""
+
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+from uuid import UUID
+from lib.config import CUSTOMER_ADVISORY_LOCKS, CUSTOMER_LOCK_POOL_SIZE, CUSTOMER_LOCK_TIMEOUT, DB_PGBOUNCER
+from lib.db.connection import get_lock_pool
+from lib.keyed_lock import KeyedLock
+from lib.logger import get_logger
+
+
+logger = get_logger("lock")
+
+
+def advisory_key(customer_id: UUID) -> int:
+    """Signed 64-bit advisory lock key derived from the customer UUID"""
+    return int.from_bytes(customer_id.bytes[:8], "big", signed=True)
+
+
+class CustomerLocks:
+    """
+    Serializes turns per customer while different customers run in parallel.
+
+    Inside a process, turns queue on a KeyedLock (no database round trip).
+    The task at the head of a customer's queue then takes a session-level
+    advisory lock on the customer UUID, so turns for that customer handled by
+    other workers or instances wait too. If the advisory lock can't be taken
+    within `timeout` seconds (or the database is unreachable) the turn runs
+    anyway: a late reply is better than a dropped one.
+
+    With `transactional` (pgbouncer in transaction mode, where a session-level
+    lock and its unlock may run on different server sessions) the lock is a
+    pg_advisory_xact_lock inside a transaction held open for the whole turn,
+    which pins one server session and releases the lock when it ends.
+
+    Either way a locked turn holds one of the `pool_size` lock connections
+    until it ends, so the pool must cover every turn that can run at once
+    (see `check_capacity`); otherwise unrelated customers queue for a
+    connection and, past `timeout`, run unlocked.
+    """
+
+    def __init__(self, advisory: bool, timeout: float, transactional: bool = False, pool_size: int = CUSTOMER_LOCK_POOL_SIZE):
+        self.advisory = advisory
+        self.timeout = timeout
+        self.transactional = transactional
+        self.pool_size = pool_size
+        self._local = KeyedLock()
+        self.acquired = 0
+        self.contended = 0
+        self.advisory_failures = 0
+
+    def check_capacity(self, concurrency: int) -> None:
+        """Raise if `concurrency` locked turns can't each get a lock connection"""
+        if self.advisory and self.pool_size < concurrency:
+            raise ValueError(
+                f"CUSTOMER_LOCK_POOL_SIZE={self.pool_size} is below the {concurrency} concurrent turns: "
+                "raise it (or lower JOB_CONCURRENCY) so every turn can take its advisory lock"
+            )
+
+    @asynccontextmanager
+    async def hold(self, customer_id: UUID) -> AsyncIterator[None]:
+        if customer_id in self._local:
+            self.contended += 1
+        async with self._local.hold(customer_id):
+            self.acquired += 1
+            if not self.advisory:
+                yield
+                return
+            async with self._advisory(customer_id):
+                yield
+
+    @asynccontextmanager
+    async def _advisory(self, customer_id: UUID) -> AsyncIterator[None]:
+        key = advisory_key(customer_id)
+        pool = conn = transaction = None
+        locked = False
+        try:
+            pool = await get_lock_pool()
+            conn = await pool.acquire(timeout=self.timeout)
+            if self.transactional:
+                transaction = conn.transaction()
+                await transaction.start()
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", key, timeout=self.timeout)
+            else:
+                await conn.execute("SELECT pg_advisory_lock($1)", key, timeout=self.timeout)
+            locked = True
+        except Exception as e:
+            self.advisory_failures += 1
+            logger.warning("Advisory lock unavailable for %s, continuing unlocked: %s: %s", customer_id, type(e).__name__, e)
+            if conn is not None:
+                # A timed-out pg_advisory_lock may still be granted later; drop the session
+                conn.terminate()
+                await pool.release(conn)
+                conn = None
+
+        try:
+            yield
+        finally:
+            if locked:
+                try:
+                    if transaction is not None:
+                        await transaction.rollback()
+                    else:
+                        await conn.execute("SELECT pg_advisory_unlock($1)", key)
+                except Exception as e:
+                    logger.warning("Advisory unlock failed for %s, closing session: %s: %s", customer_id, type(e).__name__, e)
+                    conn.terminate()
+                await pool.release(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "advisory": self.advisory,
+            "transactional": self.transactional,
+            "pool_size": self.pool_size,
+            "active_customers": len(self._local),
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "advisory_failures": self.advisory_failures,
+        }
+
+
+customer_locks = CustomerLocks(
+    advisory=CUSTOMER_ADVISORY_LOCKS, timeout=CUSTOMER_LOCK_TIMEOUT, transactional=DB_PGBOUNCER)
@@ -1,8 +1,9 @@
 """Conversation memory management"""
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from uuid import UUID
 from lib.db.queries import ConversationQueries
+from lib.agent.cache import conversation_cache
 
 
 class ConversationMemory:
@@ -11,45 +12,106 @@ class ConversationMemory:
     def __init__(self, customer_id: UUID):
         self.customer_id = customer_id
         self._conversation = None
+        self._pending_user_message: Optional[str] = None
 
     async def get_conversation(self) -> Dict[str, Any]:
         """Get or create conversation"""
+        if self._conversation is None:
+            self._conversation = conversation_cache.get_conversation(self.customer_id)
         if self._conversation is None:
             self._conversation = await ConversationQueries.get_or_create(self.customer_id)
         return self._conversation
 
     async def get_messages(self, limit: int = 10) -> List[Dict[str, str]]:
         """Get recent messages formatted for Claude"""
+        cached = conversation_cache.get(self.customer_id, limit)
+        if cached is not None:
+            return cached["messages"]
         messages = await ConversationQueries.get_recent_messages(self.customer_id, limit)
         return messages
 
+    async def _add_message(self, role: str, content: str) -> None:
+        conversation = await self.get_conversation()
+        try:
+            await ConversationQueries.add_message(
+                UUID(str(conversation["id"])),
+                role,
+                content
+            )
+        except Exception:
+            conversation_cache.invalidate(self.customer_id)
+            raise
+        conversation_cache.append_messages(self.customer_id, [{"role": role, "content": content}])
+
     async def add_user_message(self, content: str) -> None:
         """Add user message to conversation"""
-        conversation = await self.get_conversation()
-        await ConversationQueries.add_message(
-            UUID(str(conversation["id"])),
-            "user",
-            content
-        )
+        await self._add_message("user", content)
 
     async def add_assistant_message(self, content: str) -> None:
         """Add assistant message to conversation"""
+        await self._add_message("assistant", content)
+
+    async def start_turn(self, user_content: str, limit: int = 10) -> List[Dict[str, str]]:
+        """
+        Load (or create) the conversation and its history in one round trip.
+
+        Hot customers are served from the in-process cache without touching the
+        database. The user message is held in memory until `finish_turn`, and is
+        appended to the returned history so the result can be sent to Claude as-is.
+        """
+        window = max(limit - 1, 0)
+        context = conversation_cache.get(self.customer_id, window)
+        if context is None:
+            context = await ConversationQueries.load_turn_context(self.customer_id, window)
+            conversation_cache.set(self.customer_id, context["conversation"], context["messages"], window)
+        self._conversation = context["conversation"]
+        self._pending_user_message = user_content
+        return context["messages"] + [{"role": "user", "content": user_content}]
+
+    async def finish_turn(self, assistant_content: str) -> None:
+        """Persist the pending user message and the assistant reply in one round trip"""
+        if self._pending_user_message is None:
+            await self.add_assistant_message(assistant_content)
+            return
         conversation = await self.get_conversation()
-        await ConversationQueries.add_message(
-            UUID(str(conversation["id"])),
-            "assistant",
-            content
-        )
+        turn = [
+            {"role": "user", "content": self._pending_user_message},
+            {"role": "assistant", "content": assistant_content},
+        ]
+        try:
+            await ConversationQueries.add_turn(
+                UUID(str(conversation["id"])),
+                self._pending_user_message,
+                assistant_content
+            )
+        except Exception:
+            conversation_cache.invalidate(self.customer_id)
+            raise
+        conversation_cache.append_messages(self.customer_id, turn)
+        self._pending_user_message = None
+        conversation["unsummarized"] = conversation.get("unsummarized", 0) + len(turn)
+        conversation_cache.update_conversation(self.customer_id, unsummarized=conversation["unsummarized"])
+
+    async def record_turn(self, user_content: str, assistant_content: str) -> None:
+        """Persist a turn that was answered without loading the history"""
+        self._pending_user_message = user_content
+        await self.finish_turn(assistant_content)
 
     async def get_summary(self) -> str:
         """Get conversation summary if available"""
         conversation = await self.get_conversation()
-        return conversation.get("summary", "")
+        return conversation.get("summary") or ""
 
     async def update_summary(self, summary: str) -> None:
         """Update conversation summary"""
         conversation = await self.get_conversation()
-        await ConversationQueries.update_summary(
-            UUID(str(conversation["id"])),
-            summary
-        )
+        try:
+            await ConversationQueries.update_summary(
+                UUID(str(conversation["id"])),
+                summary
+            )
+        except Exception:
+            conversation_cache.invalidate(self.customer_id)
+            raise
+        conversation["summary"] = summary
+        conversation_cache.update_conversation(self.customer_id, summary=summary)
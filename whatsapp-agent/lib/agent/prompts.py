@@ -41,6 +41,24 @@ Panacea es una panadería especializada en productos SIN GLUTEN. Todos nuestros
 """
 
 
-def get_personalized_prompt() -> str:
-    """Get the system prompt"""
+SUMMARY_SECTION = """
+## Resumen de la conversación anterior
+Lo que sigue resume mensajes anteriores con este cliente que ya no aparecen en el historial. Usalo como contexto, sin repetírselo al cliente.
+
+{summary}
+"""
+
+SUMMARIZER_PROMPT = """Resumís conversaciones de WhatsApp entre un cliente y el asistente de Panacea Gluten Free Bakery, para que el asistente recuerde el contexto en mensajes futuros.
+
+- Escribí en español, en texto plano y en no más de 150 palabras
+- Conservá lo que sirva para seguir atendiendo: nombre y preferencias del cliente, recetas o productos consultados, pedidos o pendientes, dudas sin resolver
+- Omití saludos, cortesías y el contenido completo de las recetas (alcanza con nombrarlas)
+- Si hay un resumen previo, integralo con los mensajes nuevos en un único resumen actualizado
+- Respondé solo con el resumen"""
+
+
+def get_personalized_prompt(summary: str = "") -> str:
+    """Get the system prompt, with the conversation summary when there is one"""
+    if summary:
+        return SYSTEM_PROMPT + SUMMARY_SECTION.format(summary=summary)
     return SYSTEM_PROMPT
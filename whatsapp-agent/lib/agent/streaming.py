@@ -0,0 +1,165 @@
+"""Progressive delivery of streamed replies as WhatsApp messages"""
+
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from lib.config import STREAM_SEGMENT_MIN_CHARS, STREAM_SEGMENT_MAX_CHARS
+from lib.logger import get_logger
+
+# WhatsApp rejects text bodies over 4096 characters
+WHATSAPP_MAX_CHARS = 4000
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)")
+
+
+logger = get_logger("stream")
+
+
+class TextSegmenter:
+    """
+    Cuts streamed text into WhatsApp-sized segments as it arrives.
+
+    A segment ends at a paragraph break once it holds at least `min_chars`
+    (so a one-word greeting doesn't go out alone). Past `max_chars` without a
+    paragraph break it ends at the last sentence, then the last line or word,
+    and never exceeds WhatsApp's message limit.
+    """
+
+    def __init__(self, min_chars: int = STREAM_SEGMENT_MIN_CHARS, max_chars: int = STREAM_SEGMENT_MAX_CHARS):
+        self.min_chars = min_chars
+        self.max_chars = min(max_chars, WHATSAPP_MAX_CHARS)
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a text delta and return the segments it completed"""
+        self._buffer += delta
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return segments
+            segment, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:].lstrip()
+            if segment:
+                segments.append(segment)
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the stream ends"""
+        segments = []
+        while len(self._buffer) > WHATSAPP_MAX_CHARS:
+            cut = self._hard_cut(self._buffer[:WHATSAPP_MAX_CHARS])
+            segments.append(self._buffer[:cut].strip())
+            self._buffer = self._buffer[cut:].lstrip()
+        if self._buffer.strip():
+            segments.append(self._buffer.strip())
+        self._buffer = ""
+        return segments
+
+    def _find_cut(self) -> Optional[int]:
+        for match in _PARAGRAPH_BREAK.finditer(self._buffer):
+            if match.start() > self.max_chars:
+                break
+            if match.start() >= self.min_chars:
+                return match.end()
+        if len(self._buffer) <= self.max_chars:
+            return None
+        window = self._buffer[:self.max_chars]
+        sentence_ends = [m.end() for m in _SENTENCE_END.finditer(window) if m.end() >= self.min_chars]
+        if sentence_ends:
+            return sentence_ends[-1]
+        return self._hard_cut(window)
+
+    @staticmethod
+    def _hard_cut(window: str) -> int:
+        """Last line break, else last space, else the full window"""
+        for separator in ("\n", " "):
+            position = window.rfind(separator)
+            if position > 0:
+                return position + 1
+        return len(window)
+
+
+class StreamStats:
+    """Process-wide counters for streamed replies, including time to first segment"""
+
+    def __init__(self):
+        self.replies = 0
+        self.segments = 0
+        self.failed_segments = 0
+        self.first_segment_ms_total = 0.0
+        self.first_segment_ms_max = 0.0
+        self._timed = 0
+
+    def record(self, sender: "SegmentSender") -> None:
+        self.replies += 1
+        self.segments += sender.sent
+        self.failed_segments += sender.failed
+        if sender.first_segment_ms is not None:
+            self._timed += 1
+            self.first_segment_ms_total += sender.first_segment_ms
+            self.first_segment_ms_max = max(self.first_segment_ms_max, sender.first_segment_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replies": self.replies,
+            "segments": self.segments,
+            "failed_segments": self.failed_segments,
+            "avg_first_segment_ms": round(self.first_segment_ms_total / self._timed, 1) if self._timed else 0.0,
+            "max_first_segment_ms": round(self.first_segment_ms_max, 1),
+        }
+
+
+stream_stats = StreamStats()
+
+
+class SegmentSender:
+    """
+    Sends segments in order from a background task, so reading the stream is
+    never blocked on a Graph API round trip.
+
+    `first_segment_ms` is the time from `started_at` (perf_counter) until the
+    first segment was delivered. Once a segment fails to send, later ones are
+    dropped rather than delivered around the gap; `error` is that failure.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[Any]], started_at: Optional[float] = None):
+        self._send = send
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.first_segment_ms: Optional[float] = None
+        self.sent = 0
+        self.failed = 0
+        self.error: Optional[Exception] = None
+        # Segments that reached the customer, in order
+        self.delivered: List[str] = []
+        self._queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    def push(self, segment: str) -> None:
+        self._queue.put_nowait(segment)
+
+    async def close(self) -> None:
+        """Wait until every queued segment has been sent"""
+        self._queue.put_nowait(None)
+        await self._task
+
+    async def _run(self) -> None:
+        while True:
+            segment = await self._queue.get()
+            if segment is None:
+                return
+            if self.error is not None:
+                continue
+            try:
+                await self._send(segment)
+                self.sent += 1
+                self.delivered.append(segment)
+            except Exception as e:
+                self.failed += 1
+                self.error = e
+                logger.error("Failed to send segment %d, dropping the rest: %s: %s",
+                             self.sent + 1, type(e).__name__, e)
+                continue
+            if self.first_segment_ms is None:
+                self.first_segment_ms = (time.perf_counter() - self.started_at) * 1000
+                logger.info("Time to first segment: %.0f ms", self.first_segment_ms)
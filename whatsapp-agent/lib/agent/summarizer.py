@@ -0,0 +1,137 @@
+"""Background compaction of long conversations into conversations.summary"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Set
+from uuid import UUID
+from lib.config import SUMMARY_TRIGGER_MESSAGES, SUMMARY_MODEL, SUMMARY_MAX_TOKENS
+from lib.db.queries import ConversationQueries
+from lib.agent.cache import conversation_cache
+from lib.agent.prompts import SUMMARIZER_PROMPT
+from lib.logger import get_logger
+from lib.metrics import span
+
+logger = get_logger("summary")
+
+_ROLE_LABELS = {"user": "Cliente", "assistant": "Asistente"}
+
+
+def format_transcript(previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+    """The summarizer's input: the summary so far plus the messages to fold into it"""
+    parts = []
+    if previous_summary:
+        parts.append(f"Resumen previo:\n{previous_summary}\n")
+    parts.append("Mensajes nuevos:")
+    parts.extend(f"{_ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+    return "\n".join(parts)
+
+
+class ConversationSummarizer:
+    """
+    Folds older messages into the conversation summary, off the reply path.
+
+    After a turn is stored, `maybe_schedule` compares the conversation's count
+    of unsummarized messages (loaded with the turn context, no extra query) with
+    the messages the turn's history window kept. Once `trigger` messages fell
+    out of the window, a background task folds everything older than the
+    window into the summary with a small model, so every message is either sent
+    verbatim or covered by the summary. The summary and its message-id
+    watermark are saved with a compare-and-set, so overlapping runs on other
+    instances can't move it backwards. A run that fails or is cut short (e.g.
+    the process is frozen) is simply retried after a later turn.
+    """
+
+    def __init__(self, trigger: int, model: str, max_tokens: int):
+        self.trigger = trigger
+        self.model = model
+        self.max_tokens = max_tokens
+        self._running: Set[UUID] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.runs = 0
+        self.folded_messages = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.trigger > 0
+
+    def maybe_schedule(self, customer_id: UUID, conversation: Dict[str, Any], keep: int) -> bool:
+        """
+        Start a background summarization if at least `trigger` unsummarized
+        messages are older than the newest `keep` (the history window sent to
+        Claude, including the stored reply)
+        """
+        keep = max(keep, 1)
+        if not self.enabled or conversation.get("unsummarized", 0) - keep < self.trigger:
+            return False
+        conversation_id = UUID(str(conversation["id"]))
+        if conversation_id in self._running:
+            return False
+        self._running.add(conversation_id)
+        task = asyncio.create_task(self._run(customer_id, conversation_id, conversation.get("summary") or "", keep))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, customer_id: UUID, conversation_id: UUID, previous_summary: str, keep: int) -> None:
+        started = time.perf_counter()
+        try:
+            messages = await ConversationQueries.get_messages_to_summarize(conversation_id, keep)
+            if not messages:
+                self.skipped += 1
+                return
+            with span("summarize"):
+                summary = await self._summarize(previous_summary, messages)
+            if not summary:
+                self.skipped += 1
+                return
+            through = messages[-1]["id"]
+            if await ConversationQueries.save_summary(conversation_id, summary, through):
+                conversation_cache.fold(customer_id, len(messages), summary=summary, summarized_through=through)
+            self.runs += 1
+            self.folded_messages += len(messages)
+            self.last_ms = (time.perf_counter() - started) * 1000
+            logger.info("Folded %d message(s) into the summary", len(messages), extra={
+                "customer_id": str(customer_id), "ms": round(self.last_ms)
+            })
+        except Exception as e:
+            self.failures += 1
+            logger.error("Summarization failed: %s: %s", type(e).__name__, e)
+        finally:
+            self._running.discard(conversation_id)
+
+    async def _summarize(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        from lib.services.claude import ClaudeService
+
+        response = await ClaudeService().chat(
+            messages=[{"role": "user", "content": format_transcript(previous_summary, messages)}],
+            system_prompt=SUMMARIZER_PROMPT,
+            max_tokens=self.max_tokens,
+            model=self.model,
+        )
+        return "".join(block.text for block in response.content if hasattr(block, "text")).strip()
+
+    async def drain(self, timeout: float = 10.0) -> None:
+        """Wait (up to `timeout` seconds) for running summarizations, e.g. on shutdown"""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": len(self._running),
+            "runs": self.runs,
+            "folded_messages": self.folded_messages,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "last_ms": round(self.last_ms, 1),
+        }
+
+
+conversation_summarizer = ConversationSummarizer(
+    trigger=SUMMARY_TRIGGER_MESSAGES,
+    model=SUMMARY_MODEL,
+    max_tokens=SUMMARY_MAX_TOKENS,
+)
@@ -1,5 +1,7 @@
 """Tools available for the Claude agent"""
 
+import asyncio
+import inspect
 from typing import Any, Dict
 from lib.data.recipes import RecipesData
 
@@ -46,15 +48,27 @@ TOOLS = [
 ]
 
 
+# Per-tool timeouts in seconds (tools not listed use TOOL_TIMEOUT from config)
+TOOL_TIMEOUTS: Dict[str, float] = {}
+
+
 class ToolExecutor:
-    """Executes tools called by Claude"""
+    """
+    Executes tools called by Claude.
+
+    `_tool_<name>` methods may be async (awaited on the event loop) or plain
+    functions, which run in the default thread pool so blocking I/O doesn't
+    stall other requests.
+    """
 
     async def execute(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
         """Execute a tool and return result as string"""
         method = getattr(self, f"_tool_{tool_name}", None)
-        if method:
+        if method is None:
+            return f"Error: Herramienta '{tool_name}' no encontrada"
+        if inspect.iscoroutinefunction(method):
             return await method(tool_input)
-        return f"Error: Herramienta '{tool_name}' no encontrada"
+        return await asyncio.to_thread(method, tool_input)
 
     async def _tool_list_recipes(self, input: Dict) -> str:
         """List all available recipes"""
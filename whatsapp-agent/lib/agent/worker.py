@@ -0,0 +1,239 @@
+"""Worker loop for the durable job queue (see api/worker.py)"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Set
+from lib.config import (
+    JOB_BATCH_SIZE,
+    JOB_CONCURRENCY,
+    JOB_VISIBILITY_TIMEOUT,
+    JOB_MAX_ATTEMPTS,
+    JOB_BACKOFF_BASE,
+    JOB_BACKOFF_MAX,
+    JOB_POLL_INTERVAL,
+    JOB_RETENTION,
+    DEDUP_DB,
+)
+from lib.db.queries import JobQueries
+from lib.agent.coalescer import MessageCoalescer, message_coalescer
+from lib.agent.core import handle_turn
+from lib.agent.locks import customer_locks
+from lib.logger import get_logger
+
+INCOMING_MESSAGE = "incoming_message"
+
+# Seconds between deletions of old finished jobs
+PRUNE_INTERVAL = 3600
+
+
+logger = get_logger("worker")
+
+
+async def enqueue_messages(messages: List[Dict[str, str]]) -> int:
+    """
+    Queue incoming messages ({"phone_number", "message_text", "message_id"},
+    plus "reply_id" for list/button taps) in one INSERT. With DEDUP_DB,
+    messages whose ID was already claimed are skipped; returns how many were
+    queued.
+    """
+    if not messages:
+        return 0
+    if DEDUP_DB:
+        return await JobQueries.enqueue_new_messages(INCOMING_MESSAGE, messages, JOB_MAX_ATTEMPTS)
+    return await JobQueries.enqueue(INCOMING_MESSAGE, messages, JOB_MAX_ATTEMPTS)
+
+
+def backoff_delay(attempts: int, base: float = JOB_BACKOFF_BASE, cap: float = JOB_BACKOFF_MAX) -> float:
+    """Exponential backoff with jitter: half the step fixed, half random"""
+    step = min(cap, base * 2 ** max(attempts - 1, 0))
+    return step / 2 + random.uniform(0, step / 2)
+
+
+class JobWorker:
+    """
+    Claims batches of jobs and runs one agent turn per (coalesced) message.
+
+    At most `concurrency` turns run at once; new jobs are claimed only when a
+    slot is free. Running jobs are kept claimed by a heartbeat, so the
+    visibility timeout only expires for jobs of a worker that died. Messages
+    from the same customer go through the coalescer, so a burst queued
+    together is answered in one turn, and all its jobs are completed (or
+    retried) together.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = JOB_BATCH_SIZE,
+        concurrency: int = JOB_CONCURRENCY,
+        visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        coalescer: MessageCoalescer = message_coalescer,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.coalescer = coalescer
+        self._tasks: Set[asyncio.Task] = set()
+        self._open: Dict[str, List[Dict[str, Any]]] = {}
+        self._wakeup = asyncio.Event()
+        self._last_prune = 0.0
+        self.claimed = 0
+        self.completed = 0
+        self.retried = 0
+        self.dead = 0
+
+    async def run(self, stop: asyncio.Event, once: bool = False) -> None:
+        """Process jobs until `stop` is set (or, with `once`, until the queue is empty)"""
+        customer_locks.check_capacity(self.concurrency)
+        logger.info("Started: batch_size=%d, concurrency=%d", self.batch_size, self.concurrency)
+        while not stop.is_set():
+            jobs = await self._claim()
+            for job in jobs:
+                self._dispatch(job)
+            if once and not jobs and not self._tasks:
+                break
+            if not jobs:
+                await self._prune()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+        if self._tasks:
+            logger.info("Stopping: waiting for %d in-flight turn(s)", len(self._tasks))
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        logger.info("Stopped", extra=self.stats())
+
+    async def _claim(self) -> List[Dict[str, Any]]:
+        free = self.concurrency - len(self._tasks)
+        if free <= 0:
+            return []
+        try:
+            jobs = await JobQueries.claim(min(self.batch_size, free), self.visibility_timeout)
+        except Exception as e:
+            logger.error("Claim failed: %s: %s", type(e).__name__, e)
+            return []
+        dead = [job for job in jobs if job["status"] == "dead"]
+        if dead:
+            self.dead += len(dead)
+            logger.warning("Jobs %s dead-lettered: their last attempt's claim lapsed", [job["id"] for job in dead])
+            jobs = [job for job in jobs if job["status"] != "dead"]
+        self.claimed += len(jobs)
+        return jobs
+
+    def _dispatch(self, job: Dict[str, Any]) -> None:
+        if job["kind"] != INCOMING_MESSAGE:
+            self._spawn(self._fail([job], f"unknown job kind {job['kind']!r}"))
+            return
+
+        payload = job["payload"]
+        phone_number = payload["phone_number"]
+        if payload.get("reply_id"):
+            # List/button taps are answered on their own, outside the coalescer
+            self._spawn(self._run_jobs(phone_number, [job], handle_turn(
+                phone_number, payload["message_text"], payload["message_id"], reply_id=payload["reply_id"])))
+            return
+        batch = self.coalescer.add(phone_number, payload["message_text"], payload["message_id"])
+        if batch is None:
+            # Joined the customer's pending batch; finished together with it
+            self._open[phone_number].append(job)
+            return
+        jobs = self._open[phone_number] = [job]
+        self._spawn(self._run_batch(phone_number, batch, jobs))
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._wakeup.set()
+
+    async def _run_batch(self, phone_number: str, batch, jobs: List[Dict[str, Any]]) -> None:
+        async def turn(key: str, text: str, message_id: str) -> None:
+            # The batch is closed: later messages from this customer open a new one
+            if self._open.get(key) is jobs:
+                del self._open[key]
+            await handle_turn(key, text, message_id)
+
+        await self._run_jobs(phone_number, jobs, self.coalescer.run(phone_number, batch, turn))
+
+    async def _run_jobs(self, phone_number: str, jobs: List[Dict[str, Any]], turn) -> None:
+        """Await the `turn` coroutine answering `jobs`, then complete them (or schedule their retry)"""
+        heartbeat = asyncio.create_task(self._heartbeat(jobs))
+        try:
+            await turn
+        except Exception as e:
+            heartbeat.cancel()
+            logger.error("Turn failed for %s (%d job(s)): %s: %s", phone_number, len(jobs), type(e).__name__, e)
+            await self._fail(jobs, f"{type(e).__name__}: {e}")
+            return
+        except BaseException:
+            heartbeat.cancel()
+            raise
+        heartbeat.cancel()
+        try:
+            await JobQueries.complete([job["id"] for job in jobs])
+            self.completed += len(jobs)
+        except Exception as e:
+            # The jobs will be claimed again after the visibility timeout
+            logger.error("Could not mark jobs %s done: %s: %s", [job["id"] for job in jobs], type(e).__name__, e)
+
+    async def _heartbeat(self, jobs: List[Dict[str, Any]]) -> None:
+        """
+        While a turn runs, push back its jobs' visibility timeout every third of
+        it, so a slow turn (Claude, a lock wait, send backoff) isn't claimed
+        and answered again by another worker. `jobs` may grow while it runs
+        (coalesced messages join it).
+        """
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            ids = [job["id"] for job in jobs]
+            try:
+                running = await JobQueries.extend(ids, self.visibility_timeout)
+            except Exception as e:
+                logger.warning("Heartbeat failed for jobs %s: %s: %s", ids, type(e).__name__, e)
+                continue
+            if len(running) < len(ids):
+                logger.warning("Jobs %s are no longer running (reclaimed?)", sorted(set(ids) - set(running)))
+
+    async def _fail(self, jobs: List[Dict[str, Any]], error: str) -> None:
+        for job in jobs:
+            delay = backoff_delay(job["attempts"])
+            try:
+                result = await JobQueries.fail(job["id"], error[:1000], delay)
+            except Exception as e:
+                logger.error("Could not reschedule job %s: %s: %s", job["id"], type(e).__name__, e)
+                continue
+            if result["status"] == "dead":
+                self.dead += 1
+                logger.warning("Job %s dead-lettered after %d attempt(s): %s", job["id"], result["attempts"], error)
+            else:
+                self.retried += 1
+                logger.info("Job %s retry %d/%d in %.1fs", job["id"], result["attempts"], job["max_attempts"], delay)
+
+    async def _prune(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        try:
+            deleted = await JobQueries.prune(JOB_RETENTION)
+        except Exception as e:
+            logger.error("Prune failed: %s: %s", type(e).__name__, e)
+            return
+        if deleted:
+            logger.info("Pruned %d finished job(s)", deleted)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._tasks),
+            "claimed": self.claimed,
+            "completed": self.completed,
+            "retried": self.retried,
+            "dead": self.dead,
+        }
@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import List, Optional
 
 # Anthropic
 ANTHROPIC_API_KEY: str = os.environ.get("ANTHROPIC_API_KEY", "")
@@ -8,7 +8,168 @@ ANTHROPIC_API_KEY: str = os.environ.get("ANTHROPIC_API_KEY", "")
 WHATSAPP_ACCESS_TOKEN: str = os.environ.get("WHATSAPP_ACCESS_TOKEN", "")
 WHATSAPP_PHONE_NUMBER_ID: str = os.environ.get("WHATSAPP_PHONE_NUMBER_ID", "")
 WHATSAPP_VERIFY_TOKEN: str = os.environ.get("WHATSAPP_VERIFY_TOKEN", "")
-WHATSAPP_API_URL: str = "https://graph.facebook.com/v18.0"
+# Meta app secret; when set, webhook POSTs must carry a valid X-Hub-Signature-256
+WHATSAPP_APP_SECRET: str = os.environ.get("WHATSAPP_APP_SECRET", "")
+# Graph API base URL (overridable to point at a local stand-in, e.g. scripts/bench_e2e.py)
+WHATSAPP_API_URL: str = os.environ.get("WHATSAPP_API_URL", "https://graph.facebook.com/v18.0")
+
+# Outbound HTTP client (shared, keep-alive) for the Graph API
+WHATSAPP_HTTP2: bool = os.environ.get("WHATSAPP_HTTP2", "true").lower() in ("1", "true", "yes")
+WHATSAPP_HTTP_MAX_CONNECTIONS: int = int(os.environ.get("WHATSAPP_HTTP_MAX_CONNECTIONS", "20"))
+WHATSAPP_HTTP_MAX_KEEPALIVE: int = int(os.environ.get("WHATSAPP_HTTP_MAX_KEEPALIVE", "10"))
+WHATSAPP_HTTP_KEEPALIVE_EXPIRY: float = float(os.environ.get("WHATSAPP_HTTP_KEEPALIVE_EXPIRY", "60"))
+WHATSAPP_HTTP_TIMEOUT: float = float(os.environ.get("WHATSAPP_HTTP_TIMEOUT", "10"))
+WHATSAPP_HTTP_CONNECT_TIMEOUT: float = float(os.environ.get("WHATSAPP_HTTP_CONNECT_TIMEOUT", "5"))
+
+# Outbound pacing and retries for Graph API calls: WHATSAPP_SEND_RATE calls/s
+# per phone number ID (bursts of SEND_BURST) and RECIPIENT_RATE messages/s per
+# customer (bursts of RECIPIENT_BURST); 0 disables a limit. 429s, 5xx and
+# rate-limit errors are retried up to MAX_RETRIES times, honoring Retry-After
+# or else backing off exponentially with jitter from BACKOFF_BASE seconds (at
+# most BACKOFF_MAX); a Retry-After over RETRY_AFTER_MAX seconds fails the send
+WHATSAPP_SEND_RATE: float = float(os.environ.get("WHATSAPP_SEND_RATE", "80"))
+WHATSAPP_SEND_BURST: float = float(os.environ.get("WHATSAPP_SEND_BURST", "80"))
+WHATSAPP_RECIPIENT_RATE: float = float(os.environ.get("WHATSAPP_RECIPIENT_RATE", "1"))
+WHATSAPP_RECIPIENT_BURST: float = float(os.environ.get("WHATSAPP_RECIPIENT_BURST", "5"))
+WHATSAPP_SEND_MAX_RETRIES: int = int(os.environ.get("WHATSAPP_SEND_MAX_RETRIES", "4"))
+WHATSAPP_SEND_BACKOFF_BASE: float = float(os.environ.get("WHATSAPP_SEND_BACKOFF_BASE", "0.5"))
+WHATSAPP_SEND_BACKOFF_MAX: float = float(os.environ.get("WHATSAPP_SEND_BACKOFF_MAX", "30"))
+WHATSAPP_SEND_RETRY_AFTER_MAX: float = float(os.environ.get("WHATSAPP_SEND_RETRY_AFTER_MAX", "60"))
 
 # Database
 POSTGRES_URL: str = os.environ.get("POSTGRES_URL", "")
+# Query pool size and how long an idle connection is kept (seconds, 0 = forever)
+DB_POOL_MIN_SIZE: int = int(os.environ.get("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE: int = int(os.environ.get("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_MAX_INACTIVE_LIFETIME: float = float(os.environ.get("DB_POOL_MAX_INACTIVE_LIFETIME", "300"))
+# Set when POSTGRES_URL goes through pgbouncer in transaction mode (e.g. a Neon
+# "-pooler" host without prepared statement support): disables the statement
+# cache and makes the customer advisory locks transaction-scoped (see
+# lib/agent/locks.py)
+DB_PGBOUNCER: bool = os.environ.get("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+# Decode/encode JSON and JSONB columns with orjson when it is installed
+DB_ORJSON: bool = os.environ.get("DB_ORJSON", "true").lower() in ("1", "true", "yes")
+
+# Durable job queue: when enabled the webhook only inserts a job per message
+# and `python api/worker.py` processes them (claimed JOB_BATCH_SIZE at a time,
+# at most JOB_CONCURRENCY turns at once). The worker extends a running job's
+# claim every JOB_VISIBILITY_TIMEOUT / 3 seconds; a job whose claim lapses (its
+# worker died) is handed to another worker. Failures are retried with
+# exponential backoff and dead-lettered after JOB_MAX_ATTEMPTS
+JOB_QUEUE: bool = os.environ.get("JOB_QUEUE", "false").lower() in ("1", "true", "yes")
+JOB_BATCH_SIZE: int = int(os.environ.get("JOB_BATCH_SIZE", "10"))
+JOB_CONCURRENCY: int = int(os.environ.get("JOB_CONCURRENCY", "20"))
+JOB_VISIBILITY_TIMEOUT: float = float(os.environ.get("JOB_VISIBILITY_TIMEOUT", "300"))
+JOB_MAX_ATTEMPTS: int = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE: float = float(os.environ.get("JOB_BACKOFF_BASE", "5"))
+JOB_BACKOFF_MAX: float = float(os.environ.get("JOB_BACKOFF_MAX", "600"))
+JOB_POLL_INTERVAL: float = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+JOB_RETENTION: float = float(os.environ.get("JOB_RETENTION", str(7 * 24 * 3600)))
+
+# Drop Meta redeliveries by message ID: IDs seen in the last DEDUP_WINDOW
+# seconds are remembered in-process (at most DEDUP_MAX_ENTRIES), and with
+# DEDUP_DB each ID is also claimed once in Postgres (kept DEDUP_RETENTION seconds)
+DEDUP_WINDOW: float = float(os.environ.get("DEDUP_WINDOW", "3600"))
+DEDUP_MAX_ENTRIES: int = int(os.environ.get("DEDUP_MAX_ENTRIES", "50000"))
+DEDUP_DB: bool = os.environ.get("DEDUP_DB", "true").lower() in ("1", "true", "yes")
+DEDUP_RETENTION: float = float(os.environ.get("DEDUP_RETENTION", str(7 * 24 * 3600)))
+
+# Per-customer ordering across instances: Postgres advisory locks and the
+# seconds to wait for one before processing anyway. Each running turn holds one
+# connection of a separate pool of CUSTOMER_LOCK_POOL_SIZE (default
+# JOB_CONCURRENCY); the worker refuses to start with a smaller pool
+CUSTOMER_ADVISORY_LOCKS: bool = os.environ.get("CUSTOMER_ADVISORY_LOCKS", "true").lower() in ("1", "true", "yes")
+CUSTOMER_LOCK_POOL_SIZE: int = int(os.environ.get("CUSTOMER_LOCK_POOL_SIZE", str(JOB_CONCURRENCY)))
+CUSTOMER_LOCK_TIMEOUT: float = float(os.environ.get("CUSTOMER_LOCK_TIMEOUT", "120"))
+
+# In-process conversation cache (set TTL or entries to 0 to disable)
+CONVERSATION_CACHE_MAX_ENTRIES: int = int(os.environ.get("CONVERSATION_CACHE_MAX_ENTRIES", "1000"))
+CONVERSATION_CACHE_MAX_BYTES: int = int(os.environ.get("CONVERSATION_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CONVERSATION_CACHE_TTL: float = float(os.environ.get("CONVERSATION_CACHE_TTL", "300"))
+
+# Claude
+CLAUDE_MODEL: str = os.environ.get("CLAUDE_MODEL", "claude-sonnet-4-20250514")
+CLAUDE_PROMPT_CACHING: bool = os.environ.get("CLAUDE_PROMPT_CACHING", "true").lower() in ("1", "true", "yes")
+
+# Model tiering: messages of at most FAST_MAX_CHARS characters and
+# FAST_MAX_QUESTIONS question marks, with none of MAIN_KEYWORDS, are answered by
+# CLAUDE_FAST_MODEL; the rest by CLAUDE_MODEL. A fast answer failing one of the
+# ESCALATE_ON checks (empty, max_tokens, tool_error, tool_rounds: more than
+# FAST_MAX_TOOL_ROUNDS tool round trips) is redone on CLAUDE_MODEL
+MODEL_TIERING: bool = os.environ.get("MODEL_TIERING", "true").lower() in ("1", "true", "yes")
+CLAUDE_FAST_MODEL: str = os.environ.get("CLAUDE_FAST_MODEL", "claude-3-5-haiku-20241022")
+MODEL_TIER_FAST_MAX_CHARS: int = int(os.environ.get("MODEL_TIER_FAST_MAX_CHARS", "120"))
+MODEL_TIER_FAST_MAX_QUESTIONS: int = int(os.environ.get("MODEL_TIER_FAST_MAX_QUESTIONS", "1"))
+MODEL_TIER_FAST_MAX_TOOL_ROUNDS: int = int(os.environ.get("MODEL_TIER_FAST_MAX_TOOL_ROUNDS", "1"))
+MODEL_TIER_MAIN_KEYWORDS: List[str] = [
+    keyword.strip()
+    for keyword in os.environ.get(
+        "MODEL_TIER_MAIN_KEYWORDS",
+        "por que,porque,diferencia,comparar,compara,conviene,recomendas,recomendame,"
+        "explicame,calcular,calcula,cuanto necesito,reemplazar,sustituir,reclamo,problema",
+    ).split(",")
+    if keyword.strip()
+]
+MODEL_TIER_ESCALATE_ON: List[str] = [
+    check.strip()
+    for check in os.environ.get("MODEL_TIER_ESCALATE_ON", "empty,max_tokens,tool_error,tool_rounds").split(",")
+    if check.strip()
+]
+
+# Stream replies and deliver them as several WhatsApp messages, cut at
+# paragraph breaks (segments shorter than MIN_CHARS wait for more text) or,
+# past MAX_CHARS, at the last sentence
+CLAUDE_STREAMING: bool = os.environ.get("CLAUDE_STREAMING", "true").lower() in ("1", "true", "yes")
+STREAM_SEGMENT_MIN_CHARS: int = int(os.environ.get("STREAM_SEGMENT_MIN_CHARS", "80"))
+STREAM_SEGMENT_MAX_CHARS: int = int(os.environ.get("STREAM_SEGMENT_MAX_CHARS", "1500"))
+
+# Recipe catalog: seconds between mtime checks for hot reload (0 disables),
+# and whether to load the compiled binary snapshot when it matches the JSON
+RECIPES_RELOAD_INTERVAL: float = float(os.environ.get("RECIPES_RELOAD_INTERVAL", "30"))
+RECIPES_USE_SNAPSHOT: bool = os.environ.get("RECIPES_USE_SNAPSHOT", "true").lower() in ("1", "true", "yes")
+
+# Debounce window (seconds) for bursts of messages from one customer: messages
+# arriving within WINDOW of each other are answered in a single turn, started
+# at most MAX_WAIT seconds after the first one (WINDOW=0 disables)
+COALESCE_WINDOW: float = float(os.environ.get("COALESCE_WINDOW", "2.0"))
+COALESCE_MAX_WAIT: float = float(os.environ.get("COALESCE_MAX_WAIT", "6.0"))
+COALESCE_MAX_MESSAGES: int = int(os.environ.get("COALESCE_MAX_MESSAGES", "10"))
+
+# History sent to Claude: the last HISTORY_MAX_MESSAGES messages are loaded and
+# the newest that fit in HISTORY_TOKEN_BUDGET input tokens are kept (counted
+# locally; HISTORY_EXACT_TOKENS double-checks with Anthropic's token counting
+# endpoint at the cost of one extra request per turn)
+HISTORY_MAX_MESSAGES: int = int(os.environ.get("HISTORY_MAX_MESSAGES", "30"))
+HISTORY_TOKEN_BUDGET: int = int(os.environ.get("HISTORY_TOKEN_BUDGET", "700"))
+HISTORY_EXACT_TOKENS: bool = os.environ.get("HISTORY_EXACT_TOKENS", "false").lower() in ("1", "true", "yes")
+
+# Rolling conversation summary: after a turn, once SUMMARY_TRIGGER_MESSAGES
+# unsummarized messages fell out of its history window (0 disables), everything
+# older than the window is folded into conversations.summary in the background
+# by SUMMARY_MODEL. Only unsummarized messages are loaded as history; until a
+# fold, up to that many messages are in neither the window nor the summary
+SUMMARY_TRIGGER_MESSAGES: int = int(os.environ.get("SUMMARY_TRIGGER_MESSAGES", "10"))
+SUMMARY_MODEL: str = os.environ.get("SUMMARY_MODEL", "claude-3-5-haiku-20241022")
+SUMMARY_MAX_TOKENS: int = int(os.environ.get("SUMMARY_MAX_TOKENS", "400"))
+
+# Answer unambiguous catalog requests ("lista de recetas", "receta 12", an exact
+# recipe name) from the recipe data without calling Claude; INTENT_ROUTER_INTENTS
+# picks which of list_recipes, recipe_by_id and recipe_by_name are routed
+INTENT_ROUTER: bool = os.environ.get("INTENT_ROUTER", "true").lower() in ("1", "true", "yes")
+INTENT_ROUTER_INTENTS: List[str] = [
+    intent.strip()
+    for intent in os.environ.get("INTENT_ROUTER_INTENTS", "list_recipes,recipe_by_id,recipe_by_name").split(",")
+    if intent.strip()
+]
+# Send routed recipe listings as WhatsApp interactive lists (pages of
+# INTERACTIVE_LIST_PAGE_SIZE recipes, at most 9); a tapped row is answered by the router too
+INTERACTIVE_LISTS: bool = os.environ.get("INTERACTIVE_LISTS", "true").lower() in ("1", "true", "yes")
+INTERACTIVE_LIST_PAGE_SIZE: int = int(os.environ.get("INTERACTIVE_LIST_PAGE_SIZE", "9"))
+
+# Logging: minimum level (DEBUG logs message bodies and Claude replies) and
+# format ("text" for [PREFIX] lines, "json" for one structured object per line)
+LOG_LEVEL: str = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT: str = os.environ.get("LOG_FORMAT", "text").lower()
+
+# Default per-tool execution timeout in seconds
+TOOL_TIMEOUT: float = float(os.environ.get("TOOL_TIMEOUT", "10"))
@@ -0,0 +1,220 @@
+"""Immutable, compact recipe catalog with JSON and binary snapshot loaders"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+from lib.data.search import RecipeIndex
+
+# Bump when Recipe/Ingredient/RecipeIndex layout changes; stale snapshots are ignored
+SNAPSHOT_FORMAT = 1
+
+_MISSING = object()
+
+
+class Ingredient(NamedTuple):
+    """One ingredient line; names and units are interned across the catalog"""
+    nombre: str
+    cantidad: Any = None
+    unidad: Optional[str] = None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+
+class Recipe:
+    """
+    Compact, read-only recipe record.
+
+    Exposes a dict-like `get`/`[]` over the original JSON keys so rendering and
+    search code can treat it like the parsed JSON object it replaces.
+    """
+
+    __slots__ = (
+        "id", "nombre", "rendimiento", "procedimiento", "nota",
+        "sabores", "variantes", "relleno", "ingredient_groups", "extra",
+    )
+
+    _SCALAR_KEYS = ("id", "nombre", "rendimiento", "procedimiento", "nota", "sabores", "variantes", "relleno")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.id = data.get("id")
+        self.nombre = _intern(data.get("nombre"))
+        self.rendimiento = data.get("rendimiento")
+        self.procedimiento = data.get("procedimiento")
+        self.nota = data.get("nota")
+        self.sabores = tuple(_intern(s) for s in data["sabores"]) if data.get("sabores") else None
+        self.variantes = dict(data["variantes"]) if data.get("variantes") else None
+        self.relleno = _compact_relleno(data.get("relleno"))
+        self.ingredient_groups = {
+            key: tuple(_ingredient(ing) for ing in value)
+            for key, value in data.items()
+            if key.startswith("ingredientes") and isinstance(value, list)
+        }
+        self.extra = {
+            key: value
+            for key, value in data.items()
+            if key not in self._SCALAR_KEYS and key not in self.ingredient_groups
+        } or None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in Recipe._SCALAR_KEYS:
+            value = getattr(self, key)
+        elif key in self.ingredient_groups:
+            value = self.ingredient_groups[key]
+        elif self.extra and key in self.extra:
+            value = self.extra[key]
+        else:
+            value = None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __repr__(self) -> str:
+        return f"Recipe(id={self.id!r}, nombre={self.nombre!r})"
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _ingredient(data: Any) -> Ingredient:
+    if isinstance(data, dict):
+        return Ingredient(_intern(data.get("nombre", "")), data.get("cantidad"), _intern(data.get("unidad")))
+    return Ingredient(_intern(str(data)))
+
+
+def _compact_relleno(relleno: Any) -> Any:
+    if isinstance(relleno, list):
+        return tuple(_intern(item) for item in relleno)
+    if isinstance(relleno, dict):
+        return {key: tuple(_intern(v) for v in value) if isinstance(value, list) else value for key, value in relleno.items()}
+    return relleno
+
+
+class RecipeCatalog:
+    """
+    One immutable version of the recipe catalog plus everything derived from it.
+
+    Rendered output is memoized on the catalog itself, so swapping in a new
+    catalog invalidates it without any coordination with readers.
+    """
+
+    def __init__(
+        self,
+        recipes: Tuple[Recipe, ...],
+        metadata: Dict[str, Any],
+        version: str,
+        index: Optional[RecipeIndex] = None,
+        mtime: float = 0.0,
+        source: Optional[Tuple[int, int]] = None,
+    ):
+        self.recipes = recipes
+        self.metadata = metadata
+        self.version = version
+        self.mtime = mtime
+        # (st_mtime_ns, st_size) of the JSON file it was built from
+        self.source = source
+        self.index = index if index is not None else RecipeIndex(list(recipes))
+        self.by_id: Dict[Any, Recipe] = {r.id: r for r in recipes if r.id is not None}
+        self.recipe_cards: Dict[Any, str] = {}
+        self.recipe_lists: "OrderedDict[Any, str]" = OrderedDict()
+
+    @classmethod
+    def empty(cls) -> "RecipeCatalog":
+        return cls((), {}, "empty")
+
+    @classmethod
+    def from_json_bytes(cls, raw: bytes, mtime: float = 0.0, source: Optional[Tuple[int, int]] = None) -> "RecipeCatalog":
+        data = json.loads(raw.decode("utf-8"))
+        recipes = tuple(Recipe(r) for r in data.get("recetas", []))
+        metadata = {
+            "panaderia": data.get("panaderia", ""),
+            "tipo": data.get("tipo", ""),
+            "total_recetas": data.get("total_recetas", len(recipes))
+        }
+        return cls(recipes, metadata, source_version(raw), mtime=mtime, source=source)
+
+    def to_snapshot(self) -> bytes:
+        payload = {
+            "format": SNAPSHOT_FORMAT,
+            "version": self.version,
+            "source": self.source,
+            "metadata": self.metadata,
+            "recipes": self.recipes,
+            "index": self.index,
+        }
+        return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_snapshot(cls, blob: bytes, mtime: float = 0.0) -> Optional["RecipeCatalog"]:
+        """Load a snapshot, or return None if it was written by an incompatible version"""
+        try:
+            payload = pickle.loads(blob)
+        except Exception:
+            return None
+        if not isinstance(payload, dict) or payload.get("format") != SNAPSHOT_FORMAT:
+            return None
+        source = payload.get("source")
+        return cls(payload["recipes"], payload["metadata"], payload["version"], payload["index"], mtime,
+                   tuple(source) if source else None)
+
+
+def source_version(raw: bytes) -> str:
+    """Content hash of the catalog JSON"""
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+def snapshot_path_for(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + ".snapshot"
+
+
+def load_catalog(json_path: str, use_snapshot: bool = True) -> RecipeCatalog:
+    """
+    Load the catalog from `json_path`, preferring a matching binary snapshot.
+
+    The snapshot is used only when it was compiled from the same JSON: if the
+    file's mtime and size match the ones recorded in the snapshot the JSON is
+    not read at all, otherwise its content hash is compared (e.g. after a
+    checkout touched the file). Raises FileNotFoundError / ValueError like the
+    JSON parse it replaces.
+    """
+    stat = os.stat(json_path)
+    source = (stat.st_mtime_ns, stat.st_size)
+    catalog = None
+    if use_snapshot:
+        try:
+            with open(snapshot_path_for(json_path), "rb") as f:
+                catalog = RecipeCatalog.from_snapshot(f.read(), stat.st_mtime)
+        except FileNotFoundError:
+            pass
+        if catalog is not None and catalog.source == source:
+            return catalog
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    if catalog is not None and catalog.version == source_version(raw):
+        return catalog
+    return RecipeCatalog.from_json_bytes(raw, stat.st_mtime, source)
+
+
+def compile_snapshot(json_path: str, snapshot_path: Optional[str] = None) -> str:
+    """Compile the catalog JSON (records + search index) into a binary snapshot"""
+    snapshot_path = snapshot_path or snapshot_path_for(json_path)
+    catalog = load_catalog(json_path, use_snapshot=False)
+    tmp_path = f"{snapshot_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(catalog.to_snapshot())
+    os.replace(tmp_path, snapshot_path)
+    return snapshot_path
+
@@ -1,113 +1,185 @@
 """Recipes data loader from JSON file"""
 
-import json
 import os
+import threading
+import time
 from typing import List, Optional, Dict, Any
+from lib.config import RECIPES_RELOAD_INTERVAL, RECIPES_USE_SNAPSHOT
+from lib.data.catalog import RecipeCatalog, load_catalog
+from lib.logger import get_logger
+
+logger = get_logger("recipes")
+
+# Rendered result lists kept per catalog version (the full listing is always kept)
+RENDER_CACHE_MAX_LISTS = 256
+
+# Path relative to whatsapp-agent/ root
+RECIPES_JSON_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "data",
+    "recetas2025.json"
+)
 
 
 class RecipesData:
-    """Load and query recipes from JSON file"""
+    """
+    Load and query recipes from JSON file.
+
+    The catalog is an immutable RecipeCatalog. Every RECIPES_RELOAD_INTERVAL
+    seconds the JSON file's mtime is checked; when it changed, a new catalog is
+    built on a background thread and swapped in with a single assignment, so
+    in-flight requests keep using the catalog they started with.
+    """
 
     _instance = None
-    _recipes: List[Dict[str, Any]] = []
-    _metadata: Dict[str, Any] = {}
+    _catalog: RecipeCatalog = RecipeCatalog.empty()
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._json_path = RECIPES_JSON_PATH
+            cls._instance._reload_lock = threading.Lock()
+            cls._instance._next_check = 0.0
             cls._instance._load_recipes()
         return cls._instance
 
     def _load_recipes(self):
-        """Load recipes from JSON file"""
-        # Path relative to whatsapp-agent/ root
-        json_path = os.path.join(
-            os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-            "data",
-            "recetas2025.json"
-        )
-
+        """Load recipes from JSON file (or its compiled snapshot)"""
+        json_path = self._json_path
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                self._recipes = data.get("recetas", [])
-                self._metadata = {
-                    "panaderia": data.get("panaderia", ""),
-                    "tipo": data.get("tipo", ""),
-                    "total_recetas": data.get("total_recetas", len(self._recipes))
-                }
+            self._catalog = load_catalog(json_path, use_snapshot=RECIPES_USE_SNAPSHOT)
         except FileNotFoundError:
-            print(f"Warning: Recipes file not found at {json_path}")
-            self._recipes = []
-            self._metadata = {}
-        except json.JSONDecodeError as e:
-            print(f"Warning: Error parsing recipes JSON: {e}")
-            self._recipes = []
-            self._metadata = {}
+            logger.warning("Recipes file not found at %s", json_path)
+            self._catalog = RecipeCatalog.empty()
+        except ValueError as e:
+            logger.warning("Error parsing recipes JSON: %s", e)
+            self._catalog = RecipeCatalog.empty()
+        self._next_check = time.monotonic() + RECIPES_RELOAD_INTERVAL
+
+    @property
+    def catalog(self) -> RecipeCatalog:
+        """Current catalog, scheduling a background reload if the file changed"""
+        if RECIPES_RELOAD_INTERVAL > 0 and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + RECIPES_RELOAD_INTERVAL
+            self._check_for_update()
+        return self._catalog
+
+    def _check_for_update(self) -> None:
+        try:
+            mtime = os.stat(self._json_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._catalog.mtime or not self._reload_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._reload_in_background, daemon=True).start()
+
+    def _reload_in_background(self) -> None:
+        try:
+            catalog = load_catalog(self._json_path, use_snapshot=RECIPES_USE_SNAPSHOT)
+        except (OSError, ValueError) as e:
+            logger.warning("Recipes reload failed, keeping version %s: %s", self._catalog.version, e)
+        else:
+            if catalog.version != self._catalog.version or catalog.mtime != self._catalog.mtime:
+                logger.info("Recipes catalog reloaded: %s -> %s", self._catalog.version, catalog.version)
+                self._catalog = catalog
+        finally:
+            self._reload_lock.release()
+
+    def reload(self) -> RecipeCatalog:
+        """Synchronously reload the catalog from disk and swap it in"""
+        with self._reload_lock:
+            self._load_recipes()
+        return self._catalog
+
+    @property
+    def version(self) -> str:
+        """Content hash of the loaded catalog; rendered output is keyed by it"""
+        return self.catalog.version
 
     def get_all_recipes(self) -> List[Dict[str, Any]]:
         """Get all recipes"""
-        return self._recipes
+        return list(self.catalog.recipes)
 
     def get_recipe_by_id(self, recipe_id: int) -> Optional[Dict[str, Any]]:
         """Get a recipe by its ID"""
-        for recipe in self._recipes:
-            if recipe.get("id") == recipe_id:
-                return recipe
-        return None
+        return self.catalog.by_id.get(recipe_id)
 
     def get_recipe_by_name(self, name: str) -> Optional[Dict[str, Any]]:
-        """Get a recipe by name (case insensitive partial match)"""
-        name_lower = name.lower()
-        for recipe in self._recipes:
-            if name_lower in recipe.get("nombre", "").lower():
-                return recipe
-        return None
-
-    def search_recipes(self, query: str) -> List[Dict[str, Any]]:
-        """Search recipes by name or ingredients"""
-        query_lower = query.lower()
-        results = []
-
-        for recipe in self._recipes:
-            # Search in name
-            if query_lower in recipe.get("nombre", "").lower():
-                results.append(recipe)
-                continue
-
-            # Search in ingredients
-            ingredientes = recipe.get("ingredientes", [])
-            for ing in ingredientes:
-                if query_lower in ing.get("nombre", "").lower():
-                    results.append(recipe)
-                    break
-
-        return results
+        """Get a recipe by name (accent/case insensitive, tolerant to typos)"""
+        catalog = self.catalog
+        doc = catalog.index.find_by_name(name)
+        return catalog.recipes[doc] if doc is not None else None
+
+    def get_recipe_by_exact_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """Get a recipe whose name matches exactly (accent/case/punctuation insensitive, no typos)"""
+        catalog = self.catalog
+        doc = catalog.index.find_exact_name(name)
+        return catalog.recipes[doc] if doc is not None else None
+
+    def search_recipes(self, query: str, limit: Optional[int] = 10) -> List[Dict[str, Any]]:
+        """Search recipes by name or ingredients, best matches first"""
+        catalog = self.catalog
+        return [catalog.recipes[doc] for doc, _ in catalog.index.search(query, limit)]
 
     def get_recipe_names(self) -> List[str]:
         """Get list of all recipe names"""
-        return [r.get("nombre", "") for r in self._recipes if r.get("nombre")]
+        return [r.get("nombre", "") for r in self.catalog.recipes if r.get("nombre")]
 
     def get_metadata(self) -> Dict[str, Any]:
         """Get recipes metadata (bakery name, type, count)"""
-        return self._metadata
+        return self.catalog.metadata
 
     def format_recipe(self, recipe: Dict[str, Any]) -> str:
-        """Format a recipe for display"""
+        """Format a recipe for display (memoized per recipe ID on the current catalog)"""
         if not recipe:
             return "Receta no encontrada"
 
-        result = f"🍞 {recipe.get('nombre', 'Sin nombre')}\n"
-        result += "=" * 30 + "\n\n"
+        catalog = self.catalog
+        recipe_id = recipe.get("id")
+        if recipe_id is None or catalog.by_id.get(recipe_id) is not recipe:
+            return self._render_recipe(recipe)
+
+        card = catalog.recipe_cards.get(recipe_id)
+        if card is None:
+            card = catalog.recipe_cards[recipe_id] = self._render_recipe(recipe)
+        return card
+
+    def format_recipe_list(self, recipes: List[Dict[str, Any]] = None) -> str:
+        """Format a list of recipes (names only, memoized per result set on the current catalog)"""
+        catalog = self.catalog
+        if recipes is None:
+            recipes = catalog.recipes
+            key = None
+        else:
+            key = tuple(r.get("id") for r in recipes)
+
+        if not recipes:
+            return "No hay recetas disponibles"
+
+        listing = catalog.recipe_lists.get(key)
+        if listing is not None:
+            catalog.recipe_lists.move_to_end(key)
+            return listing
+
+        listing = self._render_recipe_list(recipes)
+        if key is None or all(r.get("id") is not None and catalog.by_id.get(r["id"]) is r for r in recipes):
+            catalog.recipe_lists[key] = listing
+            if len(catalog.recipe_lists) > RENDER_CACHE_MAX_LISTS:
+                catalog.recipe_lists.popitem(last=False)
+        return listing
+
+    @staticmethod
+    def _render_recipe(recipe: Dict[str, Any]) -> str:
+        """Build the recipe card text"""
+        parts = [f"🍞 {recipe.get('nombre', 'Sin nombre')}\n", "=" * 30 + "\n\n"]
 
         if recipe.get("rendimiento"):
-            result += f"📊 Rendimiento: {recipe['rendimiento']}\n\n"
+            parts.append(f"📊 Rendimiento: {recipe['rendimiento']}\n\n")
 
         # Ingredients — names only, no quantities (confidential)
-        result += "📝 INGREDIENTES:\n"
-        ingredientes = recipe.get("ingredientes", [])
-        for ing in ingredientes:
-            result += f"  • {ing.get('nombre', '')}\n"
+        parts.append("📝 INGREDIENTES:\n")
+        for ing in recipe.get("ingredientes", []):
+            parts.append(f"  • {ing.get('nombre', '')}\n")
 
         # Additional ingredient lists — names only
         for key, label in [
@@ -117,58 +189,50 @@ class RecipesData:
             ("ingredientes_pastelera", "Ingredientes Pastelera"),
         ]:
             if recipe.get(key):
-                result += f"\n  {label}:\n"
+                parts.append(f"\n  {label}:\n")
                 for ing in recipe[key]:
-                    result += f"    • {ing.get('nombre', '')}\n"
+                    parts.append(f"    • {ing.get('nombre', '')}\n")
 
         # Relleno — names only
         if recipe.get("relleno"):
-            result += "\n🥧 RELLENO:\n"
+            parts.append("\n🥧 RELLENO:\n")
             relleno = recipe["relleno"]
-            if isinstance(relleno, list):
+            if isinstance(relleno, (list, tuple)):
                 for item in relleno:
-                    result += f"  • {item}\n"
+                    parts.append(f"  • {item}\n")
             elif isinstance(relleno, dict):
                 if relleno.get("ingredientes"):
-                    result += "  Ingredientes:\n"
+                    parts.append("  Ingredientes:\n")
                     for item in relleno["ingredientes"]:
-                        result += f"    • {item}\n"
+                        parts.append(f"    • {item}\n")
                 if relleno.get("condimentos"):
-                    result += "  Condimentos:\n"
+                    parts.append("  Condimentos:\n")
                     for item in relleno["condimentos"]:
-                        result += f"    • {item}\n"
+                        parts.append(f"    • {item}\n")
 
-        result += "\n⚠️ Las cantidades y el procedimiento son parte de nuestras fórmulas exclusivas.\n"
+        parts.append("\n⚠️ Las cantidades y el procedimiento son parte de nuestras fórmulas exclusivas.\n")
 
         # Variants
         if recipe.get("variantes"):
-            result += "\n🔄 VARIANTES:\n"
+            parts.append("\n🔄 VARIANTES:\n")
             for key, value in recipe["variantes"].items():
-                result += f"  • {key}: {value}\n"
+                parts.append(f"  • {key}: {value}\n")
 
         # Flavors
         if recipe.get("sabores"):
-            result += f"\n🎨 SABORES: {', '.join(recipe['sabores'])}\n"
+            parts.append(f"\n🎨 SABORES: {', '.join(recipe['sabores'])}\n")
 
         # Notes
         if recipe.get("nota"):
-            result += f"\n⚠️ NOTA: {recipe['nota']}\n"
-
-        return result
-
-    def format_recipe_list(self, recipes: List[Dict[str, Any]] = None) -> str:
-        """Format a list of recipes (names only)"""
-        if recipes is None:
-            recipes = self._recipes
-
-        if not recipes:
-            return "No hay recetas disponibles"
+            parts.append(f"\n⚠️ NOTA: {recipe['nota']}\n")
 
-        result = f"📚 RECETAS DISPONIBLES ({len(recipes)}):\n"
-        result += "=" * 30 + "\n\n"
+        return "".join(parts)
 
+    @staticmethod
+    def _render_recipe_list(recipes: List[Dict[str, Any]]) -> str:
+        """Build the recipe listing text"""
+        parts = [f"📚 RECETAS DISPONIBLES ({len(recipes)}):\n", "=" * 30 + "\n\n"]
         for recipe in recipes:
-            result += f"  {recipe.get('id', '?')}. {recipe.get('nombre', 'Sin nombre')}\n"
-
-        result += "\n💡 Para ver una receta, indica el nombre o número."
-        return result
+            parts.append(f"  {recipe.get('id', '?')}. {recipe.get('nombre', 'Sin nombre')}\n")
+        parts.append("\n💡 Para ver una receta, indica el nombre o número.")
+        return "".join(parts)
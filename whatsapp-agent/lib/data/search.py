@@ -0,0 +1,192 @@
+"""Accent-folded inverted index with fuzzy, BM25-ranked recipe search"""
+
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Ingredient lists indexed alongside the main "ingredientes"
+INGREDIENT_KEYS = (
+    "ingredientes",
+    "ingredientes_vainilla",
+    "ingredientes_chocolate",
+    "ingredientes_empaste",
+    "ingredientes_pastelera",
+    "ingredientes_armado",
+)
+
+STOPWORDS = frozenset({
+    "a", "al", "c", "con", "de", "del", "el", "en", "la", "las", "lo", "los",
+    "o", "para", "por", "s", "sin", "su", "un", "una", "y",
+})
+
+NAME_WEIGHT = 3.0
+PREFIX_WEIGHT = 0.8
+FUZZY_MIN_SIMILARITY = 0.3
+MIN_EXPANSION_LENGTH = 3
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", folded).strip()
+
+
+@lru_cache(maxsize=8192)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Normalized tokens of `text`, without stopwords (memoized: names repeat a lot)"""
+    return tuple(t for t in normalize(text).split() if t not in STOPWORDS)
+
+
+def trigrams(token: str) -> Set[str]:
+    """pg_trgm-style trigrams of a single token"""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def ingredient_names(recipe: Dict) -> Iterable[str]:
+    """All ingredient names of a recipe, across every ingredient list and the filling"""
+    for key in INGREDIENT_KEYS:
+        for ing in recipe.get(key) or []:
+            yield ing if isinstance(ing, str) else ing.get("nombre", "")
+    relleno = recipe.get("relleno")
+    if isinstance(relleno, (list, tuple)):
+        yield from (item for item in relleno if isinstance(item, str))
+    elif isinstance(relleno, dict):
+        for key in ("ingredientes", "condimentos"):
+            yield from (item for item in relleno.get(key) or [] if isinstance(item, str))
+
+
+class RecipeIndex:
+    """
+    Inverted index over recipe names and ingredient names, built once at load.
+
+    Query terms are matched exactly, by prefix (substring-like recall for
+    "choco" -> "chocolate") and, when neither hits, by trigram similarity to
+    tolerate typos. Results are ranked with BM25, names weighing more than
+    ingredients, and restricted to recipes matching every term when any do.
+    """
+
+    def __init__(self, recipes: List[Dict]):
+        self.size = len(recipes)
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._doc_lengths: List[float] = []
+        self._names: List[str] = []
+
+        for doc, recipe in enumerate(recipes):
+            name = recipe.get("nombre", "")
+            self._names.append(normalize(name))
+            weighted: Dict[str, float] = defaultdict(float)
+            for token in tokenize(name):
+                weighted[token] += NAME_WEIGHT
+            for ingredient in ingredient_names(recipe):
+                for token in tokenize(ingredient):
+                    weighted[token] += 1.0
+            for token, tf in weighted.items():
+                self._postings[token][doc] = tf
+            self._doc_lengths.append(sum(weighted.values()))
+
+        avg_length = (sum(self._doc_lengths) / self.size) if self.size else 0.0
+        # Store each posting's BM25 contribution so queries only add and rank
+        for token, docs in self._postings.items():
+            idf = math.log(1 + (self.size - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc, tf in docs.items():
+                norm = K1 * (1 - B + B * self._doc_lengths[doc] / avg_length)
+                docs[doc] = idf * tf * (K1 + 1) / (tf + norm)
+        self._postings = dict(self._postings)
+        self._name_lookup: Dict[str, int] = {}
+        for doc, recipe_name in enumerate(self._names):
+            self._name_lookup.setdefault(recipe_name, doc)
+        self._vocab = sorted(self._postings)
+        self._trigram_sizes: Dict[str, int] = {}
+        self._trigram_index: Dict[str, List[str]] = defaultdict(list)
+        for token in self._vocab:
+            grams = trigrams(token)
+            self._trigram_sizes[token] = len(grams)
+            for gram in grams:
+                self._trigram_index[gram].append(token)
+        self._trigram_index = dict(self._trigram_index)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Vocabulary tokens matching `term`, with a confidence weight each"""
+        expansions: Dict[str, float] = {}
+        if term in self._postings:
+            expansions[term] = 1.0
+        if len(term) >= MIN_EXPANSION_LENGTH:
+            i = bisect_left(self._vocab, term)
+            while i < len(self._vocab) and self._vocab[i].startswith(term):
+                expansions.setdefault(self._vocab[i], PREFIX_WEIGHT)
+                i += 1
+            if not expansions:
+                expansions = self._fuzzy(term)
+        return list(expansions.items())
+
+    def _fuzzy(self, term: str) -> Dict[str, float]:
+        """Vocabulary tokens whose trigram similarity to `term` passes the threshold"""
+        grams = trigrams(term)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for token in self._trigram_index.get(gram, ()):
+                shared[token] += 1
+        matches = {}
+        for token, count in shared.items():
+            similarity = count / (len(grams) + self._trigram_sizes[token] - count)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                matches[token] = similarity
+        return matches
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Return (recipe position, score) pairs, best first"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.size:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        matched_by_term: List[Set[int]] = []
+        for term in terms:
+            matched: Set[int] = set()
+            for token, weight in self._expand(term):
+                postings = self._postings[token]
+                for doc, score in postings.items():
+                    scores[doc] += weight * score
+                matched.update(postings)
+            matched_by_term.append(matched)
+
+        candidates = set.intersection(*matched_by_term) or scores.keys()
+        key = lambda doc: (-scores[doc], doc)  # noqa: E731
+        if limit is None:
+            ranked = sorted(candidates, key=key)
+        else:
+            ranked = heapq.nsmallest(limit, candidates, key=key)
+        return [(doc, scores[doc]) for doc in ranked]
+
+    def find_exact_name(self, name: str) -> Optional[int]:
+        """Recipe position whose name equals `name` once both are normalized"""
+        return self._name_lookup.get(normalize(name))
+
+    def find_by_name(self, name: str) -> Optional[int]:
+        """Best recipe position for a name: exact, then substring, then ranked name match"""
+        wanted = normalize(name)
+        if not wanted:
+            return None
+        if wanted in self._name_lookup:
+            return self._name_lookup[wanted]
+        for doc, recipe_name in enumerate(self._names):
+            if wanted in recipe_name:
+                return doc
+        expanded = {token for term in tokenize(name) for token, _ in self._expand(term)}
+        for doc, _ in self.search(name):
+            if expanded.intersection(self._names[doc].split()):
+                return doc
+        return None
@@ -1,46 +1,167 @@
 import json
-import asyncpg
-from lib.config import POSTGRES_URL
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+from lib.config import (
+    POSTGRES_URL,
+    CUSTOMER_LOCK_POOL_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MAX_INACTIVE_LIFETIME,
+    DB_PGBOUNCER,
+    DB_ORJSON,
+)
+from lib.logger import get_logger
 
-_pool: asyncpg.Pool | None = None
+# asyncpg is imported when the pool is first created (see get_pool)
+if TYPE_CHECKING:
+    import asyncpg
 
+logger = get_logger("db")
 
-async def _init_connection(conn: asyncpg.Connection):
+_pool: "asyncpg.Pool | None" = None
+_lock_pool: "asyncpg.Pool | None" = None
+_json_codec: Optional[Tuple[str, Callable[[Any], str], Callable[[str], Any]]] = None
+
+
+def _orjson_available() -> bool:
+    """orjson is optional; without it JSON columns use the stdlib json module."""
+    try:
+        import orjson  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_json_codec() -> Tuple[str, Callable[[Any], str], Callable[[str], Any]]:
+    """(name, encoder, decoder) for JSON/JSONB columns"""
+    global _json_codec
+    if _json_codec is None:
+        if DB_ORJSON and _orjson_available():
+            import orjson
+
+            _json_codec = ("orjson", lambda value: orjson.dumps(value).decode(), orjson.loads)
+        else:
+            if DB_ORJSON:
+                logger.warning("orjson package not installed, falling back to json for JSONB columns")
+            _json_codec = ("json", json.dumps, json.loads)
+    return _json_codec
+
+
+async def _init_connection(conn: "asyncpg.Connection"):
     """Register JSON/JSONB codecs so columns auto-decode to Python dicts/lists."""
+    _, encoder, decoder = _get_json_codec()
     await conn.set_type_codec(
         "jsonb",
-        encoder=json.dumps,
-        decoder=json.loads,
+        encoder=encoder,
+        decoder=decoder,
         schema="pg_catalog",
     )
     await conn.set_type_codec(
         "json",
-        encoder=json.dumps,
-        decoder=json.loads,
+        encoder=encoder,
+        decoder=decoder,
         schema="pg_catalog",
     )
 
 
-async def get_pool() -> asyncpg.Pool:
+def _dsn() -> str:
+    # Vercel provides postgres://, asyncpg requires postgresql://
+    dsn = POSTGRES_URL
+    if dsn.startswith("postgres://"):
+        dsn = dsn.replace("postgres://", "postgresql://", 1)
+    return dsn
+
+
+def _statement_cache_options() -> Dict[str, Any]:
+    if DB_PGBOUNCER:
+        # Transaction pooling hands each transaction to any server connection:
+        # only unnamed statements are safe
+        return {"statement_cache_size": 0}
+    # The SQL is a fixed set, so each connection prepares a statement on its
+    # first use and keeps it (asyncpg re-prepares it by itself after schema changes)
+    return {"max_cached_statement_lifetime": 0}
+
+
+async def get_pool() -> "asyncpg.Pool":
     """Return a lazily-created connection pool (singleton)."""
     global _pool
     if _pool is None:
-        dsn = POSTGRES_URL
-        # Vercel provides postgres://, asyncpg requires postgresql://
-        if dsn.startswith("postgres://"):
-            dsn = dsn.replace("postgres://", "postgresql://", 1)
-        _pool = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=5, init=_init_connection)
+        import asyncpg
+
+        _pool = await asyncpg.create_pool(
+            dsn=_dsn(),
+            min_size=min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            max_size=DB_POOL_MAX_SIZE,
+            max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+            init=_init_connection,
+            **_statement_cache_options(),
+        )
     return _pool
 
 
+async def get_lock_pool() -> "asyncpg.Pool":
+    """
+    Return the pool whose connections hold session-level advisory locks.
+
+    Kept apart from the query pool so a connection pinned by a lock holder can
+    never starve the queries that holder runs while locked.
+    """
+    global _lock_pool
+    if _lock_pool is None:
+        import asyncpg
+
+        _lock_pool = await asyncpg.create_pool(
+            dsn=_dsn(),
+            min_size=0,
+            max_size=CUSTOMER_LOCK_POOL_SIZE,
+            **({"statement_cache_size": 0} if DB_PGBOUNCER else {}),
+        )
+    return _lock_pool
+
+
 async def close_pool():
-    """Close the connection pool."""
-    global _pool
+    """Close the connection pools."""
+    global _pool, _lock_pool
+    if _lock_pool is not None:
+        await _lock_pool.close()
+        _lock_pool = None
     if _pool is not None:
         await _pool.close()
         _pool = None
 
 
+def pool_stats() -> Dict[str, Any]:
+    """Query pool occupancy and settings"""
+    return {
+        "size": _pool.get_size() if _pool is not None else 0,
+        "idle": _pool.get_idle_size() if _pool is not None else 0,
+        "min_size": DB_POOL_MIN_SIZE,
+        "max_size": DB_POOL_MAX_SIZE,
+        "pgbouncer": DB_PGBOUNCER,
+        "json_codec": _get_json_codec()[0],
+    }
+
+
+async def fetch(query: str, *args) -> List["asyncpg.Record"]:
+    """Run a query and return its rows as asyncpg Records (read like dicts: row["col"])."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetch(query, *args)
+
+
+async def fetchrow(query: str, *args) -> Optional["asyncpg.Record"]:
+    """Run a query and return its first row as a Record, or None."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchrow(query, *args)
+
+
+async def fetchval(query: str, *args) -> Any:
+    """Run a query and return the first column of its first row."""
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval(query, *args)
+
+
 async def execute_query(query: str, params: tuple = None, fetch_one: bool = False):
     """Execute a query and return results as list[dict] or dict."""
     pool = await get_pool()
@@ -1,3 +1,5 @@
 from .conversations import ConversationQueries
+from .jobs import JobQueries
+from .processed_messages import ProcessedMessageQueries
 
-__all__ = ["ConversationQueries"]
+__all__ = ["ConversationQueries", "JobQueries", "ProcessedMessageQueries"]
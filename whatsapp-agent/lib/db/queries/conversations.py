@@ -1,21 +1,125 @@
 from typing import Optional, List, Dict, Any
 from uuid import UUID
-import json
-from lib.db.connection import execute_query, execute_write
+from lib.db.connection import fetch, fetchrow, fetchval
 
+GET_BY_CUSTOMER = """
+    SELECT * FROM conversations
+    WHERE customer_id = $1
+    ORDER BY updated_at DESC
+    LIMIT 1
+"""
 
-def _ensure_list(messages) -> list:
-    """Safely parse messages that may be a str (legacy double-encoded) or list."""
-    if isinstance(messages, list):
-        return messages
-    if isinstance(messages, str):
-        try:
-            parsed = json.loads(messages)
-            if isinstance(parsed, list):
-                return parsed
-        except (json.JSONDecodeError, TypeError):
-            pass
-    return []
+CREATE = """
+    INSERT INTO conversations (customer_id, summary)
+    VALUES ($1, NULL)
+    RETURNING *
+"""
+
+ADD_MESSAGE = """
+    WITH inserted AS (
+        INSERT INTO conversation_messages (conversation_id, role, content)
+        VALUES ($1, $2, $3)
+        RETURNING *
+    ), touched AS (
+        UPDATE conversations SET updated_at = NOW() WHERE id = $1
+    )
+    SELECT * FROM inserted
+"""
+
+GET_RECENT_MESSAGES = """
+    SELECT role, content FROM (
+        SELECT m.id, m.role, m.content, m.created_at
+        FROM conversation_messages m
+        WHERE m.conversation_id = (
+            SELECT id FROM conversations
+            WHERE customer_id = $1
+            ORDER BY updated_at DESC
+            LIMIT 1
+        )
+        ORDER BY m.created_at DESC, m.id DESC
+        LIMIT $2
+    ) recent
+    ORDER BY created_at, id
+"""
+
+UPDATE_SUMMARY = """
+    UPDATE conversations
+    SET summary = $1, updated_at = NOW()
+    WHERE id = $2
+    RETURNING *
+"""
+
+GET_MESSAGES_TO_SUMMARIZE = """
+    SELECT m.id, m.role, m.content
+    FROM conversation_messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE m.conversation_id = $1
+      AND m.id > COALESCE(c.summarized_through, 0)
+      AND m.id < (
+          SELECT id FROM conversation_messages
+          WHERE conversation_id = $1
+          ORDER BY id DESC
+          OFFSET $2 - 1
+          LIMIT 1
+      )
+    ORDER BY m.id
+"""
+
+SAVE_SUMMARY = """
+    UPDATE conversations
+    SET summary = $2, summarized_through = $3
+    WHERE id = $1 AND COALESCE(summarized_through, 0) < $3
+    RETURNING id
+"""
+
+# Run on every turn
+LOAD_TURN_CONTEXT = """
+    WITH existing AS (
+        SELECT id, customer_id, summary, summarized_through, created_at, updated_at
+        FROM conversations
+        WHERE customer_id = $1
+        ORDER BY updated_at DESC
+        LIMIT 1
+    ), created AS (
+        INSERT INTO conversations (customer_id, summary)
+        SELECT $1, NULL
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        RETURNING id, customer_id, summary, summarized_through, created_at, updated_at
+    ), conversation AS (
+        SELECT * FROM existing
+        UNION ALL
+        SELECT * FROM created
+    )
+    SELECT c.*, COALESCE((
+        SELECT jsonb_agg(
+            jsonb_build_object('role', r.role, 'content', r.content)
+            ORDER BY r.created_at, r.id
+        )
+        FROM (
+            SELECT m.id, m.role, m.content, m.created_at
+            FROM conversation_messages m
+            WHERE m.conversation_id = c.id AND m.id > COALESCE(c.summarized_through, 0)
+            ORDER BY m.created_at DESC, m.id DESC
+            LIMIT $2
+        ) r
+    ), '[]'::jsonb) AS recent_messages, (
+        SELECT count(*)
+        FROM conversation_messages m
+        WHERE m.conversation_id = c.id AND m.id > COALESCE(c.summarized_through, 0)
+    ) AS unsummarized
+    FROM conversation c
+"""
+
+ADD_TURN = """
+    WITH inserted AS (
+        INSERT INTO conversation_messages (conversation_id, role, content)
+        VALUES ($1, 'user', $2), ($1, 'assistant', $3)
+        RETURNING id
+    ), touched AS (
+        UPDATE conversations SET updated_at = NOW() WHERE id = $1
+    )
+    SELECT count(*) AS inserted FROM inserted
+"""
 
 
 class ConversationQueries:
@@ -24,82 +128,67 @@ class ConversationQueries:
     @staticmethod
     async def get_by_customer(customer_id: UUID) -> Optional[Dict[str, Any]]:
         """Get conversation by customer ID"""
-        result = await execute_query(
-            """
-            SELECT * FROM conversations
-            WHERE customer_id = $1
-            ORDER BY updated_at DESC
-            LIMIT 1
-            """,
-            (str(customer_id),),
-            fetch_one=True
-        )
+        result = await fetchrow(GET_BY_CUSTOMER, str(customer_id))
         return dict(result) if result else None
 
     @staticmethod
     async def create(customer_id: UUID) -> Dict[str, Any]:
         """Create new conversation"""
-        result = await execute_write(
-            """
-            INSERT INTO conversations (customer_id, messages, summary)
-            VALUES ($1, $2, NULL)
-            RETURNING *
-            """,
-            (str(customer_id), [])
-        )
-        return dict(result)
+        return dict(await fetchrow(CREATE, str(customer_id)))
 
     @staticmethod
     async def add_message(conversation_id: UUID, role: str, content: str) -> Dict[str, Any]:
-        """Add message to conversation"""
-        # Get current messages
-        current = await execute_query(
-            "SELECT messages FROM conversations WHERE id = $1",
-            (str(conversation_id),),
-            fetch_one=True
-        )
-
-        messages = _ensure_list(current["messages"]) if current else []
-        messages.append({"role": role, "content": content})
-
-        # Keep only last 20 messages to manage context window
-        if len(messages) > 20:
-            messages = messages[-20:]
-
-        result = await execute_write(
-            """
-            UPDATE conversations
-            SET messages = $1, updated_at = NOW()
-            WHERE id = $2
-            RETURNING *
-            """,
-            (messages, str(conversation_id))
-        )
-        return dict(result)
+        """Append a message to a conversation (single round trip, no read-modify-write)"""
+        return dict(await fetchrow(ADD_MESSAGE, str(conversation_id), role, content))
 
     @staticmethod
     async def get_recent_messages(customer_id: UUID, limit: int = 10) -> List[Dict[str, str]]:
-        """Get recent messages for a customer"""
-        conversation = await ConversationQueries.get_by_customer(customer_id)
-        if not conversation:
-            return []
-
-        messages = _ensure_list(conversation.get("messages", []))
-        return messages[-limit:] if messages else []
+        """Get recent messages for a customer, oldest first"""
+        rows = await fetch(GET_RECENT_MESSAGES, str(customer_id), limit)
+        return [{"role": r["role"], "content": r["content"]} for r in rows]
 
     @staticmethod
     async def update_summary(conversation_id: UUID, summary: str) -> Dict[str, Any]:
         """Update conversation summary"""
-        result = await execute_write(
-            """
-            UPDATE conversations
-            SET summary = $1, updated_at = NOW()
-            WHERE id = $2
-            RETURNING *
-            """,
-            (summary, str(conversation_id))
-        )
-        return dict(result)
+        return dict(await fetchrow(UPDATE_SUMMARY, summary, str(conversation_id)))
+
+    @staticmethod
+    async def get_messages_to_summarize(conversation_id: UUID, keep: int) -> List[Any]:
+        """
+        Messages not yet folded into the summary, oldest first, leaving out the
+        newest `keep` messages of the conversation (they stay verbatim in the prompt).
+        Rows are Records with "id", "role" and "content".
+        """
+        return await fetch(GET_MESSAGES_TO_SUMMARIZE, str(conversation_id), keep)
+
+    @staticmethod
+    async def save_summary(conversation_id: UUID, summary: str, summarized_through: int) -> bool:
+        """
+        Store a summary covering messages up to `summarized_through`, unless a
+        summary covering as much or more was stored meanwhile. Returns whether it was stored.
+        """
+        stored = await fetchval(SAVE_SUMMARY, str(conversation_id), summary, summarized_through)
+        return stored is not None
+
+    @staticmethod
+    async def load_turn_context(customer_id: UUID, limit: int = 10) -> Dict[str, Any]:
+        """
+        Get or create the customer's conversation and its last `limit` messages
+        not yet folded into the summary, in a single round trip.
+
+        Returns:
+            {"conversation": {...}, "messages": [{"role", "content"}, ...]} (oldest first);
+            the conversation includes "unsummarized", the number of messages
+            not yet folded into its summary
+        """
+        conversation = dict(await fetchrow(LOAD_TURN_CONTEXT, str(customer_id), limit))
+        messages = conversation.pop("recent_messages") or []
+        return {"conversation": conversation, "messages": messages}
+
+    @staticmethod
+    async def add_turn(conversation_id: UUID, user_content: str, assistant_content: str) -> None:
+        """Append a user message and the assistant reply in one statement"""
+        await fetchval(ADD_TURN, str(conversation_id), user_content, assistant_content)
 
     @staticmethod
     async def get_or_create(customer_id: UUID) -> Dict[str, Any]:
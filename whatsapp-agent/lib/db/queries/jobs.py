@@ -0,0 +1,175 @@
+from typing import List, Dict, Any
+from lib.db.connection import execute_query, execute_write
+
+# last_error of a job dead-lettered because its last attempt's claim lapsed
+LAPSED_ERROR = "claim lapsed on the last attempt (worker died or hung)"
+
+
+class JobQueries:
+    """Durable job queue operations (table `jobs`)"""
+
+    @staticmethod
+    async def enqueue(kind: str, payloads: List[Dict[str, Any]], max_attempts: int) -> int:
+        """Insert one pending job per payload in a single statement; returns how many were queued"""
+        result = await execute_write(
+            """
+            WITH inserted AS (
+                INSERT INTO jobs (kind, payload, max_attempts)
+                SELECT $1, value, $3
+                FROM jsonb_array_elements($2::jsonb)
+                RETURNING id
+            )
+            SELECT count(*) AS queued FROM inserted
+            """,
+            (kind, payloads, max_attempts)
+        )
+        return result["queued"]
+
+    @staticmethod
+    async def enqueue_new_messages(kind: str, payloads: List[Dict[str, Any]], max_attempts: int) -> int:
+        """
+        Like enqueue(), but in the same statement claims each payload's
+        "message_id" in processed_messages and queues only the payloads whose
+        ID was not claimed before. Returns how many were queued.
+        """
+        result = await execute_write(
+            """
+            WITH incoming AS (
+                SELECT DISTINCT ON (value->>'message_id') value AS payload, value->>'message_id' AS message_id, ordinality
+                FROM jsonb_array_elements($2::jsonb) WITH ORDINALITY
+                ORDER BY value->>'message_id', ordinality
+            ), claimed AS (
+                INSERT INTO processed_messages (message_id)
+                SELECT message_id FROM incoming
+                ON CONFLICT (message_id) DO NOTHING
+                RETURNING message_id
+            ), inserted AS (
+                INSERT INTO jobs (kind, payload, max_attempts)
+                SELECT $1, i.payload, $3
+                FROM incoming i JOIN claimed c USING (message_id)
+                ORDER BY i.ordinality
+                RETURNING id
+            )
+            SELECT count(*) AS queued FROM inserted
+            """,
+            (kind, payloads, max_attempts)
+        )
+        return result["queued"]
+
+    @staticmethod
+    async def claim(limit: int, visibility_timeout: float) -> List[Dict[str, Any]]:
+        """
+        Claim up to `limit` ready jobs, oldest first: pending jobs whose
+        run_after has passed and running jobs whose worker let the visibility
+        timeout lapse. SKIP LOCKED lets concurrent workers claim disjoint batches.
+
+        A lapsed job that was already on its last attempt (e.g. a message that
+        kills its worker) is dead-lettered instead of run again. Rows have a
+        "status": "running" for claimed jobs, "dead" for those.
+        """
+        return await execute_query(
+            """
+            WITH ready AS (
+                SELECT id, status = 'running' AND attempts >= max_attempts AS exhausted
+                FROM jobs
+                WHERE status IN ('pending', 'running')
+                  AND run_after <= NOW()
+                  AND (status = 'pending' OR locked_until <= NOW())
+                ORDER BY run_after, id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE jobs j
+            SET status = CASE WHEN ready.exhausted THEN 'dead' ELSE 'running' END,
+                attempts = CASE WHEN ready.exhausted THEN j.attempts ELSE j.attempts + 1 END,
+                locked_until = CASE WHEN ready.exhausted THEN NULL ELSE NOW() + make_interval(secs => $2) END,
+                last_error = CASE WHEN ready.exhausted THEN $3 ELSE j.last_error END,
+                updated_at = NOW()
+            FROM ready
+            WHERE j.id = ready.id
+            RETURNING j.id, j.kind, j.payload, j.status, j.attempts, j.max_attempts
+            """,
+            (limit, visibility_timeout, LAPSED_ERROR)
+        )
+
+    @staticmethod
+    async def extend(job_ids: List[int], visibility_timeout: float) -> List[int]:
+        """Push back the visibility timeout of running jobs; returns the IDs still running"""
+        rows = await execute_query(
+            """
+            UPDATE jobs
+            SET locked_until = NOW() + make_interval(secs => $2)
+            WHERE id = ANY($1::bigint[]) AND status = 'running'
+            RETURNING id
+            """,
+            (job_ids, visibility_timeout)
+        )
+        return [r["id"] for r in rows]
+
+    @staticmethod
+    async def complete(job_ids: List[int]) -> None:
+        """Mark jobs as done"""
+        await execute_query(
+            """
+            UPDATE jobs
+            SET status = 'done', locked_until = NULL, updated_at = NOW()
+            WHERE id = ANY($1::bigint[])
+            """,
+            (job_ids,)
+        )
+
+    @staticmethod
+    async def fail(job_id: int, error: str, retry_in: float) -> Dict[str, Any]:
+        """Reschedule a failed job after `retry_in` seconds, or dead-letter it once out of attempts"""
+        return await execute_write(
+            """
+            UPDATE jobs
+            SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'pending' END,
+                run_after = NOW() + make_interval(secs => $3),
+                locked_until = NULL,
+                last_error = $2,
+                updated_at = NOW()
+            WHERE id = $1
+            RETURNING id, status, attempts
+            """,
+            (job_id, error, retry_in)
+        )
+
+    @staticmethod
+    async def requeue_dead(kind: str) -> int:
+        """Give dead-lettered jobs a fresh set of attempts; returns how many were requeued"""
+        result = await execute_write(
+            """
+            WITH requeued AS (
+                UPDATE jobs
+                SET status = 'pending', attempts = 0, run_after = NOW(), updated_at = NOW()
+                WHERE status = 'dead' AND kind = $1
+                RETURNING id
+            )
+            SELECT count(*) AS requeued FROM requeued
+            """,
+            (kind,)
+        )
+        return result["requeued"]
+
+    @staticmethod
+    async def prune(retention_seconds: float) -> int:
+        """Delete jobs that finished more than `retention_seconds` ago"""
+        result = await execute_write(
+            """
+            WITH deleted AS (
+                DELETE FROM jobs
+                WHERE status = 'done' AND updated_at < NOW() - make_interval(secs => $1)
+                RETURNING id
+            )
+            SELECT count(*) AS deleted FROM deleted
+            """,
+            (retention_seconds,)
+        )
+        return result["deleted"]
+
+    @staticmethod
+    async def counts() -> Dict[str, int]:
+        """Number of jobs per status"""
+        rows = await execute_query("SELECT status, count(*) AS n FROM jobs GROUP BY status")
+        return {r["status"]: r["n"] for r in rows}
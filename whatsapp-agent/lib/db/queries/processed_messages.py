@@ -0,0 +1,36 @@
+from typing import List
+from lib.db.connection import execute_query, execute_write
+
+
+class ProcessedMessageQueries:
+    """Unique claims on WhatsApp message IDs (table `processed_messages`)"""
+
+    @staticmethod
+    async def claim(message_ids: List[str]) -> List[str]:
+        """Record the IDs and return the ones no one had claimed before"""
+        rows = await execute_query(
+            """
+            INSERT INTO processed_messages (message_id)
+            SELECT DISTINCT unnest($1::text[])
+            ON CONFLICT (message_id) DO NOTHING
+            RETURNING message_id
+            """,
+            (message_ids,)
+        )
+        return [r["message_id"] for r in rows]
+
+    @staticmethod
+    async def prune(retention_seconds: float) -> int:
+        """Delete claims older than `retention_seconds`"""
+        result = await execute_write(
+            """
+            WITH deleted AS (
+                DELETE FROM processed_messages
+                WHERE received_at < NOW() - make_interval(secs => $1)
+                RETURNING message_id
+            )
+            SELECT count(*) AS deleted FROM deleted
+            """,
+            (retention_seconds,)
+        )
+        return result["deleted"]
@@ -0,0 +1,72 @@
+"""Leveled, structured logging shared by all modules"""
+
+import json
+import logging
+import sys
+import time
+from lib.config import LOG_LEVEL, LOG_FORMAT
+
+ROOT_LOGGER = "whatsapp_agent"
+
+# LogRecord attributes that are not user-supplied `extra=` fields
+_RESERVED = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "component"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, component, msg and any `extra=` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "component": record.component,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic `[COMPONENT] message` lines, with the level for warnings and errors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        level = "" if record.levelno <= logging.INFO else f"{record.levelname} "
+        line = f"[{record.component.upper()}] {level}{record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class _ComponentFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.component = record.name.rsplit(".", 1)[-1]
+        return True
+
+
+def _configure() -> logging.Logger:
+    root = logging.getLogger(ROOT_LOGGER)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.addFilter(_ComponentFilter())
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL.upper())
+        root.propagate = False
+        logging.Formatter.converter = time.gmtime
+    return root
+
+
+def get_logger(component: str) -> logging.Logger:
+    """
+    Logger for one component (e.g. "core", "claude"). Pass values as
+    arguments, not f-strings, so disabled levels cost no formatting:
+
+        logger.debug("Claude response: %.100s", response)
+        logger.info("Turn done", extra={"customer": phone, "ms": elapsed})
+    """
+    _configure()
+    return logging.getLogger(f"{ROOT_LOGGER}.{component}")
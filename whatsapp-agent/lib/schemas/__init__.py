@@ -1,6 +1,8 @@
-from .whatsapp import WhatsAppMessage, WhatsAppWebhookPayload
+from .whatsapp import WhatsAppMessage, WhatsAppWebhookPayload, has_messages, parse_webhook_messages
 
 __all__ = [
     "WhatsAppMessage",
     "WhatsAppWebhookPayload",
+    "has_messages",
+    "parse_webhook_messages",
 ]
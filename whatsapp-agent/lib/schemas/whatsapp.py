@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import Optional, List, Any
+from typing_extensions import TypedDict
 
 
 class WhatsAppMessage(BaseModel):
@@ -9,6 +10,14 @@ class WhatsAppMessage(BaseModel):
     timestamp: str
     text: Optional[str] = None
     type: str = "text"
+    # ID of the tapped list row / reply button (type "interactive"); text is its title
+    reply_id: Optional[str] = None
+
+
+def _interactive_reply(msg: dict) -> Optional[dict]:
+    """The list_reply/button_reply object of an interactive message, if any"""
+    interactive = msg.get("interactive") or {}
+    return interactive.get(interactive.get("type") or "") or None
 
 
 class WhatsAppContact(BaseModel):
@@ -67,11 +76,93 @@ class WhatsAppWebhookPayload(BaseModel):
             for change in entry.changes:
                 if change.value.messages:
                     for msg in change.value.messages:
+                        reply = _interactive_reply(msg)
                         messages.append(WhatsAppMessage(
                             from_number=msg.get("from", ""),
                             message_id=msg.get("id", ""),
                             timestamp=msg.get("timestamp", ""),
-                            text=msg.get("text", {}).get("body") if msg.get("text") else None,
-                            type=msg.get("type", "text")
+                            text=msg.get("text", {}).get("body") if msg.get("text") else
+                            (reply.get("title") if reply else None),
+                            type=msg.get("type", "text"),
+                            reply_id=reply.get("id") if reply else None,
                         ))
         return messages
+
+
+# ---------------------------------------------------------------------------
+# Intake fast path: only the fields the agent reads, validated straight from
+# the raw body by a TypeAdapter (pydantic-core parses and validates in one
+# pass; unknown keys are ignored)
+# ---------------------------------------------------------------------------
+class _InboundText(TypedDict, total=False):
+    body: str
+
+
+class _InboundReply(TypedDict, total=False):
+    id: str
+    title: str
+    description: str
+
+
+class _InboundInteractive(TypedDict, total=False):
+    type: str
+    list_reply: _InboundReply
+    button_reply: _InboundReply
+
+
+_InboundMessage = TypedDict("_InboundMessage", {
+    "from": str,
+    "id": str,
+    "timestamp": str,
+    "type": str,
+    "text": _InboundText,
+    "interactive": _InboundInteractive,
+}, total=False)
+
+
+class _InboundValue(TypedDict, total=False):
+    messages: List[_InboundMessage]
+
+
+class _InboundChange(TypedDict, total=False):
+    value: _InboundValue
+
+
+class _InboundEntry(TypedDict, total=False):
+    changes: List[_InboundChange]
+
+
+class _InboundPayload(TypedDict, total=False):
+    object: str
+    entry: List[_InboundEntry]
+
+
+_inbound_adapter = TypeAdapter(_InboundPayload)
+
+
+def has_messages(body: bytes) -> bool:
+    """
+    Cheap pre-check on the raw body: False means the payload carries no
+    messages (status callbacks: sent/delivered/read) and needs no parsing.
+    """
+    return b'"messages"' in body
+
+
+def parse_webhook_messages(body: bytes) -> List[WhatsAppMessage]:
+    """Validate a raw webhook body and return its messages (raises pydantic.ValidationError)"""
+    payload = _inbound_adapter.validate_json(body)
+    messages = []
+    for entry in payload.get("entry", ()):
+        for change in entry.get("changes", ()):
+            for msg in change.get("value", {}).get("messages", ()):
+                text = msg.get("text")
+                reply = _interactive_reply(msg)
+                messages.append(WhatsAppMessage.model_construct(
+                    from_number=msg.get("from", ""),
+                    message_id=msg.get("id", ""),
+                    timestamp=msg.get("timestamp", ""),
+                    text=text.get("body") if text else (reply.get("title") if reply else None),
+                    type=msg.get("type", "text"),
+                    reply_id=reply.get("id") if reply else None,
+                ))
+    return messages
@@ -1,4 +1,18 @@
-from .whatsapp import WhatsAppService
-from .claude import ClaudeService
+from importlib import import_module
 
-__all__ = ["WhatsAppService", "ClaudeService"]
+# Resolved on first attribute access (PEP 562); see lib/agent/__init__.py
+_EXPORTS = {
+    "WhatsAppService": ".whatsapp",
+    "get_whatsapp_service": ".whatsapp",
+    "get_http_client": ".whatsapp",
+    "close_http_client": ".whatsapp",
+    "ClaudeService": ".claude",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(_EXPORTS[name], __name__), name)
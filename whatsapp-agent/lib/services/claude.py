@@ -1,75 +1,294 @@
-import anthropic
-from typing import List, Dict, Any, Optional, Callable, Awaitable
-from lib.config import ANTHROPIC_API_KEY
+import asyncio
+import time
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Callable, Awaitable
+from lib.config import ANTHROPIC_API_KEY, CLAUDE_MODEL, CLAUDE_PROMPT_CACHING, TOOL_TIMEOUT
+from lib.logger import get_logger
+from lib.metrics import span, stage_duration, stage_errors, tool_duration
+from lib.services.model_tiers import ERROR, FAST, MAIN, TOOL_ROUNDS, TurnOutcome, model_router
 
+# anthropic takes over a second to import; it is loaded on first ClaudeService()
+# so cold starts that only serve health checks or webhook intake skip it.
+if TYPE_CHECKING:
+    import anthropic
 
-def log(message: str):
-    """Print log with prefix"""
-    print(f"[CLAUDE] {message}")
+
+logger = get_logger("claude")
+
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+class UsageStats:
+    """Process-wide token usage counters, including prompt cache reads/writes"""
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+    def __init__(self):
+        self.requests = 0
+        self.totals = {field: 0 for field in self.FIELDS}
+
+    def record(self, usage: Any) -> Dict[str, int]:
+        """Add a response's usage to the totals and return it as a dict"""
+        counts = {field: getattr(usage, field, None) or 0 for field in self.FIELDS}
+        self.requests += 1
+        for field, value in counts.items():
+            self.totals[field] += value
+        return counts
+
+    def stats(self) -> Dict[str, Any]:
+        prompt_tokens = (
+            self.totals["input_tokens"]
+            + self.totals["cache_creation_input_tokens"]
+            + self.totals["cache_read_input_tokens"]
+        )
+        return {
+            "requests": self.requests,
+            **self.totals,
+            "cache_hit_rate": round(self.totals["cache_read_input_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+        }
+
+
+usage_stats = UsageStats()
+
+
+def _with_cache_breakpoint(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of `message` whose last content block carries a cache breakpoint"""
+    content = message.get("content")
+    if isinstance(content, str):
+        blocks = [{"type": "text", "text": content, "cache_control": _CACHE_CONTROL}]
+    elif isinstance(content, list) and content and isinstance(content[-1], dict):
+        blocks = content[:-1] + [{**content[-1], "cache_control": _CACHE_CONTROL}]
+    else:
+        return message
+    return {**message, "content": blocks}
 
 
 class ClaudeService:
     """Service for interacting with Anthropic Claude API"""
 
     def __init__(self):
-        log(f"Initializing with API key: {ANTHROPIC_API_KEY[:20] if ANTHROPIC_API_KEY else 'MISSING'}...")
+        if not ANTHROPIC_API_KEY:
+            logger.warning("ANTHROPIC_API_KEY is missing")
+        import anthropic
+
         self.client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY)
-        self.model = "claude-sonnet-4-20250514"
-        log(f"Using model: {self.model}")
+        self.model = CLAUDE_MODEL
+        self.prompt_caching = CLAUDE_PROMPT_CACHING
+        self.last_usage: Dict[str, int] = {}
+        self.last_tier = MAIN
+        # Usage summed over the current chat_with_tools attempt
+        self._turn_usage: Dict[str, int] = {}
+        self.last_tool_timings: List[Dict[str, Any]] = []
+
+    def _build_request(
+        self,
+        messages: List[Dict[str, Any]],
+        system_prompt: str,
+        tools: Optional[List[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Build messages.create kwargs, marking cache breakpoints on the tools, the
+        system prompt and the end of the conversation so far. Later iterations of
+        a tool-use turn then re-read that whole prefix from the prompt cache.
+        """
+        if not self.prompt_caching:
+            return {"system": system_prompt, "messages": messages, "tools": tools}
+
+        system = [{"type": "text", "text": system_prompt, "cache_control": _CACHE_CONTROL}]
+        if tools:
+            tools = tools[:-1] + [{**tools[-1], "cache_control": _CACHE_CONTROL}]
+        if messages:
+            messages = messages[:-1] + [_with_cache_breakpoint(messages[-1])]
+        return {"system": system, "messages": messages, "tools": tools}
 
     async def chat(
         self,
         messages: List[Dict[str, str]],
         system_prompt: str,
         tools: Optional[List[Dict[str, Any]]] = None,
-        max_tokens: int = 1024
-    ) -> anthropic.types.Message:
-        """Send chat request to Claude"""
-        log(f"chat() called with {len(messages)} messages, {len(tools) if tools else 0} tools")
+        max_tokens: int = 1024,
+        model: Optional[str] = None
+    ) -> "anthropic.types.Message":
+        """Send chat request to Claude (with `self.model` unless `model` is given)"""
+        logger.debug("chat() called with %d messages, %d tools", len(messages), len(tools) if tools else 0)
+        kwargs = self._request_kwargs(messages, system_prompt, tools, max_tokens, model)
 
-        kwargs = {
-            "model": self.model,
-            "max_tokens": max_tokens,
-            "system": system_prompt,
-            "messages": messages,
-        }
+        try:
+            with span("claude"):
+                response = await self.client.messages.create(**kwargs)
+            self._record_response(response)
+            return response
+        except Exception as e:
+            logger.error("API ERROR: %s: %s", type(e).__name__, e)
+            raise
 
-        if tools:
-            kwargs["tools"] = tools
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: str,
+        on_text: Callable[[str], Awaitable[None]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        max_tokens: int = 1024,
+        model: Optional[str] = None
+    ) -> "anthropic.types.Message":
+        """Like chat(), but streams the response, passing text deltas to `on_text` as they arrive"""
+        logger.debug("stream_chat() called with %d messages, %d tools", len(messages), len(tools) if tools else 0)
+        kwargs = self._request_kwargs(messages, system_prompt, tools, max_tokens, model)
 
-        log("Calling Anthropic API...")
         try:
-            response = await self.client.messages.create(**kwargs)
-            log(f"API response: stop_reason={response.stop_reason}, content_blocks={len(response.content)}")
+            with span("claude"):
+                async with self.client.messages.stream(**kwargs) as stream:
+                    async for text in stream.text_stream:
+                        await on_text(text)
+                    response = await stream.get_final_message()
+            self._record_response(response)
             return response
         except Exception as e:
-            log(f"API ERROR: {type(e).__name__}: {e}")
+            logger.error("API ERROR: %s: %s", type(e).__name__, e)
             raise
 
+    def _request_kwargs(
+        self,
+        messages: List[Dict[str, Any]],
+        system_prompt: str,
+        tools: Optional[List[Dict[str, Any]]],
+        max_tokens: int,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        request = self._build_request(messages, system_prompt, tools)
+        kwargs = {
+            "model": model or self.model,
+            "max_tokens": max_tokens,
+            "system": request["system"],
+            "messages": request["messages"],
+        }
+
+        if request["tools"]:
+            kwargs["tools"] = request["tools"]
+        return kwargs
+
+    def _record_response(self, response: "anthropic.types.Message") -> None:
+        self.last_usage = usage_stats.record(response.usage)
+        for field, value in self.last_usage.items():
+            self._turn_usage[field] = self._turn_usage.get(field, 0) + value
+        logger.info("API response: model=%s, stop_reason=%s", response.model, response.stop_reason, extra=self.last_usage)
+
     async def chat_with_tools(
         self,
         messages: List[Dict[str, str]],
         system_prompt: str,
         tools: List[Dict[str, Any]],
         tool_executor: Callable[..., Awaitable[str]],
-        max_iterations: int = 5
+        max_iterations: int = 5,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        on_text: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> str:
-        """Chat with tool use, handling tool calls automatically"""
-        log(f"chat_with_tools() called, max_iterations={max_iterations}")
+        """
+        Chat with tool use, handling tool calls automatically.
+
+        All tool_use blocks of a response run concurrently, each under its own
+        timeout (`tool_timeouts[name]`, default TOOL_TIMEOUT); results are sent
+        back in block order. Per-tool latencies end up in `last_tool_timings`.
+
+        With `on_text`, every iteration is streamed and text deltas (including
+        any text written before a tool call) are passed to it as they arrive;
+        the return value is then all the text that was streamed.
+
+        `model_router` picks the model. A fast-tier answer is held back until it
+        passes the escalation checks (then passed to `on_text` in one piece);
+        if it fails one, or the call errors, the turn is redone on the main
+        model. The tier that answered ends up in `last_tier`.
+        """
+        self.last_tool_timings = []
+        choice = model_router.choose(messages)
+        self.last_tier = choice.tier
+        if choice.tier == FAST:
+            held: List[str] = []
+
+            async def hold(text: str) -> None:
+                held.append(text)
+
+            iterations = max_iterations
+            if TOOL_ROUNDS in model_router.escalate_on:
+                # One round past the limit is enough to know the answer escalates
+                iterations = min(max_iterations, model_router.fast_max_tool_rounds + 1)
+            started = time.perf_counter()
+            self._turn_usage = {}
+            try:
+                outcome = await self._tool_loop(
+                    choice.model, messages, system_prompt, tools, tool_executor, iterations,
+                    tool_timeouts or {}, hold if on_text is not None else None
+                )
+                failed = model_router.check(outcome)
+            except Exception as e:
+                failed = ERROR
+                logger.warning("Fast model failed: %s: %s", type(e).__name__, e)
+            model_router.record(FAST, time.perf_counter() - started, self._turn_usage, escalated=failed)
+            if failed is None:
+                if on_text is not None and outcome.text:
+                    await on_text(outcome.text)
+                return outcome.text
+            logger.info("Escalating to %s: fast answer failed the %s check", self.model, failed)
+            self.last_tier = MAIN
+
+        started = time.perf_counter()
+        self._turn_usage = {}
+        try:
+            outcome = await self._tool_loop(
+                self.model, messages, system_prompt, tools, tool_executor, max_iterations,
+                tool_timeouts or {}, on_text
+            )
+        finally:
+            model_router.record(MAIN, time.perf_counter() - started, self._turn_usage)
+        return outcome.text
+
+    async def _tool_loop(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        system_prompt: str,
+        tools: List[Dict[str, Any]],
+        tool_executor: Callable[..., Awaitable[str]],
+        max_iterations: int,
+        tool_timeouts: Dict[str, float],
+        on_text: Optional[Callable[[str], Awaitable[None]]]
+    ) -> TurnOutcome:
+        """Run `model` until it stops calling tools (or `max_iterations` responses)"""
         current_messages = messages.copy()
+        streamed: List[str] = []
+        tool_rounds = 0
+        tool_failures = 0
+        response = None
+
+        async def collect(text: str) -> None:
+            streamed.append(text)
+            await on_text(text)
 
         for iteration in range(max_iterations):
-            log(f"Iteration {iteration + 1}/{max_iterations}")
+            logger.debug("Iteration %d/%d (%s)", iteration + 1, max_iterations, model)
 
-            response = await self.chat(
-                messages=current_messages,
-                system_prompt=system_prompt,
-                tools=tools
-            )
+            if on_text is not None:
+                if streamed:
+                    # Keep text from before a tool call in its own paragraph
+                    await collect("\n\n")
+                response = await self.stream_chat(
+                    messages=current_messages,
+                    system_prompt=system_prompt,
+                    on_text=collect,
+                    tools=tools,
+                    model=model
+                )
+            else:
+                response = await self.chat(
+                    messages=current_messages,
+                    system_prompt=system_prompt,
+                    tools=tools,
+                    model=model
+                )
 
             # Check if we need to handle tool calls
             if response.stop_reason == "tool_use":
-                log("Response requires tool use")
+                tool_rounds += 1
 
                 # Add assistant response to messages
                 current_messages.append({
@@ -77,23 +296,22 @@ class ClaudeService:
                     "content": response.content
                 })
 
-                # Process each tool call
-                tool_results = []
-                for block in response.content:
-                    if block.type == "tool_use":
-                        log(f"Executing tool: {block.name} with input: {block.input}")
-                        try:
-                            result = await tool_executor(block.name, block.input)
-                            log(f"Tool result: {str(result)[:100]}...")
-                        except Exception as e:
-                            log(f"Tool execution ERROR: {e}")
-                            result = f"Error: {e}"
-
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": str(result)
-                        })
+                # Run all tool calls concurrently; gather keeps block order
+                tool_blocks = [block for block in response.content if block.type == "tool_use"]
+                timings_before = len(self.last_tool_timings)
+                results = await asyncio.gather(*(
+                    self._run_tool(block, tool_executor, tool_timeouts.get(block.name, TOOL_TIMEOUT))
+                    for block in tool_blocks
+                ))
+                tool_failures += sum(1 for timing in self.last_tool_timings[timings_before:] if timing["status"] != "ok")
+                tool_results = [
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": block.id,
+                        "content": result
+                    }
+                    for block, result in zip(tool_blocks, results)
+                ]
 
                 # Add tool results to messages
                 current_messages.append({
@@ -101,18 +319,54 @@ class ClaudeService:
                     "content": tool_results
                 })
             else:
-                log(f"Final response, stop_reason={response.stop_reason}")
-                # Extract final text response
-                for block in response.content:
-                    if hasattr(block, "text"):
-                        log(f"Extracted text: {block.text[:100]}...")
-                        return block.text
-                log("No text block found, returning empty")
-                return ""
+                if on_text is not None:
+                    text = "".join(streamed).strip()
+                else:
+                    # Extract final text response
+                    text = next((block.text for block in response.content if hasattr(block, "text")), None)
+                    if text is None:
+                        logger.warning("No text block found, returning empty")
+                        text = ""
+                return TurnOutcome(text, response.stop_reason, tool_rounds, tool_failures)
 
         # Max iterations reached
-        log("Max iterations reached!")
-        return "Lo siento, no pude completar tu solicitud. Por favor intenta de nuevo."
+        logger.warning("Max iterations reached")
+        fallback = "Lo siento, no pude completar tu solicitud. Por favor intenta de nuevo."
+        if on_text is not None:
+            await collect(("\n\n" if streamed else "") + fallback)
+            fallback = "".join(streamed).strip()
+        return TurnOutcome(fallback, response.stop_reason, tool_rounds, tool_failures)
+
+    async def _run_tool(
+        self,
+        block: Any,
+        tool_executor: Callable[..., Awaitable[str]],
+        timeout: float
+    ) -> str:
+        """Execute one tool_use block under a timeout, recording its latency"""
+        logger.debug("Executing tool: %s with input: %s", block.name, block.input)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            result = str(await asyncio.wait_for(tool_executor(block.name, block.input), timeout))
+            logger.debug("Tool result: %.100s", result)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            logger.warning("Tool execution TIMEOUT after %gs: %s", timeout, block.name)
+            result = f"Error: la herramienta '{block.name}' no respondió a tiempo"
+        except Exception as e:
+            status = "error"
+            logger.error("Tool execution ERROR: %s", e)
+            result = f"Error: {e}"
+
+        elapsed = time.perf_counter() - started
+        self.last_tool_timings.append({"tool": block.name, "ms": round(elapsed * 1000, 1), "status": status})
+        stage_duration.observe(elapsed, stage="tool")
+        tool_duration.observe(elapsed, tool=block.name)
+        if status != "ok":
+            stage_errors.inc(stage="tool")
+        logger.info("Tool %s took %.1f ms (%s)", block.name, elapsed * 1000, status)
+        return result
 
     def format_messages_for_claude(
         self,
@@ -0,0 +1,164 @@
+"""Model tiering: a fast model for simple turns, the main model for everything else"""
+
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+from lib.config import (
+    CLAUDE_MODEL,
+    CLAUDE_FAST_MODEL,
+    MODEL_TIERING,
+    MODEL_TIER_FAST_MAX_CHARS,
+    MODEL_TIER_FAST_MAX_QUESTIONS,
+    MODEL_TIER_FAST_MAX_TOOL_ROUNDS,
+    MODEL_TIER_MAIN_KEYWORDS,
+    MODEL_TIER_ESCALATE_ON,
+)
+from lib.data.search import normalize
+from lib.metrics import registry
+
+FAST = "fast"
+MAIN = "main"
+TIERS = (FAST, MAIN)
+
+# Checks on a fast-tier answer; a failed one re-runs the turn on the main model
+EMPTY = "empty"              # no text in the final answer
+MAX_TOKENS = "max_tokens"    # the answer was cut off
+TOOL_ERROR = "tool_error"    # a tool call failed or timed out
+TOOL_ROUNDS = "tool_rounds"  # more than MODEL_TIER_FAST_MAX_TOOL_ROUNDS tool round trips
+CHECKS = (EMPTY, MAX_TOKENS, TOOL_ERROR, TOOL_ROUNDS)
+# The fast model's call raised (always escalated)
+ERROR = "error"
+
+tier_turns = registry.counter(
+    "agent_model_tier_turns_total", "Claude turns (tool loops) by model tier and outcome", ("tier", "outcome"))
+tier_duration = registry.histogram(
+    "agent_model_tier_duration_seconds", "Duration of a Claude turn (all its tool rounds) by model tier", ("tier",))
+tier_tokens = registry.counter(
+    "agent_model_tier_tokens_total", "Claude tokens by model tier and kind", ("tier", "kind"))
+tier_escalations = registry.counter(
+    "agent_model_tier_escalations_total", "Fast-tier answers re-run on the main model, by failed check", ("check",))
+
+
+class TierChoice(NamedTuple):
+    tier: str
+    model: str
+    # Rule that decided it: "simple", "disabled", "long", "questions" or "keyword"
+    reason: str
+
+
+class TurnOutcome(NamedTuple):
+    """What a tool loop produced, as far as the escalation checks are concerned"""
+    text: str
+    stop_reason: Optional[str]
+    tool_rounds: int
+    tool_failures: int
+
+
+class ModelRouter:
+    """
+    Picks the model for a turn from the customer's latest message.
+
+    Short messages (at most `fast_max_chars`, `fast_max_questions` question
+    marks and none of `main_keywords`) go to `fast_model`: greetings, thanks,
+    single lookups. Everything else, and any fast answer that fails one of the
+    `escalate_on` checks, goes to `main_model`. Latency and tokens are
+    recorded per tier (agent_model_tier_* metrics) to tune the split.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        fast_model: str,
+        main_model: str,
+        fast_max_chars: int,
+        fast_max_questions: int,
+        fast_max_tool_rounds: int,
+        main_keywords: Iterable[str],
+        escalate_on: Iterable[str] = CHECKS,
+    ):
+        self.enabled = enabled and fast_model != main_model
+        self.fast_model = fast_model
+        self.main_model = main_model
+        self.fast_max_chars = fast_max_chars
+        self.fast_max_questions = fast_max_questions
+        self.fast_max_tool_rounds = fast_max_tool_rounds
+        keywords = [normalize(keyword) for keyword in main_keywords if normalize(keyword)]
+        self._keywords = re.compile(r"\b(?:" + "|".join(map(re.escape, keywords)) + r")\b") if keywords else None
+        self.escalate_on = frozenset(escalate_on)
+        self.choices: Dict[str, int] = {}
+        self.turns = {tier: 0 for tier in TIERS}
+        self.seconds = {tier: 0.0 for tier in TIERS}
+        self.tokens = {tier: {"input": 0, "output": 0} for tier in TIERS}
+        self.escalations: Dict[str, int] = {check: 0 for check in CHECKS + (ERROR,)}
+
+    def choose(self, messages: List[Dict[str, Any]]) -> TierChoice:
+        """The tier for a turn whose last message is the customer's"""
+        choice = self._choose(messages[-1].get("content") if messages else None)
+        self.choices[choice.reason] = self.choices.get(choice.reason, 0) + 1
+        return choice
+
+    def _choose(self, text: Any) -> TierChoice:
+        if not self.enabled:
+            return TierChoice(MAIN, self.main_model, "disabled")
+        if not isinstance(text, str) or len(text) > self.fast_max_chars:
+            return TierChoice(MAIN, self.main_model, "long")
+        if text.count("?") > self.fast_max_questions:
+            return TierChoice(MAIN, self.main_model, "questions")
+        if self._keywords is not None and self._keywords.search(normalize(text)):
+            return TierChoice(MAIN, self.main_model, "keyword")
+        return TierChoice(FAST, self.fast_model, "simple")
+
+    def check(self, outcome: TurnOutcome) -> Optional[str]:
+        """The first failed escalation check of a fast-tier outcome, or None if it can be sent"""
+        failed = {
+            EMPTY: not outcome.text.strip(),
+            MAX_TOKENS: outcome.stop_reason == "max_tokens",
+            TOOL_ERROR: outcome.tool_failures > 0,
+            TOOL_ROUNDS: outcome.tool_rounds > self.fast_max_tool_rounds,
+        }
+        return next((check for check in CHECKS if check in self.escalate_on and failed[check]), None)
+
+    def record(self, tier: str, seconds: float, usage: Dict[str, int], escalated: Optional[str] = None) -> None:
+        """Account one tool loop run on `tier` (`escalated`: the check its answer failed)"""
+        self.turns[tier] += 1
+        self.seconds[tier] += seconds
+        input_tokens = (usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0)
+                        + usage.get("cache_read_input_tokens", 0))
+        self.tokens[tier]["input"] += input_tokens
+        self.tokens[tier]["output"] += usage.get("output_tokens", 0)
+        tier_turns.inc(tier=tier, outcome="escalated" if escalated else "ok")
+        tier_duration.observe(seconds, tier=tier)
+        tier_tokens.inc(input_tokens, tier=tier, kind="input")
+        tier_tokens.inc(usage.get("output_tokens", 0), tier=tier, kind="output")
+        if escalated:
+            self.escalations[escalated] += 1
+            tier_escalations.inc(check=escalated)
+
+    def stats(self) -> Dict[str, Any]:
+        fast_turns = self.turns[FAST]
+        escalated = sum(self.escalations.values())
+        return {
+            "enabled": self.enabled,
+            "fast_model": self.fast_model,
+            "main_model": self.main_model,
+            "fast_turns": fast_turns,
+            "main_turns": self.turns[MAIN],
+            "escalations": escalated,
+            "escalation_rate": round(escalated / fast_turns, 4) if fast_turns else 0.0,
+            "fast_avg_ms": round(self.seconds[FAST] / fast_turns * 1000, 1) if fast_turns else 0.0,
+            "main_avg_ms": round(self.seconds[MAIN] / self.turns[MAIN] * 1000, 1) if self.turns[MAIN] else 0.0,
+            **{f"{tier}_{kind}_tokens": count for tier in TIERS for kind, count in self.tokens[tier].items()},
+            "by_reason": dict(self.choices),
+            "escalated_by_check": dict(self.escalations),
+        }
+
+
+model_router = ModelRouter(
+    enabled=MODEL_TIERING,
+    fast_model=CLAUDE_FAST_MODEL,
+    main_model=CLAUDE_MODEL,
+    fast_max_chars=MODEL_TIER_FAST_MAX_CHARS,
+    fast_max_questions=MODEL_TIER_FAST_MAX_QUESTIONS,
+    fast_max_tool_rounds=MODEL_TIER_FAST_MAX_TOOL_ROUNDS,
+    main_keywords=MODEL_TIER_MAIN_KEYWORDS,
+    escalate_on=MODEL_TIER_ESCALATE_ON,
+)
@@ -0,0 +1,262 @@
+"""Paced, retrying delivery of outbound Graph API calls"""
+
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from lib.config import (
+    WHATSAPP_SEND_RATE,
+    WHATSAPP_SEND_BURST,
+    WHATSAPP_RECIPIENT_RATE,
+    WHATSAPP_RECIPIENT_BURST,
+    WHATSAPP_SEND_MAX_RETRIES,
+    WHATSAPP_SEND_BACKOFF_BASE,
+    WHATSAPP_SEND_BACKOFF_MAX,
+    WHATSAPP_SEND_RETRY_AFTER_MAX,
+)
+from lib.keyed_lock import KeyedLock
+from lib.logger import get_logger
+from lib.metrics import registry
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = get_logger("outbound")
+
+# Graph API error codes that mean "slow down" even when the HTTP status isn't 429:
+# 4/80007 app/WABA rate limits, 130429 throughput, 131048 spam limit, 131056 pair rate limit
+RATE_LIMIT_ERROR_CODES = frozenset({4, 80007, 130429, 131048, 131056})
+
+# Idle recipient buckets are dropped once this many are tracked
+MAX_TRACKED_RECIPIENTS = 10000
+
+outbound_attempts = registry.counter(
+    "agent_outbound_attempts_total", "Graph API calls, by result", ("result",))
+outbound_wait = registry.counter(
+    "agent_outbound_wait_seconds_total", "Time spent waiting on rate limits and backoff", ("reason",))
+
+
+class TokenBucket:
+    """Allows `rate` calls per second on average and bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """
+        Take a token, returning how long the caller must wait before using it.
+        Tokens may go negative, which queues later callers behind earlier ones.
+        """
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+def retry_after_seconds(response: "httpx.Response") -> Optional[float]:
+    """Retry-After header as seconds (it may be a delay or an HTTP date)"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(response: "httpx.Response") -> bool:
+    """429s, 5xx and Graph API rate-limit errors are worth retrying; other 4xx are not"""
+    if response.status_code == 429 or response.status_code >= 500:
+        return True
+    if response.status_code == 400:
+        try:
+            code = response.json().get("error", {}).get("code")
+        except ValueError:
+            return False
+        return code in RATE_LIMIT_ERROR_CODES
+    return False
+
+
+class OutboundScheduler:
+    """
+    Paces and retries outbound calls.
+
+    Every call takes a token from its sender's bucket (one per
+    phone_number_id, shared by all recipients) and, for messages, from its
+    recipient's bucket. Calls for one recipient go out one at a time in
+    submission order, and `ordered()` keeps a multi-part reply together.
+    Retryable failures (see is_retryable) and transport errors are retried up
+    to `max_retries` times, waiting Retry-After when Meta sends it and
+    otherwise a full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        recipient_rate: float,
+        recipient_burst: float,
+        max_retries: int,
+        backoff_base: float,
+        backoff_max: float,
+        retry_after_max: float = WHATSAPP_SEND_RETRY_AFTER_MAX,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self._senders: Dict[str, TokenBucket] = {}
+        self._recipients: Dict[str, TokenBucket] = {}
+        self._order = KeyedLock()
+        self._ordered_tasks: Dict[str, asyncio.Task] = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.throttled_seconds = 0.0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    async def _pace(self, sender: str, recipient: Optional[str]) -> None:
+        bucket = self._senders.get(sender)
+        if bucket is None:
+            bucket = self._senders[sender] = TokenBucket(self.rate, self.burst)
+        delay = bucket.reserve()
+        if recipient is not None:
+            bucket = self._recipients.get(recipient)
+            if bucket is None:
+                if len(self._recipients) >= MAX_TRACKED_RECIPIENTS:
+                    self.prune()
+                bucket = self._recipients[recipient] = TokenBucket(self.recipient_rate, self.recipient_burst)
+            delay = max(delay, bucket.reserve())
+        if delay > 0:
+            self.throttled_seconds += delay
+            outbound_wait.inc(delay, reason="rate_limit")
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def ordered(self, recipient: str) -> AsyncIterator[None]:
+        """Hold the recipient's queue so several submit() calls go out back to back"""
+        async with self._order.hold(recipient):
+            self._ordered_tasks[recipient] = asyncio.current_task()
+            try:
+                yield
+            finally:
+                del self._ordered_tasks[recipient]
+
+    async def submit(
+        self,
+        sender: str,
+        recipient: Optional[str],
+        request: Callable[[], Awaitable["httpx.Response"]],
+    ) -> "httpx.Response":
+        """
+        Run `request` under the rate limits, retrying it while it fails in a
+        retryable way. Returns the last response; transport errors from the
+        last attempt are raised. Sends are not idempotent, so only transport
+        errors where the request never reached Meta (connect and pool
+        timeouts, refused connections) are retried; read/write errors are
+        raised at once.
+        """
+        if recipient is None or self._ordered_tasks.get(recipient) is asyncio.current_task():
+            return await self._attempt(sender, recipient, request)
+        async with self._order.hold(recipient):
+            return await self._attempt(sender, recipient, request)
+
+    async def _attempt(
+        self,
+        sender: str,
+        recipient: Optional[str],
+        request: Callable[[], Awaitable["httpx.Response"]],
+    ) -> "httpx.Response":
+        import httpx
+
+        # The request provably never left: safe to send again
+        not_sent_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+        attempt = 0
+        while True:
+            await self._pace(sender, recipient)
+            try:
+                response = await request()
+            except httpx.TransportError as e:
+                outbound_attempts.inc(result="transport_error")
+                if not isinstance(e, not_sent_errors) or attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                delay = self.backoff(attempt + 1)
+                logger.warning("Graph API transport error (%s: %s), retry in %.2fs", type(e).__name__, e, delay)
+            else:
+                if response.is_success:
+                    self.sent += 1
+                    outbound_attempts.inc(result="ok")
+                    return response
+                if not is_retryable(response) or attempt >= self.max_retries:
+                    self.failed += 1
+                    outbound_attempts.inc(result="failed")
+                    return response
+                retry_after = retry_after_seconds(response)
+                if retry_after is not None and retry_after > self.retry_after_max:
+                    # Retrying earlier than Meta asked would only extend the limit
+                    self.failed += 1
+                    outbound_attempts.inc(result="failed")
+                    logger.warning("Graph API asked to retry in %.0fs (over %.0fs), giving up",
+                                   retry_after, self.retry_after_max)
+                    return response
+                outbound_attempts.inc(result="retryable")
+                delay = retry_after if retry_after is not None else self.backoff(attempt + 1)
+                logger.warning("Graph API returned %d, retry in %.2fs", response.status_code, delay)
+            attempt += 1
+            self.retried += 1
+            outbound_wait.inc(delay, reason="backoff")
+            await asyncio.sleep(delay)
+
+    def prune(self) -> None:
+        """Drop idle per-recipient buckets (a full bucket is the same as a new one)"""
+        for recipient in [r for r, bucket in self._recipients.items() if bucket.full()]:
+            del self._recipients[recipient]
+
+    def stats(self) -> Dict[str, Any]:
+        self.prune()
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "tracked_recipients": len(self._recipients),
+            "queued_recipients": len(self._order),
+        }
+
+
+outbound_scheduler = OutboundScheduler(
+    rate=WHATSAPP_SEND_RATE,
+    burst=WHATSAPP_SEND_BURST,
+    recipient_rate=WHATSAPP_RECIPIENT_RATE,
+    recipient_burst=WHATSAPP_RECIPIENT_BURST,
+    max_retries=WHATSAPP_SEND_MAX_RETRIES,
+    backoff_base=WHATSAPP_SEND_BACKOFF_BASE,
+    backoff_max=WHATSAPP_SEND_BACKOFF_MAX,
+    retry_after_max=WHATSAPP_SEND_RETRY_AFTER_MAX,
+)
@@ -1,63 +1,147 @@
-import httpx
 import hashlib
 import hmac
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from lib.config import (
     WHATSAPP_ACCESS_TOKEN,
     WHATSAPP_PHONE_NUMBER_ID,
     WHATSAPP_API_URL,
     WHATSAPP_VERIFY_TOKEN,
+    WHATSAPP_APP_SECRET,
+    WHATSAPP_HTTP2,
+    WHATSAPP_HTTP_MAX_CONNECTIONS,
+    WHATSAPP_HTTP_MAX_KEEPALIVE,
+    WHATSAPP_HTTP_KEEPALIVE_EXPIRY,
+    WHATSAPP_HTTP_TIMEOUT,
+    WHATSAPP_HTTP_CONNECT_TIMEOUT,
 )
+from lib.logger import get_logger
+from lib.metrics import span
+from lib.services.outbound import OutboundScheduler, outbound_scheduler
 
+# httpx is imported when the first outbound call builds the client, so webhook
+# verification and health checks don't pay for it on cold start.
+if TYPE_CHECKING:
+    import httpx
 
-def log(message: str):
-    """Print log with prefix"""
-    print(f"[WHATSAPP] {message}")
+
+logger = get_logger("whatsapp")
+
+
+_client: "httpx.AsyncClient | None" = None
+_service: "WhatsAppService | None" = None
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2])."""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Return a lazily-created, keep-alive HTTP client for the Graph API (singleton)."""
+    import httpx
+
+    global _client
+    if _client is None or _client.is_closed:
+        http2 = WHATSAPP_HTTP2 and _http2_available()
+        if WHATSAPP_HTTP2 and not http2:
+            logger.warning("h2 package not installed, falling back to HTTP/1.1")
+        _client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=WHATSAPP_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=WHATSAPP_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=WHATSAPP_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(WHATSAPP_HTTP_TIMEOUT, connect=WHATSAPP_HTTP_CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+async def close_http_client():
+    """Close the shared HTTP client."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_whatsapp_service() -> "WhatsAppService":
+    """Return the process-wide WhatsAppService (singleton)."""
+    global _service
+    if _service is None:
+        _service = WhatsAppService()
+    return _service
 
 
 class WhatsAppService:
     """Service for interacting with Meta WhatsApp Business API"""
 
-    def __init__(self):
+    def __init__(self, client: Optional["httpx.AsyncClient"] = None, scheduler: Optional[OutboundScheduler] = None):
         self.api_url = WHATSAPP_API_URL
         self.phone_number_id = WHATSAPP_PHONE_NUMBER_ID
         self.access_token = WHATSAPP_ACCESS_TOKEN
         self.verify_token = WHATSAPP_VERIFY_TOKEN
-        log(f"Initialized - API URL: {self.api_url}")
-        log(f"Phone Number ID: {self.phone_number_id}")
-        log(f"Access Token: {self.access_token[:20] if self.access_token else 'MISSING'}...")
-        log(f"Verify Token: {self.verify_token[:10] if self.verify_token else 'MISSING'}...")
+        self.app_secret = WHATSAPP_APP_SECRET
+        self._client = client
+        self.scheduler = scheduler or outbound_scheduler
+        self.messages_url = f"{self.api_url}/{self.phone_number_id}/messages"
+        self.headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json",
+        }
+        logger.info("Initialized - API URL: %s, phone number ID: %s", self.api_url, self.phone_number_id)
+        if not self.access_token:
+            logger.warning("WHATSAPP_ACCESS_TOKEN is missing")
+        if not self.verify_token:
+            logger.warning("WHATSAPP_VERIFY_TOKEN is missing")
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        """HTTP client used for outbound calls (shared pool unless one was injected)."""
+        if self._client is not None:
+            return self._client
+        return get_http_client()
 
     def verify_webhook(self, mode: str, token: str, challenge: str) -> Optional[str]:
         """Verify webhook subscription from Meta"""
-        log(f"verify_webhook: mode={mode}, token_match={token == self.verify_token}")
+        logger.info("verify_webhook: mode=%s, token_match=%s", mode, token == self.verify_token)
         if mode == "subscribe" and token == self.verify_token:
             return challenge
         return None
 
     def verify_signature(self, payload: bytes, signature: str) -> bool:
-        """Verify webhook payload signature"""
+        """Verify webhook payload signature (HMAC-SHA256 of the raw body with the app secret)"""
         if not signature.startswith("sha256="):
             return False
 
         expected_signature = hmac.new(
-            self.access_token.encode(),
+            self.app_secret.encode(),
             payload,
             hashlib.sha256
         ).hexdigest()
 
         return hmac.compare_digest(signature[7:], expected_signature)
 
+    async def _post(self, payload: dict) -> "httpx.Response":
+        """
+        POST a payload to the messages endpoint over the shared connection
+        pool, paced and retried by the outbound scheduler (per recipient when
+        the payload has one)
+        """
+        return await self.scheduler.submit(
+            self.phone_number_id,
+            payload.get("to"),
+            lambda: self.client.post(self.messages_url, json=payload, headers=self.headers),
+        )
+
     async def send_message(self, to: str, text: str) -> dict:
         """Send text message to WhatsApp number"""
-        url = f"{self.api_url}/{self.phone_number_id}/messages"
-        log(f"send_message to {to}, text length: {len(text)}")
-        log(f"URL: {url}")
+        logger.debug("send_message to %s, text length: %d", to, len(text))
 
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-        }
         payload = {
             "messaging_product": "whatsapp",
             "recipient_type": "individual",
@@ -66,14 +150,17 @@ class WhatsAppService:
             "text": {"body": text}
         }
 
-        async with httpx.AsyncClient() as client:
-            log("Sending HTTP POST...")
-            response = await client.post(url, json=payload, headers=headers)
-            log(f"Response status: {response.status_code}")
+        with span("send"):
+            response = await self._post(payload)
             if response.status_code != 200:
-                log(f"Response body: {response.text}")
+                logger.warning("send_message failed with %d: %s", response.status_code, response.text)
             response.raise_for_status()
-            return response.json()
+        return response.json()
+
+    async def send_messages(self, to: str, texts: list[str]) -> list[dict]:
+        """Send several text messages in order, with no other message to `to` in between"""
+        async with self.scheduler.ordered(to):
+            return [await self.send_message(to, text) for text in texts]
 
     async def send_interactive_buttons(
         self,
@@ -82,12 +169,6 @@ class WhatsAppService:
         buttons: list[dict]
     ) -> dict:
         """Send interactive message with buttons"""
-        url = f"{self.api_url}/{self.phone_number_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-        }
-
         # Format buttons (max 3)
         formatted_buttons = [
             {
@@ -112,10 +193,10 @@ class WhatsAppService:
             }
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
+        with span("send"):
+            response = await self._post(payload)
             response.raise_for_status()
-            return response.json()
+        return response.json()
 
     async def send_interactive_list(
         self,
@@ -125,12 +206,6 @@ class WhatsAppService:
         sections: list[dict]
     ) -> dict:
         """Send interactive message with list"""
-        url = f"{self.api_url}/{self.phone_number_id}/messages"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-        }
-
         payload = {
             "messaging_product": "whatsapp",
             "recipient_type": "individual",
@@ -146,28 +221,20 @@ class WhatsAppService:
             }
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
+        with span("send"):
+            response = await self._post(payload)
             response.raise_for_status()
-            return response.json()
+        return response.json()
 
     async def mark_as_read(self, message_id: str) -> dict:
         """Mark message as read"""
-        url = f"{self.api_url}/{self.phone_number_id}/messages"
-        log(f"mark_as_read: {message_id}")
-
-        headers = {
-            "Authorization": f"Bearer {self.access_token}",
-            "Content-Type": "application/json",
-        }
         payload = {
             "messaging_product": "whatsapp",
             "status": "read",
             "message_id": message_id
         }
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers)
-            log(f"mark_as_read response: {response.status_code}")
+        with span("mark_as_read"):
+            response = await self._post(payload)
             response.raise_for_status()
-            return response.json()
+        return response.json()
@@ -0,0 +1,92 @@
+"""Benchmark catalog load time and resident memory: JSON dicts vs. compact records vs. snapshot.
+
+The real catalog is replicated (with suffixed names) up to each --sizes value.
+
+Usage:
+    python scripts/bench_catalog_load.py [--sizes 44 10000] [--repeat 5]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.data.catalog import compile_snapshot, load_catalog
+from lib.data.recipes import RECIPES_JSON_PATH
+from lib.data.search import RecipeIndex
+
+
+def write_scaled_catalog(directory: str, size: int) -> str:
+    with open(RECIPES_JSON_PATH, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    base = data["recetas"]
+    recipes = []
+    while len(recipes) < size:
+        copy = len(recipes) // len(base)
+        for recipe in base[:size - len(recipes)]:
+            scaled = dict(recipe)
+            scaled["id"] = len(recipes) + 1
+            if copy:
+                scaled["nombre"] = f"{recipe['nombre']} {copy}"
+            recipes.append(scaled)
+    data["recetas"] = recipes
+    data["total_recetas"] = len(recipes)
+    path = os.path.join(directory, f"recetas_{size}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return path
+
+
+def load_json_dicts(path: str):
+    """The previous loader: plain json.load into nested dicts, plus the search index"""
+    with open(path, "r", encoding="utf-8") as f:
+        recipes = json.load(f)["recetas"]
+    return recipes, RecipeIndex(recipes)
+
+
+def measure(label: str, loader, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        loader()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    retained = loader()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    print(f"  {label:<26}{min(timings):>10.2f} ms{current / 1024:>12.0f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[44, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = write_scaled_catalog(directory, size)
+            compile_snapshot(path)
+            print(f"{size} recipes (JSON {os.path.getsize(path) / 1024:.0f} KiB):")
+            print(f"  {'':<26}{'load':>13}{'resident':>16}")
+            measure("json dicts + index", lambda: load_json_dicts(path), args.repeat)
+            measure("compact from JSON", lambda: load_catalog(path, use_snapshot=False), args.repeat)
+            measure("compact from snapshot", lambda: load_catalog(path), args.repeat)
+            # Same content, new mtime (e.g. a fresh checkout): the JSON is read and hashed
+            os.utime(path, ns=(time.time_ns(), time.time_ns()))
+            measure("snapshot, JSON touched", lambda: load_catalog(path), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
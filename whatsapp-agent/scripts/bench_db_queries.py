@@ -0,0 +1,219 @@
+"""Per-query overhead of the conversation queries: previous DB layer vs. current.
+
+1. JSONB codec alone: stdlib json vs. orjson decoding/encoding a turn's
+   recent_messages (30 chat messages and recipe cards). Runs without a database.
+2. With POSTGRES_URL: the turn queries against a throwaway customer with a
+   seeded history, through
+     before  ad-hoc SQL text, stdlib json codec, every row copied into a dict
+             (the previous execute_query/execute_write), default statement cache
+     after   lib.db.connection + ConversationQueries: fixed SQL kept in the
+             statement cache for the connection's lifetime, orjson codec,
+             Records unless a dict is needed
+   "SELECT 1" on the same pool is the round-trip floor; overhead is the
+   difference. "first use" is the first load_turn_context on a new pool.
+
+Usage:
+    python scripts/bench_db_queries.py
+    POSTGRES_URL=postgres://... python scripts/bench_db_queries.py [--iterations 500]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from lib.data.recipes import RecipesData  # noqa: E402
+
+HISTORY_MESSAGES = 30
+
+
+def sample_history(count: int = HISTORY_MESSAGES):
+    recipes = RecipesData()
+    catalog = recipes.get_all_recipes()
+    messages = []
+    for i in range(count // 2):
+        if i % 3 == 2:
+            recipe = catalog[i % len(catalog)]
+            user, assistant = f"receta de {recipe['nombre'].lower()}", recipes.format_recipe(recipe)
+        else:
+            user, assistant = "son aptos para celíacos?", "Sí, todos nuestros productos son sin gluten 😊"
+        messages += [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+    return messages
+
+
+def timeit(fn, iterations: int) -> float:
+    """Mean microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def bench_codecs(iterations: int) -> None:
+    payload = sample_history()
+    text = json.dumps(payload)
+    print(f"JSONB codec, {len(payload)} messages ({len(text):,} chars)")
+    print(f"{'codec':<10}{'decode us':>12}{'encode us':>12}")
+    print(f"{'json':<10}{timeit(lambda: json.loads(text), iterations):>12.1f}"
+          f"{timeit(lambda: json.dumps(payload), iterations):>12.1f}")
+    try:
+        import orjson
+    except ImportError:
+        print("orjson    not installed")
+        return
+    print(f"{'orjson':<10}{timeit(lambda: orjson.loads(text), iterations):>12.1f}"
+          f"{timeit(lambda: orjson.dumps(payload).decode(), iterations):>12.1f}")
+
+
+# ---------------------------------------------------------------------------
+# Previous DB layer, reproduced for comparison
+# ---------------------------------------------------------------------------
+async def legacy_init(conn):
+    for type_name in ("jsonb", "json"):
+        await conn.set_type_codec(type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+
+class LegacyQueries:
+    def __init__(self, pool):
+        self.pool = pool
+
+    async def _row(self, sql, *args):
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(sql, *args)
+            return dict(row) if row else None
+
+    async def _rows(self, sql, *args):
+        async with self.pool.acquire() as conn:
+            return [dict(r) for r in await conn.fetch(sql, *args)]
+
+    async def load_turn_context(self, customer_id, limit):
+        from lib.db.queries.conversations import LOAD_TURN_CONTEXT
+
+        conversation = await self._row(LOAD_TURN_CONTEXT.sql, str(customer_id), limit)
+        messages = conversation.pop("recent_messages") or []
+        return {"conversation": conversation, "messages": messages}
+
+    async def get_messages_to_summarize(self, conversation_id, keep):
+        from lib.db.queries.conversations import GET_MESSAGES_TO_SUMMARIZE
+
+        return await self._rows(GET_MESSAGES_TO_SUMMARIZE.sql, str(conversation_id), keep)
+
+    async def select_one(self):
+        return await self._row("SELECT 1 AS one")
+
+
+async def measure(fn, iterations: int):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return statistics.mean(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+async def first_use(make_pool, load, runs: int) -> float:
+    """Mean microseconds of the first load_turn_context on a freshly created pool (connect excluded)"""
+    total = 0.0
+    for _ in range(runs):
+        pool = await make_pool()
+        try:
+            started = time.perf_counter()
+            await load(pool)
+            total += time.perf_counter() - started
+        finally:
+            await pool.close()
+    return total / runs * 1e6
+
+
+async def bench_queries(iterations: int) -> None:
+    import asyncpg
+    from lib.db import connection
+    from lib.db.queries import ConversationQueries
+
+    dsn = connection._dsn()
+    customer_id = uuid4()
+    legacy_pool = await asyncpg.create_pool(dsn=dsn, min_size=1, max_size=5, init=legacy_init)
+    legacy = LegacyQueries(legacy_pool)
+    try:
+        context = await ConversationQueries.load_turn_context(customer_id, HISTORY_MESSAGES)
+        conversation_id = context["conversation"]["id"]
+        history = sample_history(HISTORY_MESSAGES + 10)
+        for user, assistant in zip(history[::2], history[1::2]):
+            await ConversationQueries.add_turn(conversation_id, user["content"], assistant["content"])
+
+        pool = await connection.get_pool()
+
+        async def select_one():
+            async with pool.acquire() as conn:
+                return await conn.fetchrow("SELECT 1 AS one")
+
+        cases = [
+            ("SELECT 1", legacy.select_one, select_one),
+            ("load_turn_context",
+             lambda: legacy.load_turn_context(customer_id, HISTORY_MESSAGES),
+             lambda: ConversationQueries.load_turn_context(customer_id, HISTORY_MESSAGES)),
+            ("messages_to_summarize",
+             lambda: legacy.get_messages_to_summarize(conversation_id, 8),
+             lambda: ConversationQueries.get_messages_to_summarize(conversation_id, 8)),
+        ]
+        print(f"\nqueries, {iterations} iterations each (us)")
+        print(f"{'query':<24}{'before mean':>12}{'p50':>9}{'p95':>9}{'after mean':>12}{'p50':>9}{'p95':>9}{'change':>9}")
+        floors = {}
+        for label, before_fn, after_fn in cases:
+            for fn in (before_fn, after_fn):
+                await measure(fn, min(iterations, 50))  # warm up
+            before = await measure(before_fn, iterations)
+            after = await measure(after_fn, iterations)
+            if label == "SELECT 1":
+                floors = {"before": before[0], "after": after[0]}
+            print(f"{label:<24}{before[0]:>12,.0f}{before[1]:>9,.0f}{before[2]:>9,.0f}"
+                  f"{after[0]:>12,.0f}{after[1]:>9,.0f}{after[2]:>9,.0f}{(after[0] - before[0]) / before[0]:>+9.1%}")
+            if label != "SELECT 1":
+                print(f"{'  overhead over floor':<24}{before[0] - floors['before']:>12,.0f}{'':>18}"
+                      f"{after[0] - floors['after']:>12,.0f}")
+
+        runs = 10
+        before_first = await first_use(
+            lambda: asyncpg.create_pool(dsn=dsn, min_size=1, max_size=1, init=legacy_init),
+            lambda p: LegacyQueries(p).load_turn_context(customer_id, HISTORY_MESSAGES), runs)
+        after_first = await first_use(
+            lambda: asyncpg.create_pool(dsn=dsn, min_size=1, max_size=1, init=connection._init_connection,
+                                        **connection._statement_cache_options()),
+            lambda p: _load_on(p, customer_id), runs)
+        print(f"{'first use (new pool)':<24}{before_first:>12,.0f}{'':>18}{after_first:>12,.0f}{'':>18}"
+              f"{(after_first - before_first) / before_first:>+9.1%}")
+    finally:
+        await legacy.pool.execute("DELETE FROM conversations WHERE customer_id = $1", str(customer_id))
+        await legacy_pool.close()
+        await connection.close_pool()
+
+
+async def _load_on(pool, customer_id):
+    from lib.db.queries.conversations import LOAD_TURN_CONTEXT
+
+    async with pool.acquire() as conn:
+        return dict(await conn.fetchrow(LOAD_TURN_CONTEXT.sql, str(customer_id), HISTORY_MESSAGES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    bench_codecs(args.iterations * 4)
+    if os.environ.get("POSTGRES_URL"):
+        asyncio.run(bench_queries(args.iterations))
+    else:
+        print("\nPOSTGRES_URL not set: skipping the query benchmark")
+
+
+if __name__ == "__main__":
+    main()
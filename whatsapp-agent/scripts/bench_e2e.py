@@ -0,0 +1,467 @@
+"""End-to-end load benchmark of the webhook app against local stand-ins.
+
+Runs the real FastAPI app (`uvicorn api.index:app`, in a subprocess) with
+Claude and the Graph API replaced by the fakes in scripts/fake_services.py
+and a local Postgres, then drives signed webhook traffic from `--concurrency`
+simulated customers with a mix of message kinds:
+
+    chat     small talk Claude answers with text
+    tool     a request the fake Claude answers with a tool_use first
+    catalog  "receta <id>", answered by the intent router without Claude
+
+Each simulated customer waits for its reply before writing again. Latency is
+measured from the webhook POST to the WhatsApp messages the fake Graph API
+receives: `first_reply` is the first message (what the customer sees first),
+`complete` the message that ends the reply (it carries the request's
+"[ref:<id>]" tag, echoed by the fake Claude). The per-stage breakdown is the
+difference of the app's /api/metrics stage histograms before and after the run
+(plus tool calls and Claude turns by model tier).
+
+Results are written as JSON; `--compare` checks them against a previous
+result and exits 1 when throughput or p95/p99 latency regressed by more than
+`--max-regression`.
+
+Usage:
+    createdb panacea_bench
+    POSTGRES_URL=postgresql://localhost/panacea_bench python scripts/bench_e2e.py --init-db \
+        [--concurrency 20] [--messages 500] [--mix chat=0.5,tool=0.2,catalog=0.3] \
+        [--claude-ttft 0.5] [--env CLAUDE_STREAMING=false] [--output bench_e2e.json]
+    python scripts/bench_e2e.py ... --compare baseline.json [--max-regression 0.15]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from fake_services import FakeAnthropic, FakeGraph, free_port, serve  # noqa: E402
+
+APP_SECRET = "bench-secret"
+PHONE_NUMBER_ID = "123456789012345"
+
+CHAT_MESSAGES = [
+    "hola! son aptos para celíacos?",
+    "qué días abren?",
+    "cómo conservo el pan una vez horneado?",
+    "gracias, muy amables",
+    "se puede congelar la masa?",
+]
+TOOL_MESSAGES = [
+    "tienen algo con chocolate?",
+    "busco ideas con chocolate para un cumple",
+    "cómo hago el pan de molde?",
+]
+DEFAULT_MIX = "chat=0.5,tool=0.2,catalog=0.3"
+
+METRIC_LINE = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# (section, key, higher_is_better) checked by --compare
+COMPARED = [
+    ("throughput", "turns_per_second", True),
+    ("first_reply", "p95", False),
+    ("complete", "p95", False),
+    ("complete", "p99", False),
+]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in ("chat", "tool", "catalog"):
+            raise argparse.ArgumentTypeError(f"unknown message kind: {kind!r}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+    return {"count": len(values), "mean": round(statistics.mean(values), 1),
+            "p50": at(0.5), "p95": at(0.95), "p99": at(0.99), "max": round(ordered[-1], 1)}
+
+
+def webhook_body(phone: str, message_id: str, text: str) -> bytes:
+    return json.dumps({
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "987654321098765", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "5493510000000", "phone_number_id": PHONE_NUMBER_ID},
+            "contacts": [{"profile": {"name": "Bench"}, "wa_id": phone}],
+            "messages": [{"from": phone, "id": message_id, "timestamp": str(int(time.time())),
+                          "type": "text", "text": {"body": text}}],
+        }}]}],
+    }, ensure_ascii=False).encode()
+
+
+def sign(body: bytes) -> str:
+    return "sha256=" + hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# /api/metrics scraping
+# ---------------------------------------------------------------------------
+def parse_metrics(text: str) -> Dict[str, Dict[tuple, float]]:
+    """{metric sample name: {sorted label items: value}}"""
+    samples: Dict[str, Dict[tuple, float]] = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        key = tuple(sorted(LABEL.findall(labels or "")))
+        samples.setdefault(name, {})[key] = float(value)
+    return samples
+
+
+def histogram_quantile(q: float, buckets: List[tuple]) -> float:
+    """Prometheus-style quantile estimate from cumulative (upper bound, count) buckets"""
+    if not buckets or buckets[-1][1] == 0:
+        return 0.0
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower_bound, lower_count = bound, count
+    return buckets[-1][0]
+
+
+def histogram_delta(before, after, metric: str, label: str) -> Dict[str, Dict[str, float]]:
+    """Per-label count/mean/quantiles of the observations made between two scrapes"""
+    def get(name, key):
+        return after.get(name, {}).get(key, 0.0) - before.get(name, {}).get(key, 0.0)
+
+    breakdown = {}
+    for key in after.get(f"{metric}_count", {}):
+        count = get(f"{metric}_count", key)
+        if count <= 0:
+            continue
+        name = dict(key)[label]
+        buckets = sorted(
+            (float(dict(bucket_key)["le"]), get(f"{metric}_bucket", bucket_key))
+            for bucket_key in after.get(f"{metric}_bucket", {})
+            if dict(bucket_key).get(label) == name
+        )
+        buckets.append((float("inf"), count))
+        breakdown[name] = {
+            "count": int(count),
+            "mean_ms": round(get(f"{metric}_sum", key) / count * 1000, 1),
+            "p50_ms": round(histogram_quantile(0.5, buckets) * 1000, 1),
+            "p95_ms": round(histogram_quantile(0.95, buckets) * 1000, 1),
+            "p99_ms": round(histogram_quantile(0.99, buckets) * 1000, 1),
+        }
+    return dict(sorted(breakdown.items(), key=lambda item: -item[1]["mean_ms"]))
+
+
+def counter_delta(before, after, metric: str, label: str) -> Dict[str, int]:
+    return {
+        dict(key)[label]: int(value - before.get(metric, {}).get(key, 0.0))
+        for key, value in after.get(metric, {}).items()
+        if value - before.get(metric, {}).get(key, 0.0) > 0
+    }
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+class Load:
+    def __init__(self, args, client: httpx.AsyncClient, app_url: str, graph: FakeGraph):
+        self.args = args
+        self.client = client
+        self.app_url = app_url
+        self.graph = graph
+        self.rng = random.Random(args.seed)
+        self.run_id = f"{int(time.time()) % 1_000_000:06d}"
+        self.kinds = list(args.mix)
+        self.weights = [args.mix[k] for k in self.kinds]
+        from lib.data.recipes import RecipesData
+        self.recipe_ids = [r["id"] for r in RecipesData().get_all_recipes()]
+        self.results: List[Dict] = []
+
+    def phone(self, customer: int) -> str:
+        return f"549{self.run_id}{customer:04d}"
+
+    def message(self, n: int):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        ref = f"{self.run_id}-{n}"
+        if kind == "catalog":
+            return kind, ref, f"receta {self.rng.choice(self.recipe_ids)}"
+        text = self.rng.choice(CHAT_MESSAGES if kind == "chat" else TOOL_MESSAGES)
+        return kind, ref, f"{text} [ref:{ref}]"
+
+    async def send(self, n: int, customer: int, record: bool) -> None:
+        phone = self.phone(customer)
+        kind, ref, text = self.message(n)
+        body = webhook_body(phone, f"wamid.bench{ref}", text)
+        tag = f"[ref:{ref}]"
+        # Catalog answers don't go through Claude, so they carry no tag: they are a single message
+        done = (lambda d: True) if kind == "catalog" else (lambda d: tag in d.text)
+        start = self.graph.count(phone)
+        started = time.perf_counter()
+        result = {"kind": kind, "status": "ok"}
+        try:
+            response = await self.client.post(f"{self.app_url}/api/webhook", content=body, headers={
+                "content-type": "application/json", "x-hub-signature-256": sign(body)})
+            result["ack_ms"] = (time.perf_counter() - started) * 1000
+            if response.status_code != 200:
+                result["status"] = f"http_{response.status_code}"
+        except httpx.HTTPError as e:
+            result["status"] = type(e).__name__
+        if result["status"] == "ok":
+            deliveries = await self.graph.wait_for(phone, start, done, self.args.timeout)
+            if deliveries:
+                result["first_reply_ms"] = (deliveries[0].at - started) * 1000
+            finished = next((d for d in deliveries if done(d)), None)
+            if finished is None:
+                result["status"] = "timeout"
+            else:
+                result["complete_ms"] = (finished.at - started) * 1000
+                result["messages"] = deliveries.index(finished) + 1
+        result["finished"] = time.perf_counter()
+        if record:
+            self.results.append(result)
+
+    async def run(self, count: int, first: int = 0, record: bool = True) -> None:
+        """`count` messages from `concurrency` workers, each with its own customers (one message in flight each)"""
+        queue = iter(range(first, first + count))
+        concurrency = self.args.concurrency
+
+        async def worker(w: int) -> None:
+            own = list(range(w, self.args.customers, concurrency))
+            for i, n in enumerate(queue):
+                await self.send(n, own[i % len(own)], record)
+
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+
+
+# ---------------------------------------------------------------------------
+# App process
+# ---------------------------------------------------------------------------
+async def init_db(dsn: str) -> None:
+    import asyncpg
+
+    with open(os.path.join(ROOT, "scripts", "init_db.sql"), encoding="utf-8") as f:
+        schema = f.read()
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(schema)
+    finally:
+        await conn.close()
+
+
+def start_app(args, anthropic_url: str, graph_url: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "ANTHROPIC_API_KEY": "fake-key",
+        "ANTHROPIC_BASE_URL": anthropic_url,
+        "WHATSAPP_API_URL": f"{graph_url}/v18.0",
+        "WHATSAPP_ACCESS_TOKEN": "fake-token",
+        "WHATSAPP_PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "WHATSAPP_APP_SECRET": APP_SECRET,
+        "POSTGRES_URL": args.postgres,
+        "COALESCE_WINDOW": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    env.update(args.env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.index:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"app exited with status {process.returncode}")
+        try:
+            if (await client.get(f"{url}/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("app did not become ready")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+def build_report(args, load: Load, elapsed: float, before, after, fake: FakeAnthropic) -> Dict:
+    results = load.results
+    completed = [r for r in results if r["status"] == "ok"]
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[r["status"]] = statuses.get(r["status"], 0) + 1
+    config = {k: v for k, v in vars(args).items() if k not in ("compare", "output", "postgres")}
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "config": config,
+        },
+        "requests": {"sent": len(results), "completed": len(completed), "by_status": statuses},
+        "throughput": {
+            "elapsed_s": round(elapsed, 2),
+            "turns_per_second": round(len(completed) / elapsed, 2) if elapsed else 0.0,
+        },
+        "ack": percentiles([r["ack_ms"] for r in results if "ack_ms" in r]),
+        "first_reply": percentiles([r["first_reply_ms"] for r in results if "first_reply_ms" in r]),
+        "complete": percentiles([r["complete_ms"] for r in completed]),
+        "by_kind": {
+            kind: percentiles([r["complete_ms"] for r in completed if r["kind"] == kind])
+            for kind in args.mix
+        },
+        "stages": histogram_delta(before, after, "agent_stage_duration_seconds", "stage"),
+        "tools": histogram_delta(before, after, "agent_tool_duration_seconds", "tool"),
+        "model_tiers": histogram_delta(before, after, "agent_model_tier_duration_seconds", "tier"),
+        "turns": counter_delta(before, after, "agent_turns_total", "outcome"),
+        "fake_anthropic": dict(fake.requests),
+        "fake_anthropic_models": dict(fake.models),
+    }
+
+
+def print_report(report: Dict) -> None:
+    requests, throughput = report["requests"], report["throughput"]
+    print(f"\n{requests['completed']}/{requests['sent']} replies in {throughput['elapsed_s']}s "
+          f"({throughput['turns_per_second']} turns/s)  statuses {requests['by_status']}\n")
+    print(f"{'latency (ms)':<22}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    rows = [("webhook ack", report["ack"]), ("first reply", report["first_reply"]),
+            ("complete", report["complete"])]
+    rows += [(f"  {kind}", values) for kind, values in report["by_kind"].items()]
+    for label, values in rows:
+        if values:
+            print(f"{label:<22}{values['count']:>7}{values['mean']:>9,.0f}{values['p50']:>9,.0f}"
+                  f"{values['p95']:>9,.0f}{values['p99']:>9,.0f}")
+    print(f"\n{'stage (ms)':<22}{'count':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for section, prefix in (("stages", ""), ("tools", "tool "), ("model_tiers", "tier ")):
+        for name, values in report[section].items():
+            label = f"{prefix}{name}"
+            print(f"{label:<22}{values['count']:>7}{values['mean_ms']:>9,.1f}{values['p50_ms']:>9,.1f}"
+                  f"{values['p95_ms']:>9,.1f}{values['p99_ms']:>9,.1f}")
+
+
+def compare(report: Dict, baseline: Dict, max_regression: float) -> bool:
+    """Print the change against `baseline`; False if any compared figure regressed past the threshold"""
+    ok = True
+    print(f"\nvs. baseline {baseline.get('meta', {}).get('commit') or '?'} (max regression {max_regression:.0%})")
+    for section, key, higher_is_better in COMPARED:
+        old, new = baseline.get(section, {}).get(key), report.get(section, {}).get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        regressed = -change > max_regression if higher_is_better else change > max_regression
+        ok = ok and not regressed
+        print(f"  {section}.{key:<18}{old:>10,.1f} -> {new:>10,.1f}  {change:+7.1%}{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+async def main(args) -> int:
+    if args.init_db:
+        await init_db(args.postgres)
+    fake = FakeAnthropic(ttft=args.claude_ttft, tokens_per_second=args.claude_tps, jitter=args.claude_jitter,
+                         tool_scripts=args.tool_scripts, seed=args.seed)
+    graph = FakeGraph(latency=args.graph_latency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+    async with serve(fake.app) as anthropic_url, serve(graph.app) as graph_url, \
+            httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        port = free_port()
+        app_url = f"http://127.0.0.1:{port}"
+        process = start_app(args, anthropic_url, graph_url, port)
+        try:
+            await wait_ready(client, app_url, process)
+            load = Load(args, client, app_url, graph)
+            if args.warmup:
+                await load.run(args.warmup, record=False)
+            before = parse_metrics((await client.get(f"{app_url}/api/metrics")).text)
+            started = time.perf_counter()
+            await load.run(args.messages, first=args.warmup)
+            elapsed = max((r["finished"] for r in load.results), default=started) - started
+            after = parse_metrics((await client.get(f"{app_url}/api/metrics")).text)
+        finally:
+            process.terminate()
+            process.wait(timeout=15)
+
+    for r in load.results:
+        r.pop("finished", None)
+    report = build_report(args, load, elapsed, before, after, fake)
+    print_report(report)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nwrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            if not compare(report, json.load(f), args.max_regression):
+                return 1
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--postgres", default=os.environ.get("POSTGRES_URL", ""),
+                        help="local Postgres DSN (default: $POSTGRES_URL)")
+    parser.add_argument("--init-db", action="store_true", help="apply scripts/init_db.sql first")
+    parser.add_argument("--concurrency", type=int, default=10, help="customers writing at the same time")
+    parser.add_argument("--customers", type=int, default=0, help="distinct customers (default: 4 x concurrency)")
+    parser.add_argument("--messages", type=int, default=200, help="measured messages")
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured messages sent first")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"message kinds and weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--claude-ttft", type=float, default=0.5, help="fake Claude time to first token (s)")
+    parser.add_argument("--claude-tps", type=float, default=80.0, help="fake Claude output tokens per second")
+    parser.add_argument("--claude-jitter", type=float, default=0.25, help="+/- fraction applied to fake latencies")
+    parser.add_argument("--tool-scripts", type=lambda p: json.load(open(p, encoding="utf-8")), default=None,
+                        help='JSON list of {"match", "tool", "input"} rules for the fake Claude')
+    parser.add_argument("--graph-latency", type=float, default=0.05, help="fake Graph API latency per call (s)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="max wait for a reply (s)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app (repeatable), e.g. CLAUDE_STREAMING=false")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="bench_e2e.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="allowed relative regression for --compare (default 0.15)")
+    args = parser.parse_args()
+    if not args.postgres:
+        parser.error("a local Postgres is required: pass --postgres or set POSTGRES_URL")
+    args.env = dict(item.split("=", 1) for item in args.env)
+    args.customers = max(args.customers or 4 * args.concurrency, args.concurrency)
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,174 @@
+"""Compare prompt history size: fixed 10-message window vs. token budget.
+
+Replays conversations turn by turn and measures the history that would be
+sent to Claude at each turn under both policies (estimated input tokens and
+message count), then how often the rolling summary would be rewritten for a
+few SUMMARY_TRIGGER_MESSAGES values, and how many messages wait outside both
+the window and the summary meanwhile. Conversations come from a JSONL export (one
+{"messages": [{"role", "content"}, ...]} per line, e.g. dumped from
+conversation_messages) or, by default, are generated from the recipe catalog:
+chit-chat mixed with recipe cards and listings, which is what makes real
+histories spiky.
+
+Usage:
+    python scripts/bench_history_window.py [--conversations export.jsonl] [--budget 700]
+    ANTHROPIC_API_KEY=... python scripts/bench_history_window.py --exact 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from lib.agent.history import estimate_tokens, normalize_roles, select_history  # noqa: E402
+from lib.config import HISTORY_TOKEN_BUDGET, SUMMARY_TRIGGER_MESSAGES  # noqa: E402
+from lib.data.recipes import RecipesData  # noqa: E402
+
+FIXED_WINDOW = 10
+
+CHIT_CHAT = [
+    ("hola!", "¡Hola! 😊 Soy Panacea Assistant. ¿En qué te puedo ayudar hoy?"),
+    ("gracias", "¡De nada! Cualquier cosa me escribís 🙂"),
+    ("son aptos para celíacos?", "Sí, todos nuestros productos son sin gluten y aptos para celíacos."),
+    ("qué días abren?", "Te recomiendo consultar los horarios directamente en el local. ¿Te ayudo con alguna receta?"),
+    ("ok perfecto", "¡Genial! ¿Necesitás algo más?"),
+    ("me das las cantidades?", "Lo siento, las cantidades son parte de nuestras fórmulas exclusivas y no puedo compartirlas."),
+]
+
+
+def generate_conversations(count: int, seed: int):
+    """Synthetic conversations: ~60% chit-chat turns, the rest recipe cards and listings"""
+    rng = random.Random(seed)
+    recipes = RecipesData()
+    catalog = recipes.get_all_recipes()
+    conversations = []
+    for _ in range(count):
+        messages = []
+        for _ in range(rng.randint(6, 40)):
+            roll = rng.random()
+            if roll < 0.6:
+                user, assistant = rng.choice(CHIT_CHAT)
+            elif roll < 0.9:
+                recipe = rng.choice(catalog)
+                user = f"me pasás la receta de {recipe['nombre'].lower()}?"
+                assistant = "¡Claro! Acá la tenés:\n\n" + recipes.format_recipe(recipe)
+            else:
+                user, assistant = "qué recetas tienen?", recipes.format_recipe_list()
+            messages += [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+        conversations.append(messages)
+    return conversations
+
+
+def load_conversations(path: str):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["messages"] for line in f if line.strip()]
+
+
+def replay(conversations, budget: int):
+    """Per turn: (fixed window history, token-budget history), each ending with that turn's user message"""
+    for messages in conversations:
+        messages = normalize_roles(messages)
+        for i, message in enumerate(messages):
+            if message["role"] != "user":
+                continue
+            history = messages[:i + 1]
+            fixed = normalize_roles(history[-FIXED_WINDOW:])
+            budgeted = select_history(history, budget)
+            yield fixed, budgeted
+
+
+def replay_folds(conversations, budget: int, trigger: int):
+    """
+    Replay the summarizer with the token budget: history is what follows the
+    summary, and after each turn everything older than its window is folded
+    once `trigger` messages are out of it. Returns (turns, folds, gaps), gaps
+    being the unsummarized messages left out of each turn's window.
+    """
+    turns = folds = 0
+    gaps = []
+    for messages in conversations:
+        messages = normalize_roles(messages)
+        summarized = 0
+        for i, message in enumerate(messages):
+            if message["role"] != "user":
+                continue
+            turns += 1
+            history = messages[summarized:i + 1]
+            kept = len(select_history(history, budget))
+            gaps.append(len(history) - kept)
+            # The stored reply joins the window
+            if trigger > 0 and len(history) - kept >= trigger:
+                folds += 1
+                summarized = i + 1 - kept
+    return turns, folds, gaps
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(label: str, windows):
+    tokens = [sum(estimate_tokens(m) for m in w) for w in windows]
+    sizes = [len(w) for w in windows]
+    print(f"{label:<14}{statistics.mean(tokens):>10,.0f}{percentile(tokens, 0.5):>10,}"
+          f"{percentile(tokens, 0.95):>10,}{max(tokens):>10,}{statistics.mean(sizes):>12.1f}")
+    return tokens
+
+
+async def exact_sample(pairs, count: int):
+    """Compare the local estimate with Anthropic's token counter on a sample of windows"""
+    import anthropic
+
+    client = anthropic.AsyncAnthropic()
+    model = "claude-sonnet-4-20250514"
+    errors = []
+    for _, window in random.Random(0).sample(pairs, min(count, len(pairs))):
+        exact = (await client.messages.count_tokens(model=model, messages=window)).input_tokens
+        estimate = sum(estimate_tokens(m) for m in window)
+        errors.append((estimate - exact) / exact)
+    print(f"\nestimate vs exact over {len(errors)} windows: mean error {statistics.mean(errors):+.1%}, "
+          f"worst {max(errors, key=abs):+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", help="JSONL export to replay (default: generated)")
+    parser.add_argument("--count", type=int, default=200, help="generated conversations")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--budget", type=int, default=HISTORY_TOKEN_BUDGET, help="history token budget")
+    parser.add_argument("--triggers", type=int, nargs="+",
+                        default=sorted({2, 6, 10, 16, SUMMARY_TRIGGER_MESSAGES}),
+                        help="SUMMARY_TRIGGER_MESSAGES values to replay")
+    parser.add_argument("--exact", type=int, default=0, metavar="N",
+                        help="also check the estimator against the token counting API on N windows")
+    args = parser.parse_args()
+
+    conversations = (load_conversations(args.conversations) if args.conversations
+                     else generate_conversations(args.count, args.seed))
+    pairs = list(replay(conversations, args.budget))
+    print(f"{len(conversations)} conversations, {len(pairs)} turns, budget {args.budget} tokens\n")
+    print(f"{'policy':<14}{'mean tok':>10}{'p50':>10}{'p95':>10}{'max':>10}{'avg msgs':>12}")
+    fixed = summarize(f"fixed {FIXED_WINDOW} msgs", [f for f, _ in pairs])
+    budgeted = summarize("token budget", [b for _, b in pairs])
+    over = sum(t > args.budget for t in fixed)
+    print(f"\nfixed window over budget on {over} of {len(pairs)} turns ({over / len(pairs):.0%}); "
+          f"p95 prompt history {percentile(fixed, 0.95):,} -> {percentile(budgeted, 0.95):,} tokens")
+
+    print(f"\n{'fold trigger':<14}{'folds/100 turns':>17}{'gap mean':>10}{'gap max':>10}")
+    for trigger in args.triggers:
+        turns, folds, gaps = replay_folds(conversations, args.budget, trigger)
+        print(f"{trigger:<14}{folds / turns * 100:>17.1f}{statistics.mean(gaps):>10.1f}{max(gaps):>10}")
+
+    if args.exact:
+        asyncio.run(exact_sample(pairs, args.exact))
+
+
+if __name__ == "__main__":
+    main()
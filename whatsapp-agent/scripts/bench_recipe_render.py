@@ -0,0 +1,75 @@
+"""Micro-benchmark: memoized recipe rendering vs. rendering on every tool call.
+
+Usage:
+    python scripts/bench_recipe_render.py [--repeat 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.data.recipes import RecipesData
+from lib.agent.tools import ToolExecutor
+
+
+def per_call_us(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) * 1_000_000 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    data = RecipesData()
+    recipes = data.get_all_recipes()
+    executor = ToolExecutor()
+    loop = asyncio.new_event_loop()
+    results = data.search_recipes("chocolate")
+
+    async def render_tool():
+        return data._render_recipe_list(recipes)
+
+    rows = [
+        (
+            "recipe card (all recipes)",
+            lambda: [data._render_recipe(r) for r in recipes],
+            lambda: [data.format_recipe(r) for r in recipes],
+        ),
+        (
+            "full listing",
+            lambda: data._render_recipe_list(recipes),
+            lambda: data.format_recipe_list(),
+        ),
+        (
+            "search result list",
+            lambda: data._render_recipe_list(results),
+            lambda: data.format_recipe_list(results),
+        ),
+        (
+            "tool list_recipes",
+            lambda: loop.run_until_complete(render_tool()),
+            lambda: loop.run_until_complete(executor.execute("list_recipes", {})),
+        ),
+    ]
+
+    print(f"catalog version {data.version}, {len(recipes)} recipes, {args.repeat} calls each")
+    print(f"{'':<28}{'render':>12}{'memoized':>12}")
+    for label, render, memoized in rows:
+        memoized()  # warm the cache
+        render_us = per_call_us(render, args.repeat)
+        memo_us = per_call_us(memoized, args.repeat)
+        print(f"{label:<28}{render_us:>10.1f}us{memo_us:>10.1f}us")
+
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
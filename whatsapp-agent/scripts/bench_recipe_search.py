@@ -0,0 +1,95 @@
+"""Micro-benchmark: RecipeIndex search vs. the previous linear substring scan.
+
+The real catalog is replicated (with suffixed names) up to --size recipes.
+
+Usage:
+    python scripts/bench_recipe_search.py [--size 10000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.data.search import RecipeIndex
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "recetas2025.json")
+
+QUERIES = [
+    "chocolate", "azúcar", "Azucar", "pan de molde", "coco", "zanahria",
+    "ricota", "sorrentino", "mlde", "frutilla", "dulce de leche", "harina",
+]
+
+
+def load_catalog(size: int) -> list:
+    with open(CATALOG_PATH, "r", encoding="utf-8") as f:
+        base = json.load(f)["recetas"]
+    catalog = []
+    while len(catalog) < size:
+        copy = len(catalog) // len(base)
+        for recipe in base:
+            if len(catalog) >= size:
+                break
+            scaled = dict(recipe)
+            scaled["id"] = len(catalog) + 1
+            if copy:
+                scaled["nombre"] = f"{recipe['nombre']} {copy}"
+            catalog.append(scaled)
+    return catalog
+
+
+def linear_scan(recipes: list, query: str) -> list:
+    """The pre-index RecipesData.search_recipes implementation"""
+    query_lower = query.lower()
+    results = []
+    for recipe in recipes:
+        if query_lower in recipe.get("nombre", "").lower():
+            results.append(recipe)
+            continue
+        for ing in recipe.get("ingredientes", []):
+            if query_lower in ing.get("nombre", "").lower():
+                results.append(recipe)
+                break
+    return results
+
+
+def timed(fn, repeat: int) -> float:
+    """Mean milliseconds per query over `repeat` passes of QUERIES"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in QUERIES:
+            fn(query)
+    return (time.perf_counter() - started) * 1000 / (repeat * len(QUERIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    recipes = load_catalog(args.size)
+
+    started = time.perf_counter()
+    index = RecipeIndex(recipes)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    scan_ms = timed(lambda q: linear_scan(recipes, q), args.repeat)
+    index_ms = timed(lambda q: index.search(q, args.limit), args.repeat)
+
+    print(f"catalog size:      {len(recipes)} recipes")
+    print(f"index build:       {build_ms:.1f} ms (once, at load)")
+    print(f"linear scan:       {scan_ms:.3f} ms/query")
+    print(f"index top-{args.limit}:      {index_ms:.3f} ms/query ({scan_ms / index_ms:.1f}x)")
+    print()
+    print(f"{'query':<16}{'scan hits':>10}{'index hits':>12}")
+    for query in QUERIES:
+        print(f"{query:<16}{len(linear_scan(recipes, query)):>10}{len(index.search(query)):>12}")
+
+
+if __name__ == "__main__":
+    main()
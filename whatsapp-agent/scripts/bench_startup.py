@@ -0,0 +1,189 @@
+"""Cold-start benchmark for api/index.py.
+
+For each route (health, verify, message) a fresh interpreter imports the app
+and serves one request through the raw ASGI interface; the script reports the
+import time, the time to the first response body and which heavy packages were
+loaded by then. A `python -X importtime` breakdown of `import api.index` is
+printed as well (packages that are not imported are omitted). Exits non-zero
+when a route exceeds its threshold or loads a package it must not need.
+
+Usage:
+    python scripts/bench_startup.py [--repeat 5] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_PACKAGES = ("anthropic", "asyncpg", "httpx", "pydantic", "fastapi")
+
+# Regression thresholds: max median ms to first response, and packages that
+# must not be imported before that response is sent
+THRESHOLDS = {
+    "health": {"max_ms": 1000, "forbidden": ("anthropic", "asyncpg", "httpx")},
+    "verify": {"max_ms": 1000, "forbidden": ("anthropic", "asyncpg", "httpx")},
+    "message": {"max_ms": 1500, "forbidden": ("anthropic",)},
+}
+
+MESSAGE_PAYLOAD = {
+    "object": "whatsapp_business_account",
+    "entry": [{
+        "id": "0",
+        "changes": [{
+            "field": "messages",
+            "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"display_phone_number": "0", "phone_number_id": "0"},
+                "contacts": [{"wa_id": "5490000000000", "profile": {"name": "Bench"}}],
+                "messages": [{
+                    "from": "5490000000000",
+                    "id": "wamid.bench",
+                    "timestamp": "0",
+                    "type": "text",
+                    "text": {"body": "hola"},
+                }],
+            },
+        }],
+    }],
+}
+
+# Runs in a fresh interpreter; prints one JSON line with the measurements
+DRIVER = r'''
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, ROOT)
+import api.index
+imported = time.perf_counter()
+
+route, body = ROUTE, BODY.encode()
+scopes = {
+    "health": ("GET", "/api/health", b""),
+    "verify": ("GET", "/api/webhook", b"hub.mode=subscribe&hub.verify_token=bench&hub.challenge=42"),
+    "message": ("POST", "/api/webhook", b""),
+}
+method, path, query = scopes[route]
+scope = {
+    "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+    "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+    "query_string": query, "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+}
+
+async def serve_one():
+    done = asyncio.Event()
+    result = {}
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            result["responded"] = time.perf_counter()
+            result["modules"] = [m for m in HEAVY if m in sys.modules]
+            done.set()
+
+    # Background work queued by the route is cancelled once the response is out
+    task = asyncio.create_task(api.index.app(scope, receive, send))
+    await done.wait()
+    task.cancel()
+    return result
+
+result = asyncio.run(serve_one())
+print(json.dumps({
+    "status": result["status"],
+    "import_ms": (imported - started) * 1000,
+    "first_response_ms": (result["responded"] - started) * 1000,
+    "modules": result["modules"],
+}))
+'''
+
+
+def run_route(route: str) -> dict:
+    body = json.dumps(MESSAGE_PAYLOAD) if route == "message" else ""
+    code = (
+        f"ROOT = {ROOT!r}\nROUTE = {route!r}\nBODY = {body!r}\nHEAVY = {HEAVY_PACKAGES!r}\n"
+        + DRIVER
+    )
+    env = {**os.environ, "WHATSAPP_VERIFY_TOKEN": "bench"}
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError(f"{route} driver failed:\n{proc.stderr}")
+
+
+def import_breakdown() -> dict:
+    """Cumulative import time (ms) of the app and the heavy packages it loads"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.index"],
+        cwd=ROOT, capture_output=True, text=True, timeout=60,
+    )
+    watched = ("api.index", "lib.agent.core", "starlette") + HEAVY_PACKAGES
+    totals = {}
+    for line in proc.stderr.splitlines():
+        parts = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if name in watched:
+            totals[name] = int(parts[1]) / 1000
+    return totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="fresh processes per route (median is reported)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = {"routes": {}, "imports_ms": {}}
+    failures = []
+
+    print(f"{'route':<10}{'status':>8}{'import':>12}{'first resp':>14}{'limit':>10}  heavy modules loaded")
+    for route, threshold in THRESHOLDS.items():
+        runs = [run_route(route) for _ in range(args.repeat)]
+        import_ms = statistics.median(r["import_ms"] for r in runs)
+        first_ms = statistics.median(r["first_response_ms"] for r in runs)
+        modules = sorted({m for r in runs for m in r["modules"]})
+        results["routes"][route] = {
+            "status": runs[0]["status"],
+            "import_ms": round(import_ms, 1),
+            "first_response_ms": round(first_ms, 1),
+            "modules": modules,
+        }
+        print(f"{route:<10}{runs[0]['status']:>8}{import_ms:>10.1f}ms{first_ms:>12.1f}ms{threshold['max_ms']:>8}ms  {', '.join(modules)}")
+
+        if first_ms > threshold["max_ms"]:
+            failures.append(f"{route}: first response {first_ms:.0f} ms > {threshold['max_ms']} ms")
+        loaded = set(modules) & set(threshold["forbidden"])
+        if loaded:
+            failures.append(f"{route}: imported {', '.join(sorted(loaded))} before responding")
+
+    print("\nimport api.index (python -X importtime, cumulative, nested packages overlap):")
+    for package, ms in import_breakdown().items():
+        results["imports_ms"][package] = round(ms, 1)
+        print(f"  {package:<20}{ms:>10.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if failures:
+        print("\nREGRESSION:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Benchmark webhook intake on recorded Meta payloads.
+
+1. Parsing alone: the previous intake (request.body() + request.json(), then
+   the nested WhatsAppWebhookPayload model) vs. the fast path (status
+   pre-check on the raw bytes, then one TypeAdapter.validate_json pass).
+2. Requests/sec through the real ASGI app (signature check included). Text
+   payloads get a fresh message ID per request so deduplication doesn't
+   short-circuit them; the agent turn queued after the response is cancelled.
+
+Usage:
+    python scripts/bench_webhook_intake.py [--seconds 2]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APP_SECRET = "bench-secret"
+# The app logs skipped messages at INFO; keep the table readable
+os.environ.update({"WHATSAPP_APP_SECRET": APP_SECRET, "DEDUP_DB": "false", "JOB_QUEUE": "false", "LOG_LEVEL": "WARNING"})
+
+from lib.schemas.whatsapp import WhatsAppWebhookPayload, has_messages, parse_webhook_messages  # noqa: E402
+
+METADATA = {"display_phone_number": "5493510000000", "phone_number_id": "123456789012345"}
+CONTACT = {"profile": {"name": "Cliente"}, "wa_id": "5493511111111"}
+
+
+def _payload(value: dict) -> dict:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "987654321098765",
+            "changes": [{"value": {"messaging_product": "whatsapp", "metadata": METADATA, **value}, "field": "messages"}],
+        }],
+    }
+
+
+def _status(status: str) -> dict:
+    entry = {
+        "id": "wamid.HBgNNTQ5MzUxMTExMTExMRUCABEYEjQ2QzM1RkM3RjE3QjY5RTc5NQA=",
+        "status": status,
+        "timestamp": "1718000000",
+        "recipient_id": "5493511111111",
+    }
+    if status == "sent":
+        entry["conversation"] = {"id": "b6e5d1c1f0a8e4c2d3b9a7f6e5d4c3b2", "expiration_timestamp": "1718086400",
+                                 "origin": {"type": "service"}}
+        entry["pricing"] = {"billable": True, "pricing_model": "CBP", "category": "service"}
+    return _payload({"statuses": [entry]})
+
+
+def _text(*bodies: str) -> dict:
+    return _payload({
+        "contacts": [CONTACT],
+        "messages": [
+            {"from": "5493511111111", "id": f"wamid.MSGID{i}", "timestamp": "1718000000",
+             "text": {"body": body}, "type": "text"}
+            for i, body in enumerate(bodies)
+        ],
+    })
+
+
+PAYLOADS = {
+    "status sent": _status("sent"),
+    "status delivered": _status("delivered"),
+    "status read": _status("read"),
+    "text": _text("hola, tienen la receta de pan de molde?"),
+    "text burst x3": _text("hola", "tienen", "pan de molde?"),
+    "image": _payload({
+        "contacts": [CONTACT],
+        "messages": [{"from": "5493511111111", "id": "wamid.MSGIDIMG", "timestamp": "1718000000", "type": "image",
+                      "image": {"mime_type": "image/jpeg", "sha256": "abc", "id": "1234567890"}}],
+    }),
+}
+
+
+def old_parse(body: bytes):
+    json.loads(body)  # request.body() then request.json() decoded twice
+    data = json.loads(body)
+    data["entry"][0]["changes"][0]["value"]
+    return WhatsAppWebhookPayload(**data).get_messages()
+
+
+def new_parse(body: bytes):
+    if not has_messages(body):
+        return []
+    return parse_webhook_messages(body)
+
+
+def ops_per_sec(fn, body: bytes, seconds: float) -> float:
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        for _ in range(200):
+            fn(body)
+        calls += 200
+    return calls / (time.perf_counter() - started)
+
+
+async def asgi_requests_per_sec(app, body: bytes, seconds: float) -> float:
+    template = body
+    calls, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        body = template.replace(b"wamid.MSGID", f"wamid.{calls}-".encode())
+        signature = "sha256=" + hmac.new(APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": "/api/webhook", "raw_path": b"/api/webhook",
+            "query_string": b"", "root_path": "", "server": ("bench", 80), "client": ("bench", 1),
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-hub-signature-256", signature.encode()),
+            ],
+        }
+        done = asyncio.Event()
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                assert message["status"] == 200, message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                done.set()
+
+        # Background agent turns start after the response; cancel them
+        task = asyncio.create_task(app(scope, receive, send))
+        await done.wait()
+        task.cancel()
+        calls += 1
+    return calls / (time.perf_counter() - started)
+
+
+async def run_asgi(seconds: float):
+    from api.index import app
+
+    return {name: await asgi_requests_per_sec(app, json.dumps(p).encode(), seconds) for name, p in PAYLOADS.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0, help="duration of each measurement")
+    args = parser.parse_args()
+
+    print(f"{'payload':<18}{'old parse/s':>14}{'new parse/s':>14}{'speedup':>10}")
+    for name, payload in PAYLOADS.items():
+        body = json.dumps(payload).encode()
+        assert [m.message_id for m in old_parse(body)] == [m.message_id for m in new_parse(body)], name
+        old = ops_per_sec(old_parse, body, args.seconds)
+        new = ops_per_sec(new_parse, body, args.seconds)
+        print(f"{name:<18}{old:>14,.0f}{new:>14,.0f}{new / old:>9.1f}x")
+
+    rates = asyncio.run(run_asgi(args.seconds))
+    print(f"\n{'payload':<18}{'ASGI req/s':>14}")
+    for name, rate in rates.items():
+        print(f"{name:<18}{rate:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
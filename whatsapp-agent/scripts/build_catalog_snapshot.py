@@ -0,0 +1,35 @@
+"""Compile data/recetas2025.json into the binary snapshot loaded on cold start.
+
+The snapshot holds the compact recipe records and the prebuilt search index.
+It is only used while it matches the JSON it was compiled from. Vercel runs
+this as the build command (vercel.json); snapshots are not committed. Needs
+only the standard library.
+
+Usage:
+    python scripts/build_catalog_snapshot.py [path/to/recetas.json]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.data.catalog import compile_snapshot, load_catalog
+from lib.data.recipes import RECIPES_JSON_PATH
+
+
+def main():
+    json_path = sys.argv[1] if len(sys.argv) > 1 else RECIPES_JSON_PATH
+    snapshot_path = compile_snapshot(json_path)
+
+    started = time.perf_counter()
+    catalog = load_catalog(json_path)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    print(f"Wrote {snapshot_path} ({os.path.getsize(snapshot_path)} bytes)")
+    print(f"Catalog version {catalog.version}: {len(catalog.recipes)} recipes, loads in {elapsed_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
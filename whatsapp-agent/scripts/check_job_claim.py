@@ -0,0 +1,67 @@
+"""Check how JobQueries.claim treats jobs whose claim lapsed, against a real Postgres.
+
+Runs on a temporary copy of the `jobs` table (the pool is limited to one
+connection, whose temp table shadows the real one), so live jobs are never
+touched. Cases:
+
+    lapsed, attempts left    claimed again, attempts incremented
+    lapsed, last attempt     dead-lettered, not returned as claimed
+    still locked             not claimed
+
+Usage:
+    POSTGRES_URL=postgres://... python scripts/check_job_claim.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update({"LOG_LEVEL": "WARNING", "DB_POOL_MIN_SIZE": "1", "DB_POOL_MAX_SIZE": "1"})
+
+from lib.db import connection  # noqa: E402
+from lib.db.queries import JobQueries  # noqa: E402
+from lib.db.queries.jobs import LAPSED_ERROR  # noqa: E402
+
+KIND = "check_job_claim"
+
+INSERT_JOB = """
+    INSERT INTO jobs (kind, payload, status, attempts, max_attempts, locked_until)
+    VALUES ($1, $2::jsonb, 'running', $3, 3, NOW() + make_interval(secs => $4))
+    RETURNING id
+"""
+
+
+async def main() -> int:
+    await connection.execute_write("CREATE TEMP TABLE jobs (LIKE public.jobs INCLUDING ALL)")
+    try:
+        retry = (await connection.execute_write(INSERT_JOB, (KIND, {"case": "retry"}, 1, -60)))["id"]
+        last = (await connection.execute_write(INSERT_JOB, (KIND, {"case": "last"}, 3, -60)))["id"]
+        locked = (await connection.execute_write(INSERT_JOB, (KIND, {"case": "locked"}, 1, 300)))["id"]
+
+        rows = {row["id"]: row for row in await JobQueries.claim(10, 300)}
+        assert locked not in rows, "a job whose claim has not lapsed was claimed"
+        assert rows[retry]["status"] == "running" and rows[retry]["attempts"] == 2, rows[retry]
+        print("lapsed, attempts left  ok  claimed again (attempt 2/3)")
+
+        assert rows[last]["status"] == "dead" and rows[last]["attempts"] == 3, rows[last]
+        stored = await connection.execute_query(
+            "SELECT status, locked_until, last_error FROM jobs WHERE id = $1", (last,), fetch_one=True)
+        assert stored["status"] == "dead" and stored["locked_until"] is None, stored
+        assert stored["last_error"] == LAPSED_ERROR, stored
+        again = await JobQueries.claim(10, 300)
+        assert all(row["id"] != last for row in again), "a dead-lettered job was claimed again"
+        print("lapsed, last attempt   ok  dead-lettered, not re-run")
+        print("still locked           ok  not claimed")
+    finally:
+        await connection.execute_write("DROP TABLE IF EXISTS pg_temp.jobs")
+        await connection.close_pool()
+    print("all checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    if not os.environ.get("POSTGRES_URL"):
+        print("POSTGRES_URL not set: skipping")
+        sys.exit(0)
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,211 @@
+"""Check outbound pacing and retries against a local fake Graph API.
+
+Starts a fake messages endpoint on 127.0.0.1 and sends through the real
+WhatsAppService + OutboundScheduler. The fake server reads its behaviour from
+the message text: "fail:<status>[:<code>]:<n>:<id>" fails the first n
+attempts with that status (and Graph API error code), optionally with a
+Retry-After header when the status is 429; "slow:<id>" accepts the message
+but answers after SLOW_RESPONSE seconds.
+
+Usage:
+    python scripts/check_outbound_scheduler.py
+"""
+
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.update({"LOG_LEVEL": "ERROR", "WHATSAPP_ACCESS_TOKEN": "fake-token"})
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from lib.services.outbound import OutboundScheduler  # noqa: E402
+from lib.services.whatsapp import WhatsAppService  # noqa: E402
+
+RETRY_AFTER = 0.3
+SLOW_RESPONSE = 0.5
+
+fake_graph = FastAPI()
+attempts = {}
+delivered = []
+
+
+@fake_graph.post("/v18.0/{phone_number_id}/messages")
+async def messages(phone_number_id: str, request: Request):
+    payload = await request.json()
+    if payload.get("status") == "read":
+        return {"success": True}
+    text = payload["text"]["body"]
+    attempts[text] = attempts.get(text, 0) + 1
+    if text.startswith("slow:"):
+        delivered.append((payload["to"], text, time.monotonic()))
+        await asyncio.sleep(SLOW_RESPONSE)
+    if text.startswith("fail:"):
+        parts = text.split(":")
+        status, failures = int(parts[1]), int(parts[-2])
+        code = int(parts[2]) if len(parts) == 5 else None
+        if attempts[text] <= failures:
+            headers = {"Retry-After": str(RETRY_AFTER)} if status == 429 else {}
+            return JSONResponse({"error": {"message": "fake failure", "code": code}}, status, headers=headers)
+    delivered.append((payload["to"], text, time.monotonic()))
+    return {"messages": [{"id": f"wamid.{len(delivered)}"}]}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_service(client: httpx.AsyncClient, port: int, **limits) -> WhatsAppService:
+    params = dict(rate=0, burst=1, recipient_rate=0, recipient_burst=1, max_retries=3,
+                  backoff_base=0.05, backoff_max=1.0)
+    params.update(limits)
+    service = WhatsAppService(client=client, scheduler=OutboundScheduler(**params))
+    service.messages_url = f"http://127.0.0.1:{port}/v18.0/123/messages"
+    return service
+
+
+async def check_retries(service: WhatsAppService):
+    delivered.clear()
+    started = time.monotonic()
+    await service.send_message("111", "fail:429:1:a")
+    assert attempts["fail:429:1:a"] == 2, attempts
+    assert time.monotonic() - started >= RETRY_AFTER, "Retry-After was not honored"
+
+    await service.send_message("111", "fail:503:2:b")
+    assert attempts["fail:503:2:b"] == 3, attempts
+
+    await service.send_message("111", "fail:400:130429:1:c")
+    assert attempts["fail:400:130429:1:c"] == 2, "throughput error (130429) should be retried"
+
+    try:
+        await service.send_message("111", "fail:400:100:1:d")
+    except httpx.HTTPStatusError:
+        pass
+    else:
+        raise AssertionError("a plain 400 should not be retried")
+    assert attempts["fail:400:100:1:d"] == 1, attempts
+
+    try:
+        await service.send_message("111", "fail:500:9:e")
+    except httpx.HTTPStatusError:
+        pass
+    else:
+        raise AssertionError("a persistent 500 should fail after max_retries")
+    assert attempts["fail:500:9:e"] == 4, attempts
+    stats = service.scheduler.stats()
+    assert stats["sent"] == 3 and stats["failed"] == 2 and stats["retried"] == 1 + 2 + 1 + 3, stats
+    print(f"retries            ok  {stats}")
+
+
+async def check_retry_after(client: httpx.AsyncClient, port: int):
+    # Retry-After is honored even when it is longer than the backoff cap
+    service = make_service(client, port, backoff_max=RETRY_AFTER / 10)
+    started = time.monotonic()
+    await service.send_message("222", "fail:429:1:f")
+    assert attempts["fail:429:1:f"] == 2, attempts
+    assert time.monotonic() - started >= RETRY_AFTER, "Retry-After was capped by backoff_max"
+
+    # ...and a send Meta wants delayed beyond retry_after_max fails without retrying early
+    service = make_service(client, port, retry_after_max=RETRY_AFTER / 10)
+    try:
+        await service.send_message("222", "fail:429:1:g")
+    except httpx.HTTPStatusError:
+        pass
+    else:
+        raise AssertionError("a Retry-After over retry_after_max should fail the send")
+    assert attempts["fail:429:1:g"] == 1, attempts
+    print(f"retry-after        ok  waited {RETRY_AFTER}s past a {RETRY_AFTER / 10}s backoff cap; "
+          f"over retry_after_max gave up without retrying")
+
+
+async def check_order(service: WhatsAppService):
+    delivered.clear()
+    chunks = ["part 1", "fail:503:2:part 2", "part 3", "fail:429:1:part 4", "part 5"]
+    multi = asyncio.create_task(service.send_messages("222", chunks))
+    await asyncio.sleep(0.01)
+    # Submitted while the multi-part reply is in flight: must not land in between
+    single = asyncio.create_task(service.send_message("222", "later"))
+    other = asyncio.create_task(service.send_message("333", "other customer"))
+    await asyncio.gather(multi, single, other)
+    order = [text for to, text, _ in delivered if to == "222"]
+    assert order == chunks + ["later"], order
+    # The other customer isn't held up by 222's retries
+    assert [text for to, text, _ in delivered].index("other customer") < 2, delivered
+    print("order              ok  chunks delivered in order, other recipients not blocked")
+
+
+async def check_pacing(service: WhatsAppService):
+    delivered.clear()
+    started = time.monotonic()
+    await asyncio.gather(*(service.send_message("444", f"paced {i}") for i in range(6)))
+    per_recipient = time.monotonic() - started
+    # 5 msg/s with a burst of 1: six messages need at least a second
+    assert per_recipient >= 0.95, per_recipient
+    times = [t for _, _, t in delivered]
+    assert all(b - a >= 0.15 for a, b in zip(times, times[1:])), times
+
+    delivered.clear()
+    started = time.monotonic()
+    await asyncio.gather(*(service.send_message(f"5{i:02d}", "fan out") for i in range(30)))
+    global_elapsed = time.monotonic() - started
+    # Global 50 msg/s with a burst of 10: 20 messages past the burst take ~0.4 s
+    assert 0.35 <= global_elapsed < 1.5, global_elapsed
+    print(f"pacing             ok  6 msgs to one recipient in {per_recipient:.2f}s, "
+          f"30 recipients in {global_elapsed:.2f}s")
+
+
+async def check_transport_errors(client: httpx.AsyncClient, port: int):
+    service = make_service(client, free_port(), max_retries=2)
+    try:
+        await service.send_message("666", "nobody listening")
+    except httpx.ConnectError:
+        pass
+    else:
+        raise AssertionError("connection errors should surface after retries")
+    stats = service.scheduler.stats()
+    assert stats["retried"] == 2 and stats["failed"] == 1, stats
+
+    # Meta got the message but answered too late: sending again would duplicate it
+    delivered.clear()
+    async with httpx.AsyncClient(timeout=SLOW_RESPONSE / 5) as impatient:
+        service = make_service(impatient, port, max_retries=2)
+        try:
+            await service.send_message("667", "slow:a")
+        except httpx.ReadTimeout:
+            pass
+        else:
+            raise AssertionError("a read timeout should be raised, not retried")
+    stats = service.scheduler.stats()
+    assert attempts["slow:a"] == 1 and len(delivered) == 1 and stats["retried"] == 0, (attempts, stats)
+    print("transport errors   ok  connect errors retried twice then raised; read timeout raised, not resent")
+
+
+async def main():
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(fake_graph, host="127.0.0.1", port=port, log_level="error"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        async with httpx.AsyncClient() as client:
+            await check_retries(make_service(client, port))
+            await check_retry_after(client, port)
+            await check_order(make_service(client, port))
+            await check_pacing(make_service(client, port, rate=50, burst=10, recipient_rate=5, recipient_burst=1))
+            await check_transport_errors(client, port)
+    finally:
+        server.should_exit = True
+        await serving
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""Check that a streamed reply is never sent twice when its turn fails midway.
+
+Runs handle_turn with streaming against the fakes in scripts/fake_services.py.
+The fake Claude can end its stream with an error event after a given number
+of text deltas. The database is unreachable, so storing a turn fails too;
+the conversation is preloaded into the in-process cache. Cases:
+
+    mid-stream failure   first paragraph sent, then Claude errors: the turn
+                         must not raise (a retry would resend the paragraph)
+    failure before text  nothing sent: the turn raises so it can be retried
+    segment send fails   the second paragraph is rejected: the third must not
+                         be sent, and the reply is what was delivered plus
+                         the interrupted marker
+    store failure        full reply sent, storing it fails: must not raise
+
+Usage:
+    python scripts/check_stream_failure.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.update({
+    "LOG_LEVEL": "CRITICAL",
+    "ANTHROPIC_API_KEY": "fake-key",
+    "WHATSAPP_ACCESS_TOKEN": "fake-token",
+    "WHATSAPP_PHONE_NUMBER_ID": "123",
+    "POSTGRES_URL": "postgresql://127.0.0.1:1/unreachable",
+    "CUSTOMER_ADVISORY_LOCKS": "false",
+    "MODEL_TIERING": "false",
+    "CLAUDE_STREAMING": "true",
+    "STREAM_SEGMENT_MIN_CHARS": "40",
+})
+
+from fastapi import Request  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fake_services import FakeAnthropic, FakeGraph, serve  # noqa: E402
+
+FIRST = "Gracias por escribirnos, te cuento cómo preparar el pan de molde paso a paso."
+SECOND = "Primero mezclá la premezcla con el agua tibia y la levadura hasta integrar."
+THIRD = "Después dejá levar la masa tapada en un lugar cálido durante unos cuarenta minutos."
+DELTA = 16
+
+
+class FailingAnthropic(FakeAnthropic):
+    """Replies FIRST, SECOND and THIRD as paragraphs; `fail_after` text deltas, then an error event"""
+
+    def __init__(self):
+        super().__init__(ttft=0.01, tokens_per_second=10_000, jitter=0)
+        self.fail_after: Optional[int] = None
+
+    def _reply(self, body: Dict[str, Any]):
+        self.requests["text"] += 1
+        return [{"type": "text", "text": f"{FIRST}\n\n{SECOND}\n\n{THIRD}"}]
+
+    async def _stream(self, message: Dict[str, Any]):
+        deltas = 0
+        async for event in super()._stream(message):
+            if self.fail_after is not None and deltas >= self.fail_after:
+                error = {"type": "error", "error": {"type": "overloaded_error", "message": "fake failure"}}
+                yield f"event: error\ndata: {json.dumps(error)}\n\n"
+                return
+            deltas += event.startswith("event: content_block_delta")
+            yield event
+
+
+class RejectingGraph(FakeGraph):
+    """Rejects (plain 400, not retried) any message whose text is in `rejected`"""
+
+    def __init__(self):
+        super().__init__(latency=0)
+        self.rejected = set()
+
+    async def _messages(self, version: str, phone_number_id: str, request: Request):
+        payload = await request.json()
+        if payload.get("text", {}).get("body") in self.rejected:
+            return JSONResponse({"error": {"message": "fake rejection", "code": 100}}, 400)
+        return await super()._messages(version, phone_number_id, request)
+
+
+async def run_turn(phone: str, text: str) -> Tuple[Optional[Exception], Optional[str]]:
+    from lib.agent.cache import conversation_cache
+    from lib.agent.core import handle_turn, phone_to_customer_id
+    from lib.config import HISTORY_MAX_MESSAGES
+
+    conversation = {"id": "00000000-0000-0000-0000-000000000001", "summary": None, "unsummarized": 0}
+    conversation_cache.set(phone_to_customer_id(phone), conversation, [], max(HISTORY_MAX_MESSAGES - 1, 0))
+    try:
+        return None, await handle_turn(phone, text, f"wamid.{phone}", stream=True)
+    except Exception as e:
+        return e, None
+
+
+async def main():
+    claude, graph = FailingAnthropic(), RejectingGraph()
+    async with serve(claude.app) as claude_url, serve(graph.app) as graph_url:
+        os.environ["ANTHROPIC_BASE_URL"] = claude_url
+        os.environ["WHATSAPP_API_URL"] = f"{graph_url}/v18.0"
+        from lib.agent.core import INTERRUPTED_MARKER
+
+        # Every delta of the first paragraph, then the one that completes it
+        claude.fail_after = -(-(len(FIRST) + 2) // DELTA) + 1
+        error, _ = await run_turn("5491100000001", "como hago pan de molde")
+        sent = [d.text for d in graph.deliveries.get("5491100000001", [])]
+        assert error is None, f"turn raised after part of the reply was sent: {error!r}"
+        assert sent == [FIRST], sent
+        print(f"mid-stream failure   ok  1 segment sent, turn not retried ({claude.requests['text']} Claude call)")
+
+        claude.fail_after = 0
+        error, _ = await run_turn("5491100000002", "hola")
+        assert error is not None, "a turn that sent nothing should raise so it is retried"
+        assert not graph.deliveries.get("5491100000002"), graph.deliveries
+        print(f"failure before text  ok  raised {type(error).__name__}, nothing sent")
+
+        claude.fail_after = None
+        graph.rejected = {SECOND}
+        error, reply = await run_turn("5491100000004", "como hago pan de molde")
+        sent = [d.text for d in graph.deliveries.get("5491100000004", [])]
+        assert error is None, f"turn raised after part of the reply was sent: {error!r}"
+        assert sent == [FIRST], f"segments were sent past a failed one: {sent}"
+        assert reply == f"{FIRST}\n\n{INTERRUPTED_MARKER}", reply
+        print("segment send fails   ok  later segments dropped, reply stored as delivered + marker")
+
+        graph.rejected = set()
+        error, _ = await run_turn("5491100000003", "hola")
+        sent = [d.text for d in graph.deliveries.get("5491100000003", [])]
+        assert error is None, f"turn raised after the whole reply was sent: {error!r}"
+        assert sent == [FIRST, SECOND, THIRD], sent
+        print("store failure        ok  reply sent once, storage error only logged")
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
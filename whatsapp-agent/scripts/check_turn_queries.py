@@ -0,0 +1,84 @@
+"""Count database round trips per agent turn against a real Postgres.
+
+Runs the ConversationMemory turn API (start_turn + finish_turn) for a throwaway
+customer and fails if a turn needs more than the expected number of queries.
+
+Usage:
+    POSTGRES_URL=postgres://... python scripts/check_turn_queries.py [--turns 3]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from uuid import uuid4
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.db import connection
+from lib.db.queries import conversations
+from lib.agent.memory import ConversationMemory
+
+EXPECTED_QUERIES_PER_TURN = 2
+
+
+class QueryCounter:
+    """Wraps the DB helpers used by ConversationQueries and counts calls."""
+
+    def __init__(self):
+        self.count = 0
+        self._originals = {}
+
+    def install(self):
+        for name in ("fetch", "fetchrow", "fetchval"):
+            original = getattr(conversations, name)
+            self._originals[name] = original
+            setattr(conversations, name, self._wrap(original))
+
+    def uninstall(self):
+        for name, original in self._originals.items():
+            setattr(conversations, name, original)
+
+    def _wrap(self, fn):
+        async def wrapper(*args, **kwargs):
+            self.count += 1
+            return await fn(*args, **kwargs)
+        return wrapper
+
+
+async def main(turns: int) -> int:
+    customer_id = uuid4()
+    counter = QueryCounter()
+    counter.install()
+    failed = False
+
+    try:
+        for turn in range(1, turns + 1):
+            counter.count = 0
+            started = time.perf_counter()
+
+            memory = ConversationMemory(customer_id)
+            history = await memory.start_turn(f"mensaje {turn}", limit=10)
+            await memory.finish_turn(f"respuesta {turn}")
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            status = "OK" if counter.count <= EXPECTED_QUERIES_PER_TURN else "FAIL"
+            failed = failed or status == "FAIL"
+            print(f"turn {turn}: {counter.count} queries, {len(history)} history messages, {elapsed_ms:.1f} ms [{status}]")
+    finally:
+        counter.uninstall()
+        await connection.execute_write(
+            "DELETE FROM conversations WHERE customer_id = $1 RETURNING id",
+            (str(customer_id),)
+        )
+        await connection.close_pool()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.turns)))
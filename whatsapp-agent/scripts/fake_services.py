@@ -0,0 +1,242 @@
+"""Local stand-ins for the Anthropic Messages API and the WhatsApp Graph API.
+
+Used by scripts/bench_e2e.py; both are plain FastAPI apps served with
+uvicorn on 127.0.0.1 (see `serve`), so the agent talks to them through its
+real clients by pointing ANTHROPIC_BASE_URL / WHATSAPP_API_URL at them.
+
+FakeAnthropic answers /v1/messages (JSON or SSE streaming) and
+/v1/messages/count_tokens with a configurable time-to-first-token and token
+rate. Tool use is scripted: when the latest user text contains a rule's
+`match`, the reply is a tool_use block with the rule's tool and input; the
+tool_result is then answered with text. A "[ref:<id>]" tag in the user text
+is echoed at the end of the final reply, so a load generator can tell which
+delivered WhatsApp message completes which request.
+
+FakeGraph accepts POST /<version>/<phone_number_id>/messages, records each
+delivered text per recipient and lets callers wait for deliveries.
+"""
+
+import asyncio
+import json
+import math
+import random
+import re
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+REF = re.compile(r"\[ref:([\w-]+)\]")
+
+DEFAULT_TOOL_SCRIPTS = [
+    {"match": "chocolate", "tool": "search_recipes", "input": {"query": "chocolate"}},
+    {"match": "que recetas", "tool": "list_recipes", "input": {}},
+    {"match": "pan de molde", "tool": "get_recipe", "input": {"query": "pan de molde"}},
+]
+
+SENTENCES = [
+    "¡Hola! 😊 Gracias por escribirnos.",
+    "Todos nuestros productos son sin gluten y aptos para celíacos.",
+    "Con nuestras premezclas podés preparar panes, budines y pizzas en casa.",
+    "Te recomiendo respetar los tiempos de levado para que la miga quede esponjosa.",
+    "Si querés, te paso la receta completa con el paso a paso.",
+    "El horneado ideal es a 200 °C durante unos 35 minutos.",
+    "¿Te ayudo con alguna otra receta?",
+]
+
+CHARS_PER_TOKEN = 3.5
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@asynccontextmanager
+async def serve(app: FastAPI, port: Optional[int] = None) -> AsyncIterator[str]:
+    """Run `app` with uvicorn in the current event loop; yields its base URL"""
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def _tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def _user_texts(messages: List[Dict[str, Any]]):
+    """Text of the user messages, newest first (tool_result turns yield nothing)"""
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            yield content
+        elif isinstance(content, list):
+            text = "".join(b.get("text", "") for b in content if isinstance(b, dict) and b.get("type") == "text")
+            if text:
+                yield text
+
+
+class FakeAnthropic:
+    """Scripted Messages API with a latency model: ttft seconds, then `tokens_per_second`"""
+
+    def __init__(self, ttft: float = 0.5, tokens_per_second: float = 80.0, jitter: float = 0.25,
+                 tool_scripts: Optional[List[Dict[str, Any]]] = None, seed: Optional[int] = None):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.jitter = jitter
+        self.tool_scripts = DEFAULT_TOOL_SCRIPTS if tool_scripts is None else tool_scripts
+        self.rng = random.Random(seed)
+        self.requests = {"text": 0, "tool_use": 0, "count_tokens": 0}
+        self.models: Dict[str, int] = {}
+        self.app = FastAPI()
+        self.app.post("/v1/messages")(self._messages)
+        self.app.post("/v1/messages/count_tokens")(self._count_tokens)
+
+    def _delay(self, seconds: float) -> float:
+        return max(0.0, seconds * self.rng.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def _reply(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Content blocks for the response to `body`"""
+        messages = body.get("messages", [])
+        last = messages[-1].get("content") if messages else ""
+        answering_tool = isinstance(last, list) and any(
+            isinstance(b, dict) and b.get("type") == "tool_result" for b in last)
+        texts = list(_user_texts(messages))
+        if not answering_tool and texts and body.get("tools"):
+            lowered = texts[0].lower()
+            for rule in self.tool_scripts:
+                if rule["match"] in lowered:
+                    self.requests["tool_use"] += 1
+                    return [{"type": "tool_use", "id": f"toolu_{self.rng.getrandbits(48):012x}",
+                             "name": rule["tool"], "input": rule.get("input", {})}]
+        self.requests["text"] += 1
+        text = " ".join(self.rng.sample(SENTENCES, self.rng.randint(2, 4)))
+        ref = next((m.group(1) for m in map(REF.search, texts) if m), None)
+        if ref:
+            text += f" [ref:{ref}]"
+        return [{"type": "text", "text": text}]
+
+    @staticmethod
+    def _message(body: Dict[str, Any], content: List[Dict[str, Any]]) -> Dict[str, Any]:
+        input_text = json.dumps(body.get("messages", []), ensure_ascii=False) + json.dumps(body.get("system", ""))
+        output = "".join(b.get("text", "") or json.dumps(b.get("input", {})) for b in content)
+        return {
+            "id": f"msg_{time.monotonic_ns():x}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", "fake"),
+            "content": content,
+            "stop_reason": "tool_use" if content[-1]["type"] == "tool_use" else "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": _tokens(input_text), "output_tokens": _tokens(output),
+                      "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+        }
+
+    async def _messages(self, request: Request):
+        body = await request.json()
+        self.models[body.get("model", "")] = self.models.get(body.get("model", ""), 0) + 1
+        message = self._message(body, self._reply(body))
+        if body.get("stream"):
+            return StreamingResponse(self._stream(message), media_type="text/event-stream")
+        await asyncio.sleep(self._delay(self.ttft + message["usage"]["output_tokens"] / self.tokens_per_second))
+        return message
+
+    async def _stream(self, message: Dict[str, Any]):
+        def event(kind: str, data: Dict[str, Any]) -> str:
+            return f"event: {kind}\ndata: {json.dumps({'type': kind, **data}, ensure_ascii=False)}\n\n"
+
+        usage = message["usage"]
+        await asyncio.sleep(self._delay(self.ttft))
+        yield event("message_start", {"message": {
+            **message, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 1}}})
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                yield event("content_block_start", {"index": index, "content_block": {"type": "text", "text": ""}})
+                text, step = block["text"], 16
+                for i in range(0, len(text), step):
+                    await asyncio.sleep(self._delay(_tokens(text[i:i + step]) / self.tokens_per_second))
+                    yield event("content_block_delta", {
+                        "index": index, "delta": {"type": "text_delta", "text": text[i:i + step]}})
+            else:
+                yield event("content_block_start", {"index": index, "content_block": {**block, "input": {}}})
+                partial = json.dumps(block["input"])
+                await asyncio.sleep(self._delay(_tokens(partial) / self.tokens_per_second))
+                yield event("content_block_delta", {
+                    "index": index, "delta": {"type": "input_json_delta", "partial_json": partial}})
+            yield event("content_block_stop", {"index": index})
+        yield event("message_delta", {"delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                                      "usage": {"output_tokens": usage["output_tokens"]}})
+        yield event("message_stop", {})
+
+    async def _count_tokens(self, request: Request):
+        body = await request.json()
+        self.requests["count_tokens"] += 1
+        return {"input_tokens": _tokens(json.dumps(body.get("messages", []), ensure_ascii=False))}
+
+
+class Delivery(NamedTuple):
+    at: float
+    text: str
+
+
+class FakeGraph:
+    """Graph API messages endpoint that records deliveries; `latency` seconds per call"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.deliveries: Dict[str, List[Delivery]] = {}
+        self.read_receipts = 0
+        self._changed = asyncio.Event()
+        self.app = FastAPI()
+        self.app.post("/{version}/{phone_number_id}/messages")(self._messages)
+
+    async def _messages(self, version: str, phone_number_id: str, request: Request):
+        payload = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if payload.get("status") == "read":
+            self.read_receipts += 1
+            return {"success": True}
+        text = payload.get("text", {}).get("body", "")
+        self.deliveries.setdefault(payload.get("to", ""), []).append(Delivery(time.perf_counter(), text))
+        self._changed.set()
+        self._changed = asyncio.Event()
+        return {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{time.monotonic_ns():x}"}]}
+
+    async def wait_for(self, recipient: str, start: int, done, timeout: float) -> List[Delivery]:
+        """
+        Wait until a delivery to `recipient` past index `start` satisfies
+        `done(delivery)`; returns the deliveries since `start` (possibly
+        incomplete if `timeout` expires first).
+        """
+        deadline = time.perf_counter() + timeout
+        while True:
+            received = self.deliveries.get(recipient, [])[start:]
+            if any(done(d) for d in received):
+                return received
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return received
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def count(self, recipient: str) -> int:
+        return len(self.deliveries.get(recipient, []))
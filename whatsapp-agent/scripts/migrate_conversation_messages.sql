@@ -0,0 +1,54 @@
+-- Migration: move JSONB conversation history into the append-only conversation_messages table
+-- Safe to re-run: conversations that already have rows in conversation_messages are skipped.
+
+BEGIN;
+
+-- 1. Create the messages table and its index
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    id BIGSERIAL PRIMARY KEY,
+    conversation_id UUID NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT NOT NULL CHECK (role IN ('user', 'assistant')),
+    content TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_messages_conversation
+    ON conversation_messages(conversation_id, created_at);
+
+-- 2. Copy existing history, preserving order. The JSONB array has no per-message
+--    timestamps, so messages are spaced 1ms apart ending at conversations.updated_at.
+--    Legacy rows stored as a double-encoded JSON string are unwrapped first.
+WITH decoded AS (
+    SELECT
+        c.id AS conversation_id,
+        c.updated_at,
+        CASE jsonb_typeof(c.messages)
+            WHEN 'string' THEN (c.messages #>> '{}')::jsonb
+            ELSE c.messages
+        END AS messages
+    FROM conversations c
+    WHERE c.messages IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM conversation_messages m WHERE m.conversation_id = c.id
+      )
+),
+history AS MATERIALIZED (
+    SELECT * FROM decoded WHERE jsonb_typeof(messages) = 'array'
+)
+INSERT INTO conversation_messages (conversation_id, role, content, created_at)
+SELECT
+    h.conversation_id,
+    e.msg->>'role',
+    e.msg->>'content',
+    COALESCE(h.updated_at, NOW())
+        - (jsonb_array_length(h.messages) - e.ord) * INTERVAL '1 millisecond'
+FROM history h
+CROSS JOIN LATERAL jsonb_array_elements(h.messages) WITH ORDINALITY AS e(msg, ord)
+WHERE e.msg->>'role' IN ('user', 'assistant')
+  AND e.msg->>'content' IS NOT NULL
+ORDER BY h.conversation_id, e.ord;
+
+COMMIT;
+
+-- 3. Once the application is running on conversation_messages, drop the legacy column:
+-- ALTER TABLE conversations DROP COLUMN IF EXISTS messages;
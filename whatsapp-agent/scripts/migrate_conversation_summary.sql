@@ -0,0 +1,4 @@
+-- Migration: track which messages are already folded into conversations.summary
+-- Safe to re-run.
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS summarized_through BIGINT;
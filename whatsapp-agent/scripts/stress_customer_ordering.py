@@ -0,0 +1,192 @@
+"""Concurrency stress check for per-customer ordering.
+
+Several worker processes (standing in for uvicorn workers / serverless
+instances) each fire concurrent turns for the same set of throwaway customers.
+Every turn runs under `customer_locks`, counts the customer's stored messages,
+waits a little (to widen any race) and stores a user/assistant pair whose reply
+records the count it saw. Afterwards the script checks, per customer, that no
+message was lost, that every turn saw all earlier turns (seen = 0, 2, 4, ...)
+and that each worker's messages were stored in the order it sent them.
+
+Without POSTGRES_URL it runs a single-process check of the in-process keyed
+lock against an in-memory read-modify-write store, with and without locking.
+
+Usage:
+    POSTGRES_URL=postgres://... python scripts/stress_customer_ordering.py \
+        [--processes 4] [--customers 20] [--messages 10]
+    python scripts/stress_customer_ordering.py --local
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from uuid import uuid4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COUNT_MESSAGES = """
+    SELECT count(*) AS n
+    FROM conversation_messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE c.customer_id = $1
+"""
+
+LOAD_MESSAGES = """
+    SELECT m.role, m.content
+    FROM conversation_messages m
+    JOIN conversations c ON c.id = m.conversation_id
+    WHERE c.customer_id = $1
+    ORDER BY m.created_at, m.id
+"""
+
+
+def customer_phone(run_id: str, n: int) -> str:
+    return f"stress-{run_id}-{n}"
+
+
+async def worker(run_id: str, proc: int, customers: int, messages: int) -> None:
+    """One process: all customers in parallel, each customer's messages fired at once"""
+    from lib.agent.core import phone_to_customer_id
+    from lib.agent.locks import customer_locks
+    from lib.agent.memory import ConversationMemory
+    from lib.db import connection
+
+    async def turn(customer: int, i: int) -> None:
+        customer_id = phone_to_customer_id(customer_phone(run_id, customer))
+        async with customer_locks.hold(customer_id):
+            row = await connection.execute_query(COUNT_MESSAGES, (customer_id,), fetch_one=True)
+            await asyncio.sleep(random.uniform(0, 0.02))
+            memory = ConversationMemory(customer_id)
+            await memory.start_turn(f"p{proc}-m{i}", limit=2)
+            await memory.finish_turn(json.dumps({"seen": row["n"], "proc": proc, "i": i}))
+
+    # Tasks for one customer are created in message order, so the FIFO lock
+    # must store them in that order
+    await asyncio.gather(*(turn(c, i) for c in range(customers) for i in range(messages)))
+    print(json.dumps(customer_locks.stats()))
+    await connection.close_pool()
+
+
+async def verify(run_id: str, processes: int, customers: int, messages: int) -> int:
+    from lib.agent.core import phone_to_customer_id
+    from lib.db import connection
+
+    failures = 0
+    expected_turns = processes * messages
+    try:
+        for customer in range(customers):
+            customer_id = phone_to_customer_id(customer_phone(run_id, customer))
+            rows = await connection.execute_query(LOAD_MESSAGES, (customer_id,))
+            replies = [json.loads(r["content"]) for r in rows if r["role"] == "assistant"]
+            problems = []
+            if len(rows) != 2 * expected_turns:
+                problems.append(f"{len(rows)} messages stored, expected {2 * expected_turns}")
+            if [r["role"] for r in rows] != ["user", "assistant"] * (len(rows) // 2):
+                problems.append("user/assistant pairs interleaved")
+            seen = [r["seen"] for r in replies]
+            if seen != list(range(0, 2 * len(replies), 2)):
+                problems.append(f"turns did not see all earlier turns: seen={seen[:12]}...")
+            for proc in range(processes):
+                order = [r["i"] for r in replies if r["proc"] == proc]
+                if order != sorted(order):
+                    problems.append(f"worker {proc} messages out of order: {order}")
+            if problems:
+                failures += 1
+                print(f"customer {customer}: " + "; ".join(problems))
+    finally:
+        for customer in range(customers):
+            customer_id = phone_to_customer_id(customer_phone(run_id, customer))
+            await connection.execute_write(
+                "DELETE FROM conversations WHERE customer_id = $1 RETURNING id", (str(customer_id),)
+            )
+        await connection.close_pool()
+    return failures
+
+
+def run_postgres(args) -> int:
+    run_id = uuid4().hex[:8]
+    # Each process caches conversations locally; turn the cache off so turns
+    # read what the other workers wrote
+    env = {**os.environ, "CONVERSATION_CACHE_TTL": "0", "CUSTOMER_ADVISORY_LOCKS": "true"}
+    started = time.perf_counter()
+    procs = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--worker", run_id, "--proc", str(p),
+             "--customers", str(args.customers), "--messages", str(args.messages)],
+            cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True,
+        )
+        for p in range(args.processes)
+    ]
+    for p, proc in enumerate(procs):
+        out, _ = proc.communicate()
+        stats = [line for line in out.splitlines() if line.startswith("{")]
+        print(f"worker {p}: exit={proc.returncode} locks={stats[-1] if stats else 'n/a'}")
+        if proc.returncode:
+            return 1
+    elapsed = time.perf_counter() - started
+    turns = args.processes * args.customers * args.messages
+    print(f"{turns} turns in {elapsed:.1f}s across {args.processes} processes")
+
+    failures = asyncio.run(verify(run_id, args.processes, args.customers, args.messages))
+    print("OK: no lost or reordered messages" if not failures else f"FAIL: {failures} customer(s) with problems")
+    return 1 if failures else 0
+
+
+async def run_local(customers: int, messages: int) -> int:
+    """In-process only: lost updates on a read-modify-write store, with and without the keyed lock"""
+    from lib.agent.locks import CustomerLocks
+
+    async def stress(locked: bool) -> int:
+        locks = CustomerLocks(advisory=False, timeout=1)
+        store = {c: [] for c in range(customers)}
+
+        async def turn(customer: int, i: int) -> None:
+            async def body():
+                history = list(store[customer])
+                await asyncio.sleep(random.uniform(0, 0.002))
+                store[customer] = history + [i]
+
+            if locked:
+                async with locks.hold(uuid_for[customer]):
+                    await body()
+            else:
+                await body()
+
+        await asyncio.gather(*(turn(c, i) for c in range(customers) for i in range(messages)))
+        bad = sum(1 for c in range(customers) if store[c] != list(range(messages)))
+        assert locks.stats()["active_customers"] == 0, "keyed locks leaked"
+        return bad
+
+    uuid_for = {c: uuid4() for c in range(customers)}
+    unlocked, locked = await stress(False), await stress(True)
+    print(f"without lock: {unlocked}/{customers} customers lost or reordered messages")
+    print(f"with lock:    {locked}/{customers} customers lost or reordered messages")
+    return 1 if locked else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--customers", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=10, help="messages per customer per process")
+    parser.add_argument("--local", action="store_true", help="in-process check only (no database)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--proc", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(worker(args.worker, args.proc, args.customers, args.messages))
+        return 0
+    if args.local or not os.environ.get("POSTGRES_URL"):
+        return asyncio.run(run_local(args.customers, args.messages))
+    return run_postgres(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())